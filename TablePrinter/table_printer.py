@@ -1,25 +1,91 @@
-import logging
+import heapq
+import io
 import os
 import sys
-import unicodedata
-from collections import defaultdict
-from dataclasses import dataclass, field
+import weakref
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict, deque
+from dataclasses import dataclass, field, fields, make_dataclass
 from datetime import datetime
 from enum import Enum
-from typing import Any, Dict, Generic, List, Optional, Type, TypeVar
-
-from ColorHelper.color_xterm_256 import ColorXTerm256
-from TablePrinter.table_printer_consts import BoxDrawingChar
-
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-
-if not logger.handlers:
-    _handler = logging.StreamHandler()
-    _handler.setFormatter(logging.Formatter(
-        '%(asctime)s [%(levelname)s] %(name)s.%(funcName)s: %(message)s'
-    ))
-    logger.addHandler(_handler)
+from functools import partial
+from itertools import chain, count, islice
+from operator import attrgetter
+from time import perf_counter
+from typing import (
+    TYPE_CHECKING, Any, AsyncIterator, Callable, ClassVar, Dict, Generic, Iterable, Iterator, List, NamedTuple,
+    Optional, Pattern, Sequence, Tuple, Type, TypeVar, Union,
+)
+
+from TablePrinter.table_printer_stats import NULL_PHASE, TableStats, TStatsCallback
+from TablePrinter.table_printer_width import get_display_ansi_width, get_width_cache_info, truncate_display_width
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+
+    from ColorHelper.color_xterm_256 import ColorXTerm256
+    from TablePrinter.table_printer_diff import TableDiff
+
+# 以下对象在第一次使用时才创建，import 本模块时不加载 logging / 颜色枚举，见 __getattr__
+_logger = None
+_color_enum = None
+_cond_fmt_default = None
+
+
+def _get_logger():
+    """ return the module logger, set up with the default handler on first use """
+    global _logger
+    if _logger is None:
+        import logging
+        logger = logging.getLogger(__name__)
+        if logger.level == logging.NOTSET:
+            logger.setLevel(logging.INFO)
+        if not logger.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter(
+                '%(asctime)s [%(levelname)s] %(name)s.%(funcName)s: %(message)s'
+            ))
+            logger.addHandler(handler)
+        _logger = logger
+    return _logger
+
+
+def _log_debug(msg: str, *args: Any) -> None:
+    # logging 尚未被任何人加载时，不可能有人配置了 DEBUG 级别，直接跳过
+    if _logger is None and 'logging' not in sys.modules:
+        return
+    logger = _get_logger()
+    if logger.isEnabledFor(10):  # logging.DEBUG
+        logger.debug(msg, *args, stacklevel=2)
+
+
+def _get_color_enum() -> Type[Enum]:
+    """ return ColorXTerm256, imported on first use """
+    global _color_enum
+    if _color_enum is None:
+        from ColorHelper.color_xterm_256 import ColorXTerm256
+        _color_enum = ColorXTerm256
+    return _color_enum
+
+
+def _get_cond_fmt_default() -> 'ConditionalFormat':
+    global _cond_fmt_default
+    if _cond_fmt_default is None:
+        _cond_fmt_default = ConditionalFormat()
+    return _cond_fmt_default
+
+
+def __getattr__(name: str) -> Any:
+    if name == 'logger':
+        return _get_logger()
+    if name == 'ColorXTerm256':
+        return _get_color_enum()
+    if name == 'COND_FMT_DEFAULT':
+        return _get_cond_fmt_default()
+    if name == 'BoxDrawingChar':
+        from TablePrinter.table_printer_consts import BoxDrawingChar
+        return BoxDrawingChar
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 class ColumnAlignment(str, Enum):
@@ -31,16 +97,27 @@ class ColumnAlignment(str, Enum):
         return self.value
 
 
+class ColumnTruncation(str, Enum):
+    """ part of a cell removed when the cell is wider than the column max_width """
+    START = 'start'
+    MIDDLE = 'middle'
+    END = 'end'
+
+    def __str__(self):
+        return self.value
+
+
 @dataclass
 class FontFormat:
-    BgColor: ColorXTerm256 = ColorXTerm256.WHITE
-    FgColor: ColorXTerm256 = ColorXTerm256.BLACK
+    BgColor: 'ColorXTerm256' = field(default_factory=lambda: _get_color_enum().WHITE)
+    FgColor: 'ColorXTerm256' = field(default_factory=lambda: _get_color_enum().BLACK)
 
     def apply_format(self, text: str) -> str:
+        color_enum = _get_color_enum()
         codes = []
-        if isinstance(self.BgColor, ColorXTerm256):
+        if isinstance(self.BgColor, color_enum):
             codes.append(f'48;5;{self.BgColor}')
-        if isinstance(self.FgColor, ColorXTerm256):
+        if isinstance(self.FgColor, color_enum):
             codes.append(f'38;5;{self.FgColor}')
         if codes:
             return f'\033[{";".join(codes)}m{text}\033[0m'
@@ -50,7 +127,7 @@ class FontFormat:
 @dataclass
 class ConditionalFormat:
     format: FontFormat = field(
-        default_factory=lambda: FontFormat(BgColor=ColorXTerm256.RED, FgColor=ColorXTerm256.WHITE)
+        default_factory=lambda: FontFormat(BgColor=_get_color_enum().RED, FgColor=_get_color_enum().WHITE)
     )
 
     def apply_format(self, text: Any) -> str:
@@ -60,12 +137,24 @@ class ConditionalFormat:
         raise NotImplementedError
 
 
-COND_FMT_DEFAULT = ConditionalFormat()
+def _is_multi_target(target: Any) -> bool:
+    return isinstance(target, (list, tuple, set, frozenset))
 
 
 @dataclass
 class CondFmtContain(ConditionalFormat):
+    """ match when the text contains contain_target. contain_target can also be a list of targets, they are compiled
+    into a single regex alternation so the text is scanned once for all of them.
+    """
     contain_target: Any = None
+    _pattern: Optional[Pattern] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        if _is_multi_target(self.contain_target) and self.contain_target:
+            # 长的目标放前面，避免被自己的前缀抢先匹配
+            import re
+            targets = sorted(map(str, self.contain_target), key=len, reverse=True)
+            self._pattern = re.compile('|'.join(map(re.escape, targets)))
 
     def apply_format(self, text: Any) -> str:
         return self.format.apply_format(str(text))
@@ -73,12 +162,22 @@ class CondFmtContain(ConditionalFormat):
     def is_condition_match(self, text: str) -> bool:
         if self.contain_target is None:
             raise ValueError('contain_target is not defined')
+        if self._pattern is not None:
+            return self._pattern.search(text) is not None
+        if _is_multi_target(self.contain_target):
+            return False
         return self.contain_target in text
 
 
 @dataclass
 class CondFmtExactMatch(ConditionalFormat):
+    """ match when the text equals match_target. match_target can also be a list of targets, they are kept in a set. """
     match_target: Any = None
+    _targets: Optional[frozenset] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        if _is_multi_target(self.match_target):
+            self._targets = frozenset(map(str, self.match_target))
 
     def apply_format(self, text: Any) -> str:
         return self.format.apply_format(text)
@@ -91,9 +190,91 @@ class CondFmtExactMatch(ConditionalFormat):
         """
         if self.match_target is None:
             raise ValueError('match_target is not defined')
+        if self._targets is not None:
+            return text in self._targets
         return text == str(self.match_target)
 
 
+@dataclass
+class CondFmtRegex(ConditionalFormat):
+    """ match when the regex pattern is found in the text """
+    pattern: Optional[str] = None
+    _pattern: Optional[Pattern] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        if self.pattern is not None:
+            import re
+            self._pattern = re.compile(self.pattern)
+
+    def apply_format(self, text: Any) -> str:
+        return self.format.apply_format(text)
+
+    def is_condition_match(self, text: str) -> bool:
+        if self._pattern is None:
+            raise ValueError('pattern is not defined')
+        return self._pattern.search(text) is not None
+
+
+@dataclass
+class CondFmtRange(ConditionalFormat):
+    """ match when the text is a number within [min_value, max_value], None means no bound on that side """
+    min_value: Optional[float] = None
+    max_value: Optional[float] = None
+
+    def apply_format(self, text: Any) -> str:
+        return self.format.apply_format(text)
+
+    def is_condition_match(self, text: str) -> bool:
+        if self.min_value is None and self.max_value is None:
+            raise ValueError('min_value or max_value must be defined')
+        try:
+            value = float(text)
+        except ValueError:
+            return False
+        if self.min_value is not None and value < self.min_value:
+            return False
+        return self.max_value is None or value <= self.max_value
+
+
+COND_FMT_CACHE_SIZE = 65536
+
+
+class CondFmtMatcher(dict):
+    """ evaluate the conditional formats of a column at most once per distinct cell text.
+    The first matching conditional format wins. Columns usually hold few distinct values (status codes, host names),
+    so the cache turns the per cell evaluation into a dict lookup: matcher[text] returns apply_format of the matching
+    conditional format, False when none matches. The cache is cleared when it grows over cache_size.
+    """
+
+    def __init__(self, cond_fmts: Sequence[ConditionalFormat], cache_size: int = COND_FMT_CACHE_SIZE):
+        super().__init__()
+        self.cond_fmts: List[ConditionalFormat] = list(cond_fmts)
+        self.cache_size = cache_size
+        self.match_cnt: int = 0  # number of evaluations, i.e. cache misses
+        self.match_sec: float = 0.0  # time spent in evaluations, read by TableStats
+
+    def __missing__(self, text: str) -> Union[Callable[[str], str], bool]:
+        start = perf_counter()
+        self.match_cnt += 1
+        ret = False
+        for cond_fmt in self.cond_fmts:
+            if cond_fmt.is_condition_match(text):
+                ret = cond_fmt.apply_format
+                break
+        if len(self) >= self.cache_size:
+            self.clear()
+        self[text] = ret
+        self.match_sec += perf_counter() - start
+        return ret
+
+
+def get_col_cond_fmts(config: 'ColumnConfig') -> List[ConditionalFormat]:
+    """ return the conditional formats of a column config, in the order they are evaluated """
+    cond_fmt = config.conditional_format
+    cond_fmts = list(cond_fmt) if isinstance(cond_fmt, (list, tuple)) else [cond_fmt]
+    return [cond_fmt for cond_fmt in cond_fmts if cond_fmt is not None and cond_fmt != _get_cond_fmt_default()]
+
+
 @dataclass
 class ColumnConfig:
     """ define the property of a column.
@@ -102,17 +283,44 @@ class ColumnConfig:
         alias: column alias is displayed in the table title when printing out the table.
         format: if a column holds datetime data, output table print the value regarding to the format.
         hide: if a column is hidden, it will not show when printing out the table.
+        conditional_format: a conditional format or a list of them, a cell is formatted by the first one matching.
+        max_width: cells wider than max_width display columns are cut, see truncate and ellipsis.
+        truncate: part of the cell removed by max_width or by the auto-fit of print_table.
+        ellipsis: placeholder of the removed part.
     """
     alias: Optional[str] = None
 
     align: Optional[ColumnAlignment] = ColumnAlignment.CENTER
 
-    conditional_format: ConditionalFormat = field(default_factory=lambda: COND_FMT_DEFAULT)
+    conditional_format: Union[ConditionalFormat, Sequence[ConditionalFormat], None] = None
 
     format: Optional[str] = None
 
     hide: Optional[bool] = None
 
+    max_width: Optional[int] = None
+
+    truncate: ColumnTruncation = ColumnTruncation.END
+
+    ellipsis: str = '\u2026'
+
+    def __post_init__(self):
+        if self.max_width is not None and self.max_width <= 0:
+            raise ValueError(f'invalid max_width: {self.max_width}')
+
+
+class RowRenderCache(NamedTuple):
+    """ rendered cells of a row, in the order of BaseRow.get_col_attr_names()
+
+    Attributes:
+        disp: formatted text of each cell, as returned by BaseRow.get_col_value_disp
+        true: text printed to the terminal, disp wrapped with href when available
+        width: display width of each disp text
+    """
+    disp: Tuple[str, ...]
+    true: Tuple[str, ...]
+    width: Tuple[int, ...]
+
 
 @dataclass
 class BaseRow:
@@ -121,16 +329,36 @@ class BaseRow:
     2. Define a column: Each public field is a column.
         Ex: Col1: int = 1
     3. Provide column config: type: ColumnConfig
-        Ex: __Col1_config: Final[ColumnConfig] = ColumnConfig(alias="Column1")
+        Ex: __Col1_config: ClassVar[ColumnConfig] = ColumnConfig(alias="Column1")
+    4. Compact rows (python 3.10+): decorate the row class with @dataclass(slots=True). Rows are then stored without
+        a per-instance __dict__, which takes less than half the memory of the default rows. Attributes other than
+        the fields cannot be set on compact rows, so they cannot be stored in a SqliteTable.
     """
-    _CONFIG_PREFIX: str = ''
-    _CONFIG_SUFFIX: str = '_config'
-
-    # 不能用 dataclass 的 field，因为 dataclass 会加 _BaseRow_ 前缀，导致用的时候找不到 class 变量
-    _COL_ATTR_NAMES: Optional[List[str]] = None
-    _COL_HEADER_DISP_LEN_MAP: Optional[Dict[str, int]] = None
-    _COL_HEADER_LEN_MAP: Optional[Dict[str, int]] = None
-    _COL_HEADER_MAP: Optional[Dict[str, str]] = None
+    # 每行的渲染缓存放在 slot 中，不是 dataclass field，不出现在 fields / asdict 中
+    # 子类用 @dataclass(slots=True) 时实例就没有 __dict__
+    __slots__ = ('_render_cache',)
+
+    # 类级别的缓存用 ClassVar，不成为 dataclass field，也就不会在每个实例上保存一份
+    _CONFIG_PREFIX: ClassVar[str] = ''
+    _CONFIG_SUFFIX: ClassVar[str] = '_config'
+
+    _COL_ATTR_NAMES: ClassVar[Optional[List[str]]] = None
+    _COL_HEADER_DISP_LEN_MAP: ClassVar[Optional[Dict[str, int]]] = None
+    _COL_HEADER_LEN_MAP: ClassVar[Optional[Dict[str, int]]] = None
+    _COL_HEADER_MAP: ClassVar[Optional[Dict[str, str]]] = None
+    _COL_HREF_ATTR_MAP: ClassVar[Optional[Dict[str, Tuple[str, str]]]] = None
+    _COL_HREF_BASE_MAP: ClassVar[Optional[Dict[str, str]]] = None
+
+    # 编译好的行渲染函数，key: (列分隔符, 是否显示颜色, 列, 是否输出超链接)
+    _LINE_RENDERER_MAP = None
+    # 定义了 max_width 的列: [(列序号, max_width, truncate, ellipsis)]
+    _COL_TRUNCATE_SPECS = None
+
+    def __getattr__(self, name: str) -> Any:
+        # 只在正常查找失败时调用: 还没排版过的行 _render_cache 的 slot 没有值
+        if name == '_render_cache':
+            return None
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
 
     def __init_subclass__(cls, **kwargs):
         super().__init_subclass__(**kwargs)
@@ -140,6 +368,10 @@ class BaseRow:
         cls._COL_HEADER_DISP_LEN_MAP = None
         cls._COL_HEADER_LEN_MAP = None
         cls._COL_HEADER_MAP = None
+        cls._COL_HREF_ATTR_MAP = None
+        cls._COL_HREF_BASE_MAP = None
+        cls._LINE_RENDERER_MAP = None
+        cls._COL_TRUNCATE_SPECS = None
 
     @classmethod
     def __GET_CONFIG_PREFIX(cls):
@@ -157,16 +389,12 @@ class BaseRow:
             attr for attr in cls.__annotations__
             if not attr.startswith('__') and cls._is_col_data_attr(attr) and not cls._is_col_hidden(attr)
         ]
-        # filter out href and url attributes if current environment can display href with name column
-        if can_display_href():
-            href_attr_to_remove = [
-                attr for attr in cls._COL_ATTR_NAMES
-                if (
-                    (cls._is_col_href_attr(attr) or cls._is_col_url_attr(attr))
-                    and cls._is_col_href_attr_with_base_col(attr)
-                )
-            ]
-            cls._COL_ATTR_NAMES = [attr for attr in cls._COL_ATTR_NAMES if attr not in href_attr_to_remove]
+        # href and url attributes with a base column are hidden only when the output can display hyperlinks
+        cls._COL_HREF_BASE_MAP = {
+            attr: attr[:-len('_href')] if cls._is_col_href_attr(attr) else attr[:-len('_url')]
+            for attr in cls._COL_ATTR_NAMES
+            if (cls._is_col_href_attr(attr) or cls._is_col_url_attr(attr)) and cls._is_col_href_attr_with_base_col(attr)
+        }
         cls._COL_HEADER_DISP_LEN_MAP = dict()
         cls._COL_HEADER_LEN_MAP = dict()
         cls._COL_HEADER_MAP = dict()
@@ -176,6 +404,11 @@ class BaseRow:
             cls._COL_HEADER_DISP_LEN_MAP[attr_name] = get_display_ansi_width(col_header)
             cls._COL_HEADER_LEN_MAP[attr_name] = len(col_header)
             cls._COL_HEADER_MAP[attr_name] = col_header
+        cls._COL_TRUNCATE_SPECS = [
+            (idx, col_config.max_width, col_config.truncate, col_config.ellipsis)
+            for idx, col_config in enumerate(map(cls.get_config, cls._COL_ATTR_NAMES))
+            if col_config.max_width is not None
+        ]
 
     @classmethod
     def _get_config_attr_name(cls, col_name: str) -> str:
@@ -285,13 +518,64 @@ class BaseRow:
             )
         return is_col_href_attr_exist or is_col_url_attr_exist
 
+    @classmethod
+    def _get_col_href_attr_map(cls) -> Dict[str, Tuple[str, str]]:
+        """ return the map between column attribute name and its (href attribute name, url attribute name), only
+        columns that have an href or url attribute are included
+        """
+        if cls._COL_HREF_ATTR_MAP is None:
+            cls._COL_HREF_ATTR_MAP = {
+                attr_name: (cls._get_href_attr_name(attr_name), cls._get_url_attr_name(attr_name))
+                for attr_name in cls.get_col_attr_names() if cls._is_col_href_attr_exist(attr_name)
+            }
+        return cls._COL_HREF_ATTR_MAP
+
+    @classmethod
+    def _get_col_href_base_map(cls) -> Dict[str, str]:
+        """ return the map between href / url attribute name and the column it links, these attributes are left out
+        of the output when it can display hyperlinks
+        """
+        if cls._COL_HREF_BASE_MAP is None:
+            cls.__init_class_col_attributes()
+        return cls._COL_HREF_BASE_MAP or {}
+
     @classmethod
     def get_col_attr_names(cls) -> List[str]:
-        """ return the list of all column attribute names (no config, just attribute names) """
+        """ return the list of all column attribute names (no config, just attribute names). href and url columns
+        are included, see BaseTable.iter_table_lines for when they are displayed.
+        """
         if cls._COL_ATTR_NAMES is None:
             cls.__init_class_col_attributes()
         return cls._COL_ATTR_NAMES or []
 
+    @classmethod
+    def get_record_field_names(cls) -> List[str]:
+        """ return the names of the fields that make up a record of the row, in definition order. Unlike
+        get_col_attr_names, hidden columns and href columns are included.
+        """
+        return [f.name for f in fields(cls) if f.init and not f.name.startswith('_')]
+
+    @classmethod
+    def get_export_col_attr_names(cls) -> List[str]:
+        """ return the column attributes written by the export writers. Unlike get_col_attr_names, href and url
+        columns are always kept as plain columns, as export targets cannot render terminal hyperlinks.
+        """
+        return [attr_name for attr_name in cls.get_record_field_names() if not cls._is_col_hidden(attr_name)]
+
+    @classmethod
+    def get_export_col_header_map(cls) -> Dict[str, str]:
+        """ same as get_col_header_map, for the columns of get_export_col_attr_names """
+        return {
+            attr_name: cls.get_config(attr_name).alias or attr_name for attr_name in cls.get_export_col_attr_names()
+        }
+
+    @classmethod
+    def get_col_truncate_specs(cls) -> List[Tuple[int, int, ColumnTruncation, str]]:
+        """ return (index in get_col_attr_names, max_width, truncate, ellipsis) of the columns with max_width """
+        if cls._COL_TRUNCATE_SPECS is None:
+            cls.__init_class_col_attributes()
+        return cls._COL_TRUNCATE_SPECS or []
+
     @classmethod
     def get_col_header_disp_len_map(cls) -> Dict[str, int]:
         """ return the map between column attribute name and column header display length
@@ -339,31 +623,146 @@ class BaseRow:
             key: column_attribute_name
             value: column content if href is provided; otherwise, original content
         """
-        ret = self.get_col_value_disp()
-        for attr_name in self.get_col_attr_names():
-            # 处理 href
-            if can_display_href() and self._is_col_href_attr_exist(attr_name):
-                href_attr_name = self._get_href_attr_name(attr_name)
-                url_attr_name = self._get_url_attr_name(attr_name)
-                href = self.__dict__.get(href_attr_name, self.__dict__.get(url_attr_name, None))
-                if href is None:
-                    continue
-                attr_value_original = ret[attr_name]
-                ret[attr_name] = f"\x1b]8;;{href}\x1b\\{attr_value_original}\x1b]8;;\x1b\\"
+        return self._wrap_col_value_href(self.get_col_value_disp())
+
+    def _wrap_col_value_href(self, col_value_disp: Dict[str, str]) -> Dict[str, str]:
+        """ return a copy of col_value_disp where columns with href are wrapped in OSC 8 hyperlink sequences """
+        ret = dict(col_value_disp)
+        if not self._get_col_href_attr_map():
+            return ret
+        # 处理 href
+        for attr_name in self._get_col_href_attr_map():
+            href = self._get_col_href(attr_name)
+            if href is not None:
+                ret[attr_name] = _wrap_href(ret[attr_name], href)
         return ret
 
+    def _get_col_href(self, attr_name: str) -> Optional[str]:
+        """ return the href of a column from its href attribute, or its url attribute """
+        href_attr_name, url_attr_name = self._get_col_href_attr_map()[attr_name]
+        href = getattr(self, href_attr_name, None)
+        return getattr(self, url_attr_name, None) if href is None else href
+
     def get_col_value_disp_len(self) -> Dict[str, int]:
         """return the map between column attribute name and column content display length
         Returns:
             Dict[str, int]: key: column_attribute_name: value: column display length when cast to string type
         """
-        logger.debug(f'annotations:{self.__annotations__}')
         ret = dict()
         col_value_disp: dict = self.get_col_value_disp()
         for attr_name in self.get_col_attr_names():
             ret[attr_name] = get_display_ansi_width(str(col_value_disp[attr_name]))
         return ret
 
+    def get_render_cache(self) -> RowRenderCache:
+        """ return the rendered cells of the row. Cells are formatted and measured once and reused until
+        invalidate_render_cache is called.
+        """
+        if self._render_cache is None:
+            # get_col_value_disp 的 key 顺序与 get_col_attr_names 一致
+            col_value_disp = self.get_col_value_disp()
+            disp = tuple(col_value_disp.values())
+            truncate_specs = self.get_col_truncate_specs()
+            if truncate_specs:
+                disp = _truncate_cells(disp, truncate_specs)
+                col_value_disp = dict(zip(col_value_disp, disp))
+            true = disp
+            if self._get_col_href_attr_map():
+                true = tuple(self._wrap_col_value_href(col_value_disp).values())
+            self._render_cache = RowRenderCache(disp=disp, true=true, width=tuple(map(get_display_ansi_width, disp)))
+        return self._render_cache
+
+    @classmethod
+    def _init_render_caches(cls, rows: List['BaseRow'], stats: Optional[TableStats] = None) -> List[List[int]]:
+        """ fill the render cache of many rows of this class, formatting and measuring one column at a time
+        Args:
+            rows (List[BaseRow]): rows of this class
+            stats (TableStats, optional): records the format and measure phases when given
+        Returns:
+            List[List[int]]: display widths of the rows per column, in the order of get_col_attr_names
+        """
+        col_order = cls.get_col_attr_names()
+        if not rows or not col_order:
+            return [[] for _ in col_order]
+        cell_cnt = len(rows) * len(col_order)
+        if cls._get_col_href_attr_map():
+            with NULL_PHASE if stats is None else stats.phase('format') as phase:
+                caches = [row_data.get_render_cache() for row_data in rows]
+                phase.add(cells_formatted=cell_cnt)
+            return [list(width) for width in zip(*(cache.width for cache in caches))]
+
+        if stats is None:
+            col_disp = cls._get_col_disp_of_rows(rows)
+            col_width = [list(map(get_display_ansi_width, disp)) for disp in col_disp]
+        else:
+            with stats.phase('format') as phase:
+                col_disp = cls._get_col_disp_of_rows(rows)
+                phase.add(cells_formatted=cell_cnt)
+            with stats.phase('measure') as phase:
+                cache_hits, cache_misses = get_width_cache_info()
+                col_width = [list(map(get_display_ansi_width, disp)) for disp in col_disp]
+                cache_hits_after, cache_misses_after = get_width_cache_info()
+                phase.add(
+                    cells_measured=cell_cnt, width_cache_hits=cache_hits_after - cache_hits,
+                    width_cache_misses=cache_misses_after - cache_misses,
+                )
+        for row_data, disp, width in zip(rows, zip(*col_disp), zip(*col_width)):
+            row_data._render_cache = RowRenderCache(disp=disp, true=disp, width=width)
+        return col_width
+
+    @classmethod
+    def _get_col_disp_of_rows(cls, rows: List['BaseRow']) -> List[List[str]]:
+        """ return the formatted cells of the rows per column, see get_col_value_disp """
+        return [
+            _format_col_values(list(map(attrgetter(attr_name), rows)), cls.get_config(attr_name))
+            for attr_name in cls.get_col_attr_names()
+        ]
+
+    @classmethod
+    def get_line_renderer(
+            cls, col_sep: str, can_disp_color: bool, col_names: Optional[Sequence[str]] = None,
+            hyperlinks: bool = True,
+            ) -> Callable[[RowRenderCache, Sequence[int]], str]:
+        """ return the function rendering a row line of this class, compiled once by _compile_line_renderer
+        Args:
+            col_sep (str): column separator
+            can_disp_color (bool): whether conditional formats are applied
+            col_names (Sequence[str], optional): columns to render, in order. Defaults to get_col_attr_names()
+            hyperlinks (bool, optional): whether href columns are written as OSC 8 hyperlinks
+        """
+        if cls._LINE_RENDERER_MAP is None:
+            cls._LINE_RENDERER_MAP = {}
+        col_names = None if col_names is None else tuple(col_names)
+        key = (col_sep, can_disp_color, col_names, hyperlinks)
+        if key not in cls._LINE_RENDERER_MAP:
+            col_order = cls.get_col_attr_names()
+            col_idx = None if col_names is None else [col_order.index(attr_name) for attr_name in col_names]
+            col_config = [cls.get_config(attr_name) for attr_name in (col_order if col_names is None else col_names)]
+            cls._LINE_RENDERER_MAP[key] = _compile_line_renderer(
+                col_config, col_sep, can_disp_color, f'{cls.__qualname__}.render_line', col_idx=col_idx,
+                hyperlinks=hyperlinks,
+            )
+        return cls._LINE_RENDERER_MAP[key]
+
+    @classmethod
+    def _get_cond_fmt_totals(cls) -> Tuple[int, float]:
+        """ return the number of conditional format evaluations and the seconds they took, summed over the line
+        renderers compiled for this class
+        """
+        return _get_cond_fmt_totals(
+            matcher for render_line in (cls._LINE_RENDERER_MAP or {}).values()
+            for matcher in render_line.cond_fmt_matchers
+        )
+
+    @classmethod
+    def is_compact(cls) -> bool:
+        """ return True when rows of this class are stored without __dict__, see @dataclass(slots=True) """
+        return cls.__dictoffset__ == 0
+
+    def invalidate_render_cache(self) -> None:
+        """ drop the rendered cells, required after the row is mutated """
+        self._render_cache = None
+
     @classmethod
     def get_col_header_len_map(cls) -> Dict[str, int]:
         """ return the map between column attribute name and column header length
@@ -418,15 +817,490 @@ class BaseRow:
 
 TBaseRow = TypeVar('TBaseRow', bound=BaseRow)
 
+DEFAULT_WRITE_CHUNK_SIZE: int = 64 * 1024
+DEFAULT_INSERT_BATCH_SIZE: int = 10000
+DEFAULT_RENDER_TASK_ROWS: int = 4096
+DEFAULT_EXPORT_BATCH_SIZE: int = 10000
+# aiter_table_lines 每渲染这么多行交还一次事件循环
+DEFAULT_ASYNC_BATCH_LINES: int = 1024
+
+TRecord = Union[Dict[str, Any], Sequence[Any]]
+TOrderSpec = Tuple[Tuple[str, ...], Tuple[bool, ...]]
+
+
+TTruncateSpec = Tuple[int, int, ColumnTruncation, str]
+_HREF_END = '\x1b]8;;\x1b\\'
+
+
+def _wrap_href(text: str, href: str) -> str:
+    """ wrap text in an OSC 8 hyperlink to href """
+    return f'\x1b]8;;{href}\x1b\\{text}{_HREF_END}'
+
+
+def _format_col_values(values: Sequence[Any], config: 'ColumnConfig') -> List[str]:
+    """ format the values of one column like BaseRow.get_col_value_disp, cells wider than max_width are cut """
+    fmt = config.format
+    if fmt:
+        disp = [val.strftime(fmt) if isinstance(val, datetime) else str(val) for val in values]
+    else:
+        disp = list(map(str, values))
+    if config.max_width is not None:
+        disp = [truncate_display_width(cell, config.max_width, config.truncate, config.ellipsis)[0] for cell in disp]
+    return disp
+
+
+def _truncate_cells(disp: Sequence[str], truncate_specs: List[TTruncateSpec]) -> Tuple[str, ...]:
+    """ cut the cells given by truncate_specs: (cell index, max_width, truncate, ellipsis) """
+    disp = list(disp)
+    for idx, max_width, truncate, ellipsis in truncate_specs:
+        disp[idx] = truncate_display_width(disp[idx], max_width, truncate, ellipsis)[0]
+    return tuple(disp)
+
+
+def _truncate_render_cache(render_cache: RowRenderCache, truncate_specs: List[TTruncateSpec]) -> RowRenderCache:
+    """ return render_cache with the cells wider than their max_width cut, hyperlinks are kept """
+    disp, true, width = render_cache
+    if all(width[idx] <= max_width for idx, max_width, _, _ in truncate_specs):
+        return render_cache
+    disp, true, width = list(disp), list(true), list(width)
+    for idx, max_width, truncate, ellipsis in truncate_specs:
+        if width[idx] <= max_width:
+            continue
+        cell, width[idx] = truncate_display_width(disp[idx], max_width, truncate, ellipsis)
+        if true[idx] != disp[idx] and true[idx].endswith(disp[idx] + _HREF_END):
+            # 保留超链接，只替换显示的文字
+            true[idx] = true[idx][:len(true[idx]) - len(disp[idx]) - len(_HREF_END)] + cell + _HREF_END
+        else:
+            true[idx] = cell
+        disp[idx] = cell
+    return RowRenderCache(disp=tuple(disp), true=tuple(true), width=tuple(width))
+
+
+def _fit_col_widths(
+        col_width: Sequence[int], min_col_width: Sequence[int], max_line_width: int, col_sep_width: int,
+        ) -> List[int]:
+    """ shrink column widths so a line fits in max_line_width display columns. The widest columns are shrunk first,
+    down to min_col_width. Columns that do not fit even at min_col_width are dropped from the right, the first column
+    is always kept.
+    Returns:
+        List[int]: width of the columns kept, in the order of col_width
+    """
+    def get_line_width(col_cnt: int, widths: Sequence[int]) -> int:
+        # 每列左右各一个空格，列之间一个分隔符
+        return sum(widths[:col_cnt]) + col_cnt * 2 + (col_cnt - 1) * col_sep_width
+
+    col_cnt = len(col_width)
+    min_col_width = [min(width, min_width) for width, min_width in zip(col_width, min_col_width)]
+    while col_cnt > 1 and get_line_width(col_cnt, min_col_width) > max_line_width:
+        col_cnt -= 1
+    col_width, min_col_width = list(col_width[:col_cnt]), min_col_width[:col_cnt]
+    budget = max_line_width - get_line_width(col_cnt, [0] * col_cnt)
+    if sum(col_width) <= budget:
+        return col_width
+
+    def get_total_width(cap: int) -> int:
+        return sum(max(min_width, min(width, cap)) for width, min_width in zip(col_width, min_col_width))
+
+    # 二分查找最大的列宽上限，超出上限的列被截断
+    cap_lo, cap_hi = 0, max(col_width)
+    while cap_lo < cap_hi:
+        cap = (cap_lo + cap_hi + 1) // 2
+        if get_total_width(cap) <= budget:
+            cap_lo = cap
+        else:
+            cap_hi = cap - 1
+    fitted = [max(min_width, min(width, cap_lo)) for width, min_width in zip(col_width, min_col_width)]
+    spare = budget - sum(fitted)
+    for idx, width in enumerate(col_width):
+        if spare <= 0:
+            break
+        if fitted[idx] < width:
+            fitted[idx] += 1
+            spare -= 1
+    return fitted
+
+
+def _compile_line_renderer(
+        col_config: List[ColumnConfig], col_sep: str, can_disp_color: bool, qualname: str = 'render_line',
+        col_idx: Optional[Sequence[int]] = None, hyperlinks: bool = True,
+        ) -> Callable[[RowRenderCache, Sequence[int]], str]:
+    """ generate a straight-line function rendering one row line, the way dataclasses generates __init__.
+    Alignments, conditional formats and the column separator are baked into the code, so rendering a row does not
+    look up any config. The function takes the RowRenderCache of a row and the column display widths in the order of
+    col_config. col_idx gives the position of each column of col_config in the RowRenderCache when only some
+    columns are rendered. When hyperlinks is False, the displayed cells are written without their OSC 8 href.
+    The CondFmtMatcher of each column with conditional formats is listed in render_line.cond_fmt_matchers.
+    """
+    namespace: Dict[str, Any] = {'_COL_SEP': col_sep}
+    matchers: List[CondFmtMatcher] = []
+    col_cnt = len(col_config)
+    if not col_cnt:
+        lines = ['def render_line(render_cache, col_width):', "    return ''"]
+    else:
+        col_width = ', '.join(f'w{idx}' for idx in range(col_cnt))
+        if col_idx is None:
+            disp = ', '.join(f'd{idx}' for idx in range(col_cnt))
+            true = ', '.join(f't{idx}' for idx in range(col_cnt))
+            width = ', '.join(f'x{idx}' for idx in range(col_cnt))
+            lines = [
+                'def render_line(render_cache, col_width):',
+                f'    ({disp},), ({true},), ({width},) = render_cache',
+            ]
+        else:
+            lines = ['def render_line(render_cache, col_width):', '    disp, true, width = render_cache']
+            for idx, cache_idx in enumerate(col_idx):
+                lines.append(f'    d{idx}, t{idx}, x{idx} = disp[{cache_idx}], true[{cache_idx}], width[{cache_idx}]')
+        lines.append(f'    ({col_width},) = col_width')
+        for idx, config in enumerate(col_config):
+            cell = f't{idx}' if hyperlinks else f'd{idx}'
+            # 宽字符占 2 个显示宽度，补齐的空格数按显示宽度计算
+            lines.append(f'    pad = w{idx} - x{idx}')
+            lines.append('    if pad < 0: pad = 0')
+            if config.align == ColumnAlignment.RIGHT:
+                lines.append(f"    c{idx} = ' ' * (pad + 1) + {cell} + ' '")
+            elif config.align == ColumnAlignment.CENTER:
+                # 与 str.format 的 ^ 一致，多出的空格放在右边
+                lines.append(f"    c{idx} = ' ' * (pad // 2 + 1) + {cell} + ' ' * (pad - pad // 2 + 1)")
+            else:
+                lines.append(f"    c{idx} = ' ' + {cell} + ' ' * (pad + 1)")
+            cond_fmts = get_col_cond_fmts(config) if can_disp_color else []
+            if cond_fmts:
+                # 条件格式按单元格文本缓存匹配结果，每个不同的值只判断一次
+                namespace[f'_cond_fmt{idx}'] = CondFmtMatcher(cond_fmts)
+                matchers.append(namespace[f'_cond_fmt{idx}'])
+                lines.append(f'    fmt = _cond_fmt{idx}[d{idx}]')
+                lines.append('    if fmt:')
+                lines.append(f'        c{idx} = fmt(c{idx})')
+        lines.append("    return _COL_SEP.join((" + ''.join(f'c{idx}, ' for idx in range(col_cnt)) + "))")
+    exec('\n'.join(lines), namespace)
+    render_line = namespace['render_line']
+    render_line.__qualname__ = qualname
+    render_line.cond_fmt_matchers = matchers
+    return render_line
+
+
+class _DescKey:
+    """ reverse the order of a sort key, so ascending and descending columns can be sorted in a single pass """
+    __slots__ = ('key',)
+
+    def __init__(self, key: Any):
+        self.key = key
+
+    def __lt__(self, other: '_DescKey') -> bool:
+        return other.key < self.key
+
+    def __eq__(self, other: '_DescKey') -> bool:
+        return self.key == other.key
+
+
+def get_sort_key_func(order_by: Sequence[str], ascending: Sequence[bool]) -> Callable[[Any], Any]:
+    """ return a composite sort key function for rows. None is ordered before any other value in ascending columns
+    and after any other value in descending columns.
+    """
+    if len(order_by) == 1:
+        get_value = attrgetter(order_by[0])
+
+        def get_values(row_data):
+            return (get_value(row_data),)
+    else:
+        get_values = attrgetter(*order_by)
+
+    if all(ascending):
+        return lambda row_data: tuple((val is not None, val) for val in get_values(row_data))
+    if not any(ascending):
+        return lambda row_data: _DescKey(tuple((val is not None, val) for val in get_values(row_data)))
+    return lambda row_data: tuple(
+        (val is not None, val) if asc else _DescKey((val is not None, val))
+        for val, asc in zip(get_values(row_data), ascending)
+    )
+
+
+class SortIndex(Generic[TBaseRow]):
+    """ rows of a table kept in the order of an order_by/ascending spec.
+    Sort keys are computed once per row and new rows are merged in with bisect insertion, so reading the ordered rows
+    after inserting N rows does not re-sort the whole table. Rows with equal keys keep their insertion order.
+    """
+    # 批量插入超过该数量时，改为 extend 后整体 sort (timsort 会合并两个有序段)
+    BULK_MERGE_THRESHOLD: int = 64
+
+    def __init__(self, order_by: Sequence[str], ascending: Sequence[bool]):
+        self.order_by: Tuple[str, ...] = tuple(order_by)
+        self.ascending: Tuple[bool, ...] = tuple(ascending)
+        self._key_func = get_sort_key_func(self.order_by, self.ascending)
+        self._seq = count()
+        self._entries: List[Tuple[Any, int, TBaseRow]] = []
+        self._entry_map: Dict[int, Tuple[Any, int, TBaseRow]] = {}
+        self._rows: Optional[List[TBaseRow]] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, row_data: TBaseRow) -> None:
+        entry = (self._key_func(row_data), next(self._seq), row_data)
+        insort(self._entries, entry)
+        self._entry_map[id(row_data)] = entry
+        self._rows = None
+
+    def add_many(self, rows: Iterable[TBaseRow]) -> None:
+        key_func, seq = self._key_func, self._seq
+        entries_new = [(key_func(row_data), next(seq), row_data) for row_data in rows]
+        if len(entries_new) < self.BULK_MERGE_THRESHOLD:
+            for entry in entries_new:
+                insort(self._entries, entry)
+        else:
+            self._entries.extend(entries_new)
+            self._entries.sort()
+        self._entry_map.update((id(entry[2]), entry) for entry in entries_new)
+        self._rows = None
+
+    def remove(self, row_data: TBaseRow) -> None:
+        """ remove a row, must be called before the sort key columns of the row are changed """
+        entry = self._entry_map.pop(id(row_data))
+        del self._entries[bisect_left(self._entries, entry)]
+        self._rows = None
+
+    def remove_many(self, rows: Iterable[TBaseRow]) -> None:
+        """ remove many rows with one pass over the index """
+        row_ids = {id(row_data) for row_data in rows}
+        self._entries = [entry for entry in self._entries if id(entry[2]) not in row_ids]
+        for row_id in row_ids:
+            self._entry_map.pop(row_id, None)
+        self._rows = None
+
+    def get_rows(self, start: int = 0, stop: Optional[int] = None) -> List[TBaseRow]:
+        """ return the rows in index order, optionally only the rows in [start, stop) """
+        if start or stop is not None:
+            return [entry[2] for entry in self._entries[start:stop]]
+        if self._rows is None:
+            self._rows = [entry[2] for entry in self._entries]
+        return list(self._rows)
+
+
+class HashIndex(Generic[TBaseRow]):
+    """ rows of a table grouped by the value of one column, for O(1) equality lookups.
+    Column values must be hashable. Rows of a value are returned in the order they were added to the index.
+    """
+
+    def __init__(self, attr_name: str):
+        self.attr_name: str = attr_name
+        self._buckets: Dict[Any, Dict[int, TBaseRow]] = {}
+
+    def __len__(self) -> int:
+        """ number of distinct values """
+        return len(self._buckets)
+
+    def add(self, row_data: TBaseRow) -> None:
+        value = getattr(row_data, self.attr_name)
+        bucket = self._buckets.get(value)
+        if bucket is None:
+            bucket = self._buckets[value] = {}
+        bucket[id(row_data)] = row_data
+
+    def add_many(self, rows: Iterable[TBaseRow]) -> None:
+        for row_data in rows:
+            self.add(row_data)
+
+    def remove(self, row_data: TBaseRow) -> None:
+        """ remove a row, must be called before the indexed column of the row is changed """
+        value = getattr(row_data, self.attr_name)
+        bucket = self._buckets[value]
+        del bucket[id(row_data)]
+        if not bucket:
+            del self._buckets[value]
+
+    def remove_many(self, rows: Iterable[TBaseRow]) -> None:
+        for row_data in rows:
+            self.remove(row_data)
+
+    def get_rows(self, value: Any) -> List[TBaseRow]:
+        """ return the rows whose column value equals value """
+        bucket = self._buckets.get(value)
+        return list(bucket.values()) if bucket else []
+
+    def get_values(self) -> List[Any]:
+        """ return the distinct values of the column """
+        return list(self._buckets)
+
+
+AGGREGATE_FUNCS: Tuple[str, ...] = ('count', 'sum', 'min', 'max', 'mean')
+
+
+class _ColumnAggState:
+    """ running aggregates of the non None values of one column in one group """
+    __slots__ = ('count', 'total', 'values', 'min', 'max')
+
+    def __init__(self, keep_total: bool, keep_values: bool):
+        self.count: int = 0
+        self.total: Any = 0 if keep_total else None
+        # min/max 需要支持删除，保留每个值出现的次数
+        self.values: Optional[Counter] = Counter() if keep_values else None
+        # 缓存的最小/最大值，None 表示需要从 values 重新计算
+        self.min: Any = None
+        self.max: Any = None
+
+    def add(self, value: Any) -> None:
+        if value is None:
+            return
+        self.count += 1
+        if self.total is not None:
+            self.total += value
+        if self.values is not None:
+            self.values[value] += 1
+            if self.count == 1:
+                self.min = self.max = value
+                return
+            if self.min is not None and value < self.min:
+                self.min = value
+            if self.max is not None and value > self.max:
+                self.max = value
+
+    def remove(self, value: Any) -> None:
+        if value is None:
+            return
+        self.count -= 1
+        if self.total is not None:
+            self.total -= value
+        if self.values is not None:
+            self.values[value] -= 1
+            if not self.values[value]:
+                del self.values[value]
+                # 只有最后一个最小/最大值被删除时才需要重新计算
+                if value == self.min:
+                    self.min = None
+                if value == self.max:
+                    self.max = None
+
+    def get(self, func: str) -> Any:
+        if func == 'count':
+            return self.count
+        if not self.count:
+            return None
+        if func == 'sum':
+            return self.total
+        if func == 'mean':
+            return self.total / self.count
+        if func == 'min':
+            if self.min is None:
+                self.min = min(self.values)
+            return self.min
+        if self.max is None:
+            self.max = max(self.values)
+        return self.max
+
+
+class GroupAggregation(Generic[TBaseRow]):
+    """ count, sum, min, max and mean of columns per group of rows, updated row by row as rows are inserted, updated
+    and deleted, so reading the results never rescans the table. None values are ignored like in sql.
+    """
+
+    def __init__(self, group_by: Sequence[str], aggregates: Dict[str, Sequence[str]]):
+        funcs_bad = [func for funcs in aggregates.values() for func in funcs if func not in AGGREGATE_FUNCS]
+        if funcs_bad:
+            raise ValueError(f'Unknown aggregate functions: {funcs_bad}, supported: {AGGREGATE_FUNCS}')
+        self.group_by: Tuple[str, ...] = tuple(group_by)
+        self.aggregates: Dict[str, Tuple[str, ...]] = {
+            attr_name: tuple(funcs) for attr_name, funcs in aggregates.items()
+        }
+        self.attr_names: Tuple[str, ...] = tuple(dict.fromkeys([*self.group_by, *self.aggregates]))
+        self._agg_attr_names: List[str] = list(self.aggregates)
+        self._state_flags = [
+            (any(func in ('sum', 'mean') for func in funcs), any(func in ('min', 'max') for func in funcs))
+            for funcs in self.aggregates.values()
+        ]
+        # key: group_by 列的值组成的 tuple; value: (行数, 每个聚合列的状态)
+        self._groups: Dict[Tuple[Any, ...], List[Any]] = {}
+
+    def _get_group_key(self, row_data: TBaseRow) -> Tuple[Any, ...]:
+        return tuple(getattr(row_data, attr_name) for attr_name in self.group_by)
+
+    def add(self, row_data: TBaseRow) -> None:
+        key = self._get_group_key(row_data)
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = [0, [_ColumnAggState(*flags) for flags in self._state_flags]]
+        group[0] += 1
+        for state, attr_name in zip(group[1], self._agg_attr_names):
+            state.add(getattr(row_data, attr_name))
+
+    def add_many(self, rows: Iterable[TBaseRow]) -> None:
+        for row_data in rows:
+            self.add(row_data)
+
+    def remove(self, row_data: TBaseRow) -> None:
+        """ remove a row, must be called before the group_by or aggregated columns of the row are changed """
+        key = self._get_group_key(row_data)
+        group = self._groups[key]
+        group[0] -= 1
+        if not group[0]:
+            del self._groups[key]
+            return
+        for state, attr_name in zip(group[1], self._agg_attr_names):
+            state.remove(getattr(row_data, attr_name))
+
+    def remove_many(self, rows: Iterable[TBaseRow]) -> None:
+        for row_data in rows:
+            self.remove(row_data)
+
+    def get_row_count(self, key: Tuple[Any, ...] = ()) -> int:
+        """ return the number of rows in the group, key is the tuple of the group_by column values """
+        group = self._groups.get(tuple(key))
+        return group[0] if group else 0
+
+    def get_result(self, key: Tuple[Any, ...] = ()) -> Dict[str, Any]:
+        """ return the aggregates of a group, key is the tuple of the group_by column values (empty without group_by)
+        Returns:
+            Dict[str, Any]: key: <column attribute name>_<function>, e.g. Salary_sum; value: None if no value
+        """
+        group = self._groups.get(tuple(key))
+        ret = {}
+        for idx, (attr_name, funcs) in enumerate(self.aggregates.items()):
+            for func in funcs:
+                ret[f'{attr_name}_{func}'] = (group[1][idx].get(func) if group else (0 if func == 'count' else None))
+        return ret
+
+    def get_results(self) -> Dict[Tuple[Any, ...], Dict[str, Any]]:
+        """ return the aggregates of every group, see get_result """
+        return {key: self.get_result(key) for key in self._groups}
+
+    def to_table(self, row_type: Type[BaseRow]) -> 'BaseTable':
+        """ return a new table with one row per group: the group_by columns followed by the aggregates.
+        Headers reuse the aliases of row_type, e.g. sum(工资).
+        """
+        header_map = row_type.get_export_col_header_map()
+        col_aliases = {attr_name: header_map.get(attr_name, attr_name) for attr_name in self.group_by}
+        for attr_name, funcs in self.aggregates.items():
+            for func in funcs:
+                col_aliases[f'{attr_name}_{func}'] = f'{func}({header_map.get(attr_name, attr_name)})'
+        cls_name = f'{row_type.__name__}Aggregation'
+        agg_row_type = make_dataclass(
+            cls_name, [(attr_name, Any, field(default=None)) for attr_name in col_aliases], bases=(BaseRow,),
+            namespace={
+                f'_{cls_name}__{attr_name}_config': ColumnConfig(alias=alias)
+                for attr_name, alias in col_aliases.items()
+            },
+        )
+        agg_table_type = type(f'{cls_name}Table', (BaseTable,), {'row_type': agg_row_type})
+        agg_table = agg_table_type()
+        agg_table.insert_rows(
+            agg_row_type(**dict(zip(self.group_by, key)), **result) for key, result in self.get_results().items()
+        )
+        return agg_table
+
 
 class BaseTable(Generic[TBaseRow]):
     row_type: Type[TBaseRow]
     CHAR_LN: str = '\r\n'
-    CHAR_COL_SEP: str = BoxDrawingChar.LIGHT_VERTICAL
-    CHAR_ROW_SEP: str = BoxDrawingChar.LIGHT_HORIZONTAL
-    CHAR_HEADER_H_SEP: str = BoxDrawingChar.DOUBLE_HORIZONTAL
-    CHAR_HEADER_V_SEP: str = BoxDrawingChar.VERTICAL_SINGLE_AND_HORIZONTAL_DOUBLE
+    # 默认值与 BoxDrawingChar 相同，写成字面量以免 import 时加载整个枚举
+    CHAR_COL_SEP: str = '\u2502'  # BoxDrawingChar.LIGHT_VERTICAL
+    CHAR_ROW_SEP: str = '\u2500'  # BoxDrawingChar.LIGHT_HORIZONTAL
+    CHAR_HEADER_H_SEP: str = '\u2550'  # BoxDrawingChar.DOUBLE_HORIZONTAL
+    CHAR_HEADER_V_SEP: str = '\u256A'  # BoxDrawingChar.VERTICAL_SINGLE_AND_HORIZONTAL_DOUBLE
     ENABLE_COLOR: bool = True
+    # print_table 按终端宽度截断列，列宽最多缩小到 AUTO_FIT_MIN_COL_WIDTH
+    AUTO_FIT: bool = False
+    AUTO_FIT_MIN_COL_WIDTH: int = 6
+    # write_table(workers=...) 的工作进程启动方式，None 时用 forkserver，不支持时用 spawn
+    RENDER_START_METHOD: Optional[str] = None
 
     def __init__(self, *args, **kwargs):
         self.__COL_MAX_DISP_LEN: defaultdict = defaultdict(int)
@@ -435,8 +1309,33 @@ class BaseTable(Generic[TBaseRow]):
             self.__COL_MAX_LEN[attr_name] = header_width
         for attr_name, header_disp_len in self.row_type.get_col_header_disp_len_map().items():
             self.__COL_MAX_DISP_LEN[attr_name] = header_disp_len
+        # 每列的宽度直方图 (display width -> row count)，删除/修改行时用于收缩列宽
+        self.__COL_DISP_LEN_HIST: Dict[str, Counter] = {
+            attr_name: Counter() for attr_name in self.row_type.get_col_attr_names()
+        }
+        self._sort_indexes: Dict[TOrderSpec, SortIndex[TBaseRow]] = {}
+        self._hash_indexes: Dict[str, HashIndex[TBaseRow]] = {}
+        self._aggregations: Dict[Tuple[Any, ...], GroupAggregation[TBaseRow]] = {}
+        self._footer: Optional[Tuple[GroupAggregation[TBaseRow], str]] = None
+        # 默认不统计，关闭时各个阶段只多一次 None 判断
+        self.stats: Optional[TableStats] = None
         self.row_list: List[TBaseRow] = []
 
+    def enable_stats(self, callback: Optional[TStatsCallback] = None) -> TableStats:
+        """ start collecting per phase timings and counters, see TableStats
+        Args:
+            callback (TStatsCallback, optional): called with (phase, seconds, counters) every time a phase ends
+        Returns:
+            TableStats: the stats object, updated in place by the following operations on the table
+        """
+        self.stats = TableStats(callback=callback)
+        return self.stats
+
+    def disable_stats(self) -> Optional[TableStats]:
+        """ stop collecting stats, return the stats collected so far """
+        stats, self.stats = self.stats, None
+        return stats
+
     def _get_col_max_disp_len(self) -> Dict[str, int]:
         """ 用于测试 self.__COL_MAX_DISP_LEN """
         # d: BaseRow
@@ -445,11 +1344,78 @@ class BaseTable(Generic[TBaseRow]):
         for d in self.row_list:
             for col, width in d.get_col_value_disp_len().items():
                 col_max_disp_len[col] = max(col_max_disp_len[col], width)
-        logger.debug(f'col_max_disp_len:{col_max_disp_len}')
+        _log_debug('col_max_disp_len:%s', col_max_disp_len)
         return col_max_disp_len
 
+    def get_col_disp_len_map(self) -> Dict[str, int]:
+        """ return a copy of the current display width of each column, including the header width
+        Returns:
+            Dict[str, int]: key: column_attribute_name; value: column display width
+        """
+        col_max_disp_len = self._get_col_disp_len()
+        return {attr_name: col_max_disp_len[attr_name] for attr_name in self._get_col_order()}
+
+    def _get_col_disp_len(self) -> Dict[str, int]:
+        """ return the live column width map used for rendering, without copying it """
+        return self.__COL_MAX_DISP_LEN
+
+    def _get_col_order(self) -> List[str]:
+        """ return the columns rendered by the table, in order """
+        return self.row_type.get_col_attr_names()
+
+    def _get_table_for_caps(self, caps: 'TerminalCapabilities', rows: Sequence[TBaseRow]) -> 'BaseTable[TBaseRow]':
+        """ return the table rendering rows for caps. When caps can display hyperlinks, href and url columns are left
+        out and the column they belong to is written as an OSC 8 hyperlink, otherwise they are plain columns.
+        """
+        if not caps.hyperlinks:
+            return self
+        href_base_map = self.row_type._get_col_href_base_map()
+        col_order = self._get_col_order()
+        col_names = [attr_name for attr_name in col_order if href_base_map.get(attr_name) not in col_order]
+        if len(col_names) == len(col_order) or not col_names:
+            return self
+        return TableView(self, rows, col_names)
+
     def _update_col_max_disp_len(self, row_data: TBaseRow) -> None:
-        for col, disp_len in row_data.get_col_value_disp_len().items():
+        col_max_disp_len = self.__COL_MAX_DISP_LEN
+        col_disp_len_hist = self.__COL_DISP_LEN_HIST
+        for col, disp_len in zip(self.row_type.get_col_attr_names(), row_data.get_render_cache().width):
+            col_disp_len_hist[col][disp_len] += 1
+            if disp_len > col_max_disp_len[col]:
+                col_max_disp_len[col] = disp_len
+
+    def _update_col_max_disp_len_batch(self, col_widths: List[List[int]]) -> None:
+        """ add the widths of a batch of rows, col_widths is returned by BaseRow._init_render_caches """
+        col_disp_len_hist = self.__COL_DISP_LEN_HIST
+        col_disp_len = {}
+        for col, widths in zip(self.row_type.get_col_attr_names(), col_widths):
+            if widths:
+                col_disp_len_hist[col].update(widths)
+                col_disp_len[col] = max(widths)
+        self._merge_col_max_disp_len(col_disp_len)
+
+    def _discard_col_disp_len(self, col_widths: Iterable[Sequence[int]]) -> None:
+        """ remove the widths of deleted or changed rows, and shrink the column max width when the widest rows are gone
+        Args:
+            col_widths (Iterable[Sequence[int]]): display widths of the removed rows per column
+        """
+        col_header_disp_len = self.row_type.get_col_header_disp_len_map()
+        for col, widths in zip(self.row_type.get_col_attr_names(), col_widths):
+            hist = self.__COL_DISP_LEN_HIST[col]
+            hist.subtract(widths)
+            for width in set(widths):
+                if hist[width] <= 0:
+                    del hist[width]
+            if self.__COL_MAX_DISP_LEN[col] not in hist:
+                # 最宽的行已被删除，直方图中不同宽度的个数很少，取 max 的代价可以忽略
+                self.__COL_MAX_DISP_LEN[col] = max(col_header_disp_len[col], max(hist, default=0))
+
+    def _merge_col_max_disp_len(self, col_disp_len: Dict[str, int]) -> None:
+        """ merge pre-computed column display lengths, used by bulk and columnar updates
+        Args:
+            col_disp_len (Dict[str, int]): key: column_attribute_name; value: max display length of a batch of rows
+        """
+        for col, disp_len in col_disp_len.items():
             self.__COL_MAX_DISP_LEN[col] = max(self.__COL_MAX_DISP_LEN[col], disp_len)
 
     def _update_col_max_len(self, row_data: TBaseRow) -> None:
@@ -481,6 +1447,26 @@ class BaseTable(Generic[TBaseRow]):
         Returns:
             List[TBaseRow]: sorted row list
         """
+        order_spec = self._get_order_spec(order_by, ascending)
+        sort_index = self._sort_indexes.get(order_spec)
+        if sort_index is not None:
+            if self.stats is not None:
+                self.stats.add_counters(sort_index_hits=1)
+            return sort_index.get_rows()
+
+        order_by, ascending = order_spec
+        with NULL_PHASE if self.stats is None else self.stats.phase('sort') as phase:
+            phase.add(rows_sorted=len(self.row_list))
+            if not any(ascending):
+                # sort is stable with reverse=True as well, rows with the same key keep their original order
+                return sorted(self.row_list, key=get_sort_key_func(order_by, [True] * len(order_by)), reverse=True)
+            return sorted(self.row_list, key=get_sort_key_func(order_by, ascending))
+
+    def _get_order_spec(self, order_by: List[str], ascending: Optional[List[bool]] = None) -> TOrderSpec:
+        """ validate order_by and ascending, see get_sorted_rows
+        Returns:
+            TOrderSpec: (order_by, ascending) as tuples, ascending defaults to all True
+        """
         if not order_by:
             raise ValueError(f'invalid order_by: {order_by}')
 
@@ -494,55 +1480,207 @@ class BaseTable(Generic[TBaseRow]):
         # validate ascending length
         if len(order_by) != len(ascending):
             raise ValueError('order_by and ascending should have the same length when both are passed in')
+        return tuple(order_by), tuple(bool(asc) for asc in ascending)
 
-        ret = self.row_list
-
-        # sort data
-        is_all_asc: bool = all(ascending)
-        is_all_desc: bool = all(not asc for asc in ascending)
-        if is_all_asc or is_all_desc:
-            # sorting order is all ascending or descending
-            ret = sorted(
-                ret,
-                key=lambda row_data: [getattr(row_data, attr_name) for attr_name in order_by],
-                reverse=True if is_all_desc else False,
+    def register_sort_index(self, order_by: List[str], ascending: Optional[List[bool]] = None) -> SortIndex[TBaseRow]:
+        """ keep the rows ordered by order_by/ascending while rows are inserted. get_sorted_rows and print_table with
+        the same order_by/ascending read the index instead of sorting the whole row_list.
+        Args:
+            order_by (List[str]): see order_by in get_sorted_rows
+            ascending (List[bool], optional): see ascending in get_sorted_rows
+        Returns:
+            SortIndex: the registered index
+        """
+        order_spec = self._get_order_spec(order_by, ascending)
+        if order_spec not in self._sort_indexes:
+            sort_index = SortIndex(*order_spec)
+            sort_index.add_many(self.row_list)
+            self._sort_indexes[order_spec] = sort_index
+        return self._sort_indexes[order_spec]
+
+    def drop_sort_index(self, order_by: List[str], ascending: Optional[List[bool]] = None) -> None:
+        """ remove an index added by register_sort_index """
+        self._sort_indexes.pop(self._get_order_spec(order_by, ascending), None)
+
+    def create_hash_index(self, attr_name: str) -> HashIndex[TBaseRow]:
+        """ keep the rows grouped by the value of attr_name while rows are inserted, updated and deleted.
+        where() looks up equality conditions on the column in the index instead of scanning row_list.
+        Args:
+            attr_name (str): a column attribute name, the column values must be hashable
+        Raises:
+            ValueError: when attr_name is not a column attribute
+        Returns:
+            HashIndex: the created index
+        """
+        if not self.row_type.is_col_attr_exist(attr_name):
+            raise ValueError(f'Unknown attribute name: {attr_name}')
+        if attr_name not in self._hash_indexes:
+            hash_index = HashIndex(attr_name)
+            hash_index.add_many(self.row_list)
+            self._hash_indexes[attr_name] = hash_index
+        return self._hash_indexes[attr_name]
+
+    def drop_hash_index(self, attr_name: str) -> None:
+        """ remove an index added by create_hash_index """
+        self._hash_indexes.pop(attr_name, None)
+
+    def register_aggregation(
+            self, group_by: List[str], aggregates: Dict[str, List[str]]
+            ) -> GroupAggregation[TBaseRow]:
+        """ keep aggregates of columns per group of rows while rows are inserted, updated and deleted
+        Args:
+            group_by (List[str]): columns defining the groups, empty for a single group of all rows
+            aggregates (Dict[str, List[str]]): key: column attribute name; value: functions of AGGREGATE_FUNCS
+                Ex: {'Salary': ['sum', 'mean'], 'Age': ['max']}
+        Raises:
+            ValueError: when group_by or aggregates contain undefined attribute names or unknown functions
+        Returns:
+            GroupAggregation: the registered aggregation, read its results with get_result/get_results/to_table
+        """
+        attr_names_bad = [
+            attr_name for attr_name in [*group_by, *aggregates] if not self.row_type.is_col_attr_exist(attr_name)
+        ]
+        if attr_names_bad:
+            raise ValueError(f'Unknown attribute names: {attr_names_bad}')
+        key = (tuple(group_by), tuple((attr_name, tuple(funcs)) for attr_name, funcs in aggregates.items()))
+        if key not in self._aggregations:
+            aggregation = GroupAggregation(group_by, aggregates)
+            aggregation.add_many(self.row_list)
+            self._aggregations[key] = aggregation
+        return self._aggregations[key]
+
+    def drop_aggregation(self, aggregation: GroupAggregation[TBaseRow]) -> None:
+        """ stop maintaining an aggregation returned by register_aggregation """
+        self._aggregations = {key: agg for key, agg in self._aggregations.items() if agg is not aggregation}
+
+    def set_footer(self, aggregates: Optional[Dict[str, str]], label: str = 'Total') -> None:
+        """ show a summary row under the rows when printing, e.g. set_footer({'Salary': 'sum', 'Age': 'mean'}).
+        The footer is maintained incrementally like register_aggregation and is part of the column width calculation.
+        Args:
+            aggregates (Dict[str, str]): key: column attribute name; value: a function of AGGREGATE_FUNCS.
+                None removes the footer.
+            label (str, optional): text shown in the first column when the first column is not aggregated
+        """
+        if aggregates is None:
+            self._footer = None
+            return
+        attr_names_bad = [attr_name for attr_name in aggregates if not self.row_type.is_col_attr_exist(attr_name)]
+        if attr_names_bad:
+            raise ValueError(f'Unknown attribute names: {attr_names_bad}')
+        aggregation = GroupAggregation([], {attr_name: [func] for attr_name, func in aggregates.items()})
+        aggregation.add_many(self.row_list)
+        self._footer = (aggregation, label)
+
+    def _get_footer_render_cache(self) -> Optional[RowRenderCache]:
+        """ return the footer cells in the order of row_type.get_col_attr_names(), None without footer """
+        if self._footer is None:
+            return None
+        aggregation, label = self._footer
+        result = aggregation.get_result()
+        disp = []
+        for idx, attr_name in enumerate(self.row_type.get_col_attr_names()):
+            if attr_name in aggregation.aggregates:
+                func = aggregation.aggregates[attr_name][0]
+                value = result[f'{attr_name}_{func}']
+                if func == 'mean' and value is not None:
+                    value = round(value, 2)
+                disp.append('' if value is None else str(value))
+            else:
+                disp.append(label if idx == 0 else '')
+        disp = tuple(disp)
+        return RowRenderCache(disp=disp, true=disp, width=tuple(map(get_display_ansi_width, disp)))
+
+    def _get_indexes(self) -> List[Union[SortIndex[TBaseRow], HashIndex[TBaseRow], GroupAggregation[TBaseRow]]]:
+        indexes = [*self._sort_indexes.values(), *self._hash_indexes.values(), *self._aggregations.values()]
+        if self._footer is not None:
+            indexes.append(self._footer[0])
+        return indexes
+
+    @property
+    def row_count(self) -> int:
+        return len(self.row_list)
+
+    def where(self, predicate: Optional[Callable[[TBaseRow], bool]] = None, **col_values: Any) -> 'TableView[TBaseRow]':
+        """ return a read-only view of the rows matching every condition. The view shares the row objects of the
+        table and can be printed, exported, filtered and projected like a table.
+        Equality conditions on a column with a hash index are looked up in the index, the remaining conditions are
+        only checked on the rows found.
+        Args:
+            predicate (Callable[[TBaseRow], bool], optional): rows for which predicate(row) is False are filtered out
+            **col_values: key: column attribute name; value: the value the column equals to
+        Raises:
+            ValueError: when col_values contains undefined attribute names
+        """
+        attr_names_bad = [attr_name for attr_name in col_values if not self.row_type.is_col_attr_exist(attr_name)]
+        if attr_names_bad:
+            raise ValueError(f'Unknown attribute names in col_values: {attr_names_bad}')
+
+        rows = self.row_list
+        conditions = dict(col_values)
+        attr_names_indexed = [attr_name for attr_name in conditions if attr_name in self._hash_indexes]
+        if attr_names_indexed:
+            # 从最小的索引桶开始，其余条件只检查桶内的行
+            rows, attr_name = min(
+                ((self._hash_indexes[attr_name].get_rows(conditions[attr_name]), attr_name)
+                 for attr_name in attr_names_indexed),
+                key=lambda bucket: len(bucket[0]),
             )
-        else:
-            # according to https://docs.python.org/3/howto/sorting.html, sort is stable.
-            # When multiple records have the same key, their original order is preserved.
-            for attr_name, asc in zip(order_by[::-1], ascending[::-1]):
-                ret = sorted(
-                    ret, key=lambda row_data, _a=attr_name: getattr(row_data, _a), reverse=not asc
-                )
-
-        return ret
+            del conditions[attr_name]
+        if conditions:
+            get_values = attrgetter(*conditions)
+            expected = tuple(conditions.values()) if len(conditions) > 1 else next(iter(conditions.values()))
+            rows = [row_data for row_data in rows if get_values(row_data) == expected]
+        if predicate is not None:
+            rows = [row_data for row_data in rows if predicate(row_data)]
+        return TableView(self, rows)
+
+    def select(self, col_names: List[str]) -> 'TableView[TBaseRow]':
+        """ return a read-only view of the table showing only col_names, in the given order
+        Raises:
+            ValueError: when col_names is empty or contains names that are not displayed columns
+        """
+        return TableView(self, self.row_list, col_names)
 
-    def get_table_header_str(self) -> str:
-        """ generate the header line for the output table """
-        logger.debug(f'row_type:{self.row_type}')
-        col_order = self.row_type.get_col_attr_names()
+    def get_table_header_str(self, col_disp_len: Optional[Dict[str, int]] = None) -> str:
+        """ generate the header line for the output table
+        Args:
+            col_disp_len (Dict[str, int], optional): column widths to use instead of the table column widths
+        """
+        _log_debug('row_type:%s', self.row_type)
+        col_order = self._get_col_order()
         col_align = [self.row_type.get_config(attr).align for attr in col_order]
         col_data = [self.row_type.get_col_header_map()[attr] for attr in col_order]
-        col_disp_len = [self.__COL_MAX_DISP_LEN[attr] for attr in col_order]
+        col_disp_len = [(col_disp_len or self._get_col_disp_len())[attr] for attr in col_order]
+        for idx, (attr, width) in enumerate(zip(col_order, col_disp_len)):
+            if get_display_ansi_width(col_data[idx]) > width:
+                # auto-fit 后列宽可能小于表头
+                config = self.row_type.get_config(attr)
+                col_data[idx] = truncate_display_width(col_data[idx], width, config.truncate, config.ellipsis)[0]
         ret = self.CHAR_COL_SEP.join(
             f' {col_val:{align}{width-get_display_ansi_width(str(col_val))+len(str(col_val))}} '
             for col_val, align, width in zip(col_data, col_align, col_disp_len)
         )
         return ret
 
-    def get_table_header_sep_str(self, sep_h: str = None, sep_v: str = None) -> str:
+    def get_table_header_sep_str(
+            self, sep_h: str = None, sep_v: str = None, col_disp_len: Optional[Dict[str, int]] = None
+            ) -> str:
         """ generate the header separator line for the output table
         Args:
             sep_h (str, optional): horrizontal separater
             sep_v (str, optional): vertical separater
+            col_disp_len (Dict[str, int], optional): column widths to use instead of the table column widths
         Returns:
             str: header separator line
         """
         sep_h = sep_h if sep_h else self.CHAR_HEADER_H_SEP
         sep_v = sep_v if sep_v else self.CHAR_HEADER_V_SEP
-        return self.get_table_line_sep_str(sep_h=sep_h, sep_v=sep_v)
+        return self.get_table_line_sep_str(sep_h=sep_h, sep_v=sep_v, col_disp_len=col_disp_len)
 
-    def get_table_line_sep_str(self, sep_h: str = None, sep_v: str = None, dense: bool = True) -> str:
+    def get_table_line_sep_str(
+            self, sep_h: str = None, sep_v: str = None, dense: bool = True,
+            col_disp_len: Optional[Dict[str, int]] = None,
+            ) -> str:
         """ generate row separator line for the output table
         Args:
             sep_h (str, optional): horrizontal separater. Defaults to None.
@@ -551,15 +1689,16 @@ class BaseTable(Generic[TBaseRow]):
                 When True there'll be no space between row sep_h and column sep_v Ex. ----|----.
                 When False there'll be a space between row sep_h and column sep_v Ex. --- | ---.
                 Defaults to True.
+            col_disp_len (Dict[str, int], optional): column widths to use instead of the table column widths
         Returns:
             str: row separator line
         """
         sep_h = sep_h if sep_h else self.CHAR_ROW_SEP
         sep_v = sep_v if sep_v else self.CHAR_COL_SEP
-        col_order = self.row_type.get_col_attr_names()
+        col_order = self._get_col_order()
         col_align = [self.row_type.get_config(attr).align for attr in col_order]
-        col_data = [sep_h * self.__COL_MAX_DISP_LEN[attr] for attr in col_order]
-        col_disp_len = [self.__COL_MAX_DISP_LEN[attr] for attr in col_order]
+        col_disp_len = [(col_disp_len or self._get_col_disp_len())[attr] for attr in col_order]
+        col_data = [sep_h * width for width in col_disp_len]
         col_pad = sep_h if dense else ' '
         col_sep = sep_v
         ret = col_sep.join(
@@ -568,62 +1707,953 @@ class BaseTable(Generic[TBaseRow]):
         )
         return ret
 
-    def get_table_line_str(self, row_data: TBaseRow) -> str:
-        """ generate a row line of the given row_data for the output table """
-        col_order = self.row_type.get_col_attr_names()
-        col_config = {attr: self.row_type.get_config(attr) for attr in col_order}
-        col_data_disp = row_data.get_col_value_disp()
-        col_data_true = row_data.get_col_value_true()
-        col_disp_len = {attr: self.__COL_MAX_DISP_LEN[attr] for attr in col_order}
-
-        can_disp_color = self.ENABLE_COLOR and can_display_ansi_color()
-        token_dict = {}
-        for attr_name in col_order:
-            text_disp, text_print = col_data_disp[attr_name], col_data_true[attr_name]
-            config: ColumnConfig = col_config[attr_name]
-            width = col_disp_len[attr_name]
-            need_conf_fmt = (
-                can_disp_color
-                and config.conditional_format is not None
-                and config.conditional_format != COND_FMT_DEFAULT
-                and config.conditional_format.is_condition_match(text_disp)
-            )
-
-            text_disp_old = text_disp
-            # 1 wide char takes 2 ansi space, and the width is in ansi space, so padding space need to be recalculated
-            width = width-get_display_ansi_width(str(text_disp))+len(str(text_disp))
-            text_disp = f' {str(text_disp):{config.align}{width}} '
-            text_disp = text_disp.replace(text_disp_old, text_print)
+    def get_table_line_str(
+            self, row_data: TBaseRow, col_disp_len: Optional[Dict[str, int]] = None,
+            caps: Optional['TerminalCapabilities'] = None,
+            ) -> str:
+        """ generate a row line of the given row_data for the output table
+        Args:
+            row_data (TBaseRow): the row to render
+            col_disp_len (Dict[str, int], optional): column widths to use instead of the table column widths
+            caps (TerminalCapabilities, optional): see iter_table_lines
+        """
+        col_width = self._get_col_width(col_disp_len or self._get_col_disp_len())
+        return self._get_line_renderer(caps)(row_data.get_render_cache(), col_width)
+
+    def _get_line_renderer(
+            self, caps: Optional['TerminalCapabilities'] = None,
+            ) -> Callable[[RowRenderCache, Sequence[int]], str]:
+        caps = caps or get_terminal_capabilities()
+        col_order = self._get_col_order()
+        col_names = None if col_order == self.row_type.get_col_attr_names() else col_order
+        return self.row_type.get_line_renderer(
+            self.CHAR_COL_SEP, self.ENABLE_COLOR and caps.can_disp_color, col_names=col_names,
+            hyperlinks=caps.hyperlinks,
+        )
 
-            if need_conf_fmt:
-                text_disp = config.conditional_format.apply_format(text_disp)
-            token_dict[attr_name] = text_disp
-        tokens = [token_dict[attr_name] for attr_name in col_order]
-        return self.CHAR_COL_SEP.join(tokens)
+    def _get_col_width(self, col_disp_len: Dict[str, int]) -> Tuple[int, ...]:
+        """ convert a column width map to the width tuple taken by the line renderer """
+        return tuple(col_disp_len[attr_name] for attr_name in self._get_col_order())
 
     def insert_row(self, row_data: TBaseRow):
         """ insert a row_data in to the row_list """
         if type(row_data) is not self.row_type:
             raise TypeError(f'row_data type: {type(row_data)} does not match {self.row_type}')
+        if self.stats is not None and row_data._render_cache is None:
+            with self.stats.phase('format') as phase:
+                phase.add(cells_formatted=len(row_data.get_render_cache().disp))
         self.row_list.append(row_data)
         self._update_col_max_disp_len(row_data=row_data)
+        for index in self._get_indexes():
+            index.add(row_data)
+
+    def insert_rows(self, rows: Iterable[TBaseRow], batch_size: int = DEFAULT_INSERT_BATCH_SIZE) -> int:
+        """ insert many rows. Row types are validated and column widths are updated once per batch.
+        Args:
+            rows (Iterable[TBaseRow]): rows of row_type
+            batch_size (int, optional): number of rows processed at a time
+        Raises:
+            TypeError: when a batch contains rows that are not row_type
+        Returns:
+            int: number of rows inserted
+        """
+        row_cnt = 0
+        for batch in _iter_batches(rows, batch_size):
+            row_types_bad = {type(row_data) for row_data in batch} - {self.row_type}
+            if row_types_bad:
+                raise TypeError(f'row_data type: {row_types_bad} does not match {self.row_type}')
+            self._insert_batch(batch)
+            row_cnt += len(batch)
+        return row_cnt
+
+    def insert_records(
+            self, records: Iterable[TRecord], field_names: Optional[List[str]] = None,
+            batch_size: int = DEFAULT_INSERT_BATCH_SIZE,
+            ) -> int:
+        """ insert many records, each record is either a dict or a tuple of field values.
+        Args:
+            records (Iterable[TRecord]): dict records are keyed by field name, tuple records follow field_names
+            field_names (List[str], optional): field names of tuple records.
+                Defaults to row_type.get_record_field_names()
+            batch_size (int, optional): number of records processed at a time
+        Raises:
+            ValueError: when field_names contains undefined field names
+        Returns:
+            int: number of rows inserted
+        """
+        record_field_names = self.row_type.get_record_field_names()
+        field_names = record_field_names if field_names is None else list(field_names)
+        field_names_bad = [name for name in field_names if name not in record_field_names]
+        if field_names_bad:
+            raise ValueError(f'Unknown field names: {field_names_bad}')
+        row_cnt = 0
+        for batch in _iter_batches(records, batch_size):
+            self._insert_record_batch(field_names, batch)
+            row_cnt += len(batch)
+        return row_cnt
+
+    def _insert_batch(self, batch: List[TBaseRow]) -> None:
+        """ append validated rows and add their widths, one pass per column """
+        self._append_rendered_batch(batch, self.row_type._init_render_caches(batch, stats=self.stats))
+
+    def _append_rendered_batch(self, batch: List[TBaseRow], col_widths: List[List[int]]) -> None:
+        """ append rows whose render caches are filled, col_widths is returned by BaseRow._init_render_caches """
+        self.row_list.extend(batch)
+        self._update_col_max_disp_len_batch(col_widths)
+        for index in self._get_indexes():
+            index.add_many(batch)
+
+    def _insert_record_batch(self, field_names: List[str], batch: List[TRecord]) -> None:
+        _validate_record_batch(field_names, batch)
+        row_type = self.row_type
+        self._insert_batch([
+            row_type(**record) if isinstance(record, dict) else row_type(**dict(zip(field_names, record)))
+            for record in batch
+        ])
+
+    @classmethod
+    def from_iterable(cls, rows: Iterable[TBaseRow], batch_size: int = DEFAULT_INSERT_BATCH_SIZE) -> 'BaseTable':
+        """ create a table from rows of row_type, see insert_rows """
+        table = cls()
+        table.insert_rows(rows, batch_size=batch_size)
+        return table
+
+    @classmethod
+    def from_records(
+            cls, records: Iterable[TRecord], field_names: Optional[List[str]] = None,
+            batch_size: int = DEFAULT_INSERT_BATCH_SIZE,
+            ) -> 'BaseTable':
+        """ create a table from dict or tuple records, see insert_records """
+        table = cls()
+        table.insert_records(records, field_names=field_names, batch_size=batch_size)
+        return table
+
+    @classmethod
+    def from_cursor(cls, cursor: Any, batch_size: int = DEFAULT_INSERT_BATCH_SIZE) -> 'BaseTable':
+        """ create a table from an executed DB-API cursor, rows are pulled with fetchmany(batch_size).
+        Result columns are matched to row_type fields by name when every column name is a field, otherwise by position.
+        """
+        record_field_names = cls.row_type.get_record_field_names()
+        field_names = [desc[0] for desc in cursor.description or []]
+        if not all(name in record_field_names for name in field_names):
+            field_names = record_field_names[:len(field_names)]
+
+        table = cls()
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            table._insert_record_batch(field_names, batch)
+        return table
+
+    def update_row(self, row_data: TBaseRow, **col_values: Any) -> None:
+        """ update column values of a row that's already in the table. Use this instead of setting the attributes
+        directly, so that the cached rendering of the row is refreshed.
+        Args:
+            row_data (TBaseRow): a row in row_list
+            **col_values: key: column attribute name; value: new column value
+        Raises:
+            ValueError: when col_values contains undefined attribute names
+        """
+        attr_names_bad = [attr_name for attr_name in col_values if not self.row_type.is_col_attr_exist(attr_name)]
+        if attr_names_bad:
+            raise ValueError(f'Unknown attribute names in col_values: {attr_names_bad}')
+        indexes = [
+            sort_index for sort_index in self._sort_indexes.values()
+            if any(attr_name in col_values for attr_name in sort_index.order_by)
+        ]
+        indexes += [hash_index for attr_name, hash_index in self._hash_indexes.items() if attr_name in col_values]
+        indexes += [
+            aggregation for aggregation in [*self._aggregations.values(), *([self._footer[0]] if self._footer else [])]
+            if any(attr_name in col_values for attr_name in aggregation.attr_names)
+        ]
+        for index in indexes:
+            index.remove(row_data)
+        self._discard_col_disp_len([width] for width in row_data.get_render_cache().width)
+        for attr_name, value in col_values.items():
+            setattr(row_data, attr_name, value)
+        for index in indexes:
+            index.add(row_data)
+        row_data.invalidate_render_cache()
+        self._update_col_max_disp_len(row_data=row_data)
+
+    def delete_row(self, row_data: TBaseRow) -> None:
+        """ remove a row from the table, column widths shrink if the row was the widest of a column.
+        row_list is scanned to find the row, use delete_rows or delete_where to remove many rows in one pass.
+        Args:
+            row_data (TBaseRow): a row in row_list, matched by identity
+        Raises:
+            ValueError: when row_data is not in the table
+        """
+        for idx, row in enumerate(self.row_list):
+            if row is row_data:
+                break
+        else:
+            raise ValueError(f'row_data is not in the table: {row_data}')
+        del self.row_list[idx]
+        for index in self._get_indexes():
+            index.remove(row_data)
+        self._discard_col_disp_len([width] for width in row_data.get_render_cache().width)
+
+    def delete_rows(self, rows: Iterable[TBaseRow]) -> int:
+        """ remove many rows in one pass over row_list, instead of one scan per row with delete_row
+        Args:
+            rows (Iterable[TBaseRow]): rows in row_list, matched by identity
+        Raises:
+            ValueError: when one of the rows is not in the table, no row is removed then
+        Returns:
+            int: number of rows removed
+        """
+        row_ids = set(map(id, rows))
+        rows_kept, rows_removed = [], []
+        for row_data in self.row_list:
+            (rows_removed if id(row_data) in row_ids else rows_kept).append(row_data)
+        if len(rows_removed) != len(row_ids):
+            raise ValueError(f'{len(row_ids) - len(rows_removed)} of the rows are not in the table')
+        if not rows_removed:
+            return 0
+        self.row_list[:] = rows_kept
+        for index in self._get_indexes():
+            index.remove_many(rows_removed)
+        self._discard_col_disp_len(zip(*(row_data.get_render_cache().width for row_data in rows_removed)))
+        return len(rows_removed)
+
+    def delete_where(self, predicate: Callable[[TBaseRow], bool]) -> int:
+        """ remove every row for which predicate(row) is True, see delete_rows
+        Returns:
+            int: number of rows removed
+        """
+        return self.delete_rows([row_data for row_data in self.row_list if predicate(row_data)])
+
+    def _get_rows_to_show(
+            self, order_by: List[str] = None, ascending: List[bool] = None,
+            offset: int = 0, limit: Optional[int] = None, tail: Optional[int] = None,
+            ) -> Sequence[TBaseRow]:
+        """ return the rows in the requested window, see iter_table_lines """
+        _validate_window(offset, limit, tail)
+        stop = None if limit is None else offset + limit
+
+        if not order_by:
+            rows = self.row_list
+        else:
+            order_spec = self._get_order_spec(order_by, ascending)
+            sort_index = self._sort_indexes.get(order_spec)
+            if sort_index is not None:
+                if tail is not None:
+                    return sort_index.get_rows(start=max(len(sort_index) - tail, 0))
+                return sort_index.get_rows(start=offset, stop=stop)
+            if stop is not None and stop < len(self.row_list):
+                # only the first offset + limit rows are needed, nsmallest keeps the same order as a stable sort
+                with NULL_PHASE if self.stats is None else self.stats.phase('sort') as phase:
+                    phase.add(rows_sorted=len(self.row_list))
+                    return heapq.nsmallest(stop, self.row_list, key=get_sort_key_func(*order_spec))[offset:]
+            rows = self.get_sorted_rows(order_by, ascending)
+        return _slice_window(rows, offset, limit, tail)
+
+    def _get_col_disp_len_of_rows(self, rows: Iterable[TBaseRow]) -> Dict[str, int]:
+        """ return the column widths needed by the headers and the given rows only """
+        col_order = self.row_type.get_col_attr_names()
+        header_disp_len = self.row_type.get_col_header_disp_len_map()
+        col_max = [header_disp_len[attr] for attr in col_order]
+        for row_data in rows:
+            col_max = list(map(max, col_max, row_data.get_render_cache().width))
+        return dict(zip(col_order, col_max))
+
+    def iter_table_lines(
+            self, order_by: List[str] = None, ascending: List[bool] = None,
+            offset: int = 0, limit: Optional[int] = None, tail: Optional[int] = None, fit_window: bool = False,
+            max_line_width: Optional[int] = None, caps: Optional['TerminalCapabilities'] = None,
+            ) -> Iterator[str]:
+        """ yield the output lines of the table one by one: header, header separator and then every row.
+        Lines are rendered lazily, so the first line is available before the rest of the rows are formatted.
+        Args:
+            order_by (List[str], optional): see order_by in get_sorted_rows
+            ascending (List[bool], optional): see ascending in get_sorted_rows
+            offset (int, optional): number of rows skipped before the first row shown
+            limit (int, optional): max number of rows shown, all rows after offset when None
+            tail (int, optional): show the last tail rows only, cannot be used with offset or limit
+            fit_window (bool, optional): when True, column widths fit the rows shown instead of the whole table
+            max_line_width (int, optional): when given, the widest columns are cut so every line fits in
+                max_line_width display columns, columns that still do not fit are dropped from the right
+            caps (TerminalCapabilities, optional): what the lines are written to can display, colors and OSC 8
+                hyperlinks are only generated when caps allows them. Without hyperlinks, href and url columns are
+                displayed as plain columns. Defaults to get_terminal_capabilities(), a terminal of the current platform.
+        Yields:
+            str: an output line without line ending
+        """
+        caps = caps or get_terminal_capabilities()
+        data_to_show, col_disp_len = self._get_render_window(order_by, ascending, offset, limit, tail, fit_window)
+        footer = self._get_footer_render_cache()
+        col_disp_len = self._merge_footer_col_disp_len(col_disp_len, footer) or self.get_col_disp_len_map()
+        table = self._get_table_for_caps(caps, data_to_show)
+        if max_line_width is None:
+            yield from table._iter_lines(data_to_show, col_disp_len, footer, caps=caps)
+            return
+
+        col_order = table._get_col_order()
+        fitted_width = _fit_col_widths(
+            [col_disp_len[attr_name] for attr_name in col_order], [self.AUTO_FIT_MIN_COL_WIDTH] * len(col_order),
+            max_line_width, get_display_ansi_width(self.CHAR_COL_SEP),
+        )
+        fitted_col_order = col_order[:len(fitted_width)]
+        cache_col_order = self.row_type.get_col_attr_names()
+        truncate_specs = []
+        for attr_name, width in zip(fitted_col_order, fitted_width):
+            if width < col_disp_len[attr_name]:
+                config = self.row_type.get_config(attr_name)
+                truncate_specs.append((cache_col_order.index(attr_name), width, config.truncate, config.ellipsis))
+        col_disp_len = {**col_disp_len, **dict(zip(fitted_col_order, fitted_width))}
+        if len(fitted_col_order) < len(col_order):
+            table = TableView(table, data_to_show, fitted_col_order)
+        yield from table._iter_lines(data_to_show, col_disp_len, footer, truncate_specs, caps=caps)
+
+    def _iter_lines(
+            self, rows: Iterable[TBaseRow], col_disp_len: Dict[str, int], footer: Optional[RowRenderCache],
+            truncate_specs: Optional[List[TTruncateSpec]] = None, caps: Optional['TerminalCapabilities'] = None,
+            ) -> Iterator[str]:
+        """ render the header, the rows and the footer with the given column widths, cells of truncate_specs are cut
+        at render time
+        """
+        yield self.get_table_header_str(col_disp_len=col_disp_len)
+        yield self.get_table_header_sep_str(col_disp_len=col_disp_len)
+        render_line = self._get_line_renderer(caps)
+        col_width = self._get_col_width(col_disp_len)
+        if truncate_specs:
+            for row_data in rows:
+                yield render_line(_truncate_render_cache(row_data.get_render_cache(), truncate_specs), col_width)
+        else:
+            for row_data in rows:
+                yield render_line(row_data.get_render_cache(), col_width)
+        if footer is not None:
+            yield self.get_table_header_sep_str(col_disp_len=col_disp_len)
+            yield render_line(_truncate_render_cache(footer, truncate_specs) if truncate_specs else footer, col_width)
+
+    def _merge_footer_col_disp_len(
+            self, col_disp_len: Optional[Dict[str, int]], footer: Optional[RowRenderCache]
+            ) -> Optional[Dict[str, int]]:
+        """ widen col_disp_len (None for the table column widths) to fit the footer cells """
+        if footer is None:
+            return col_disp_len
+        col_disp_len = col_disp_len or self.get_col_disp_len_map()
+        footer_disp_len = dict(zip(self.row_type.get_col_attr_names(), footer.width))
+        return {attr_name: max(width, footer_disp_len[attr_name]) for attr_name, width in col_disp_len.items()}
+
+    def _get_render_window(
+            self, order_by: Optional[List[str]], ascending: Optional[List[bool]],
+            offset: int, limit: Optional[int], tail: Optional[int], fit_window: bool,
+            ) -> Tuple[Sequence[TBaseRow], Optional[Dict[str, int]]]:
+        """ return the rows to show and the column widths to use, None for the table column widths """
+        data_to_show = self._get_rows_to_show(order_by, ascending, offset=offset, limit=limit, tail=tail)
+        col_disp_len = self._get_col_disp_len_of_rows(data_to_show) if fit_window else None
+        return data_to_show, col_disp_len
+
+    def write_table(
+            self, sink: Any, order_by: List[str] = None, ascending: List[bool] = None,
+            offset: int = 0, limit: Optional[int] = None, tail: Optional[int] = None, fit_window: bool = False,
+            chunk_size: int = DEFAULT_WRITE_CHUNK_SIZE, encoding: str = 'utf-8', workers: Optional[int] = None,
+            max_line_width: Optional[int] = None, caps: Optional['TerminalCapabilities'] = None,
+            ) -> None:
+        """ stream the table to the given sink. Lines are buffered and written in chunks of about chunk_size chars, so
+        memory usage does not grow with the number of rows.
+        Args:
+            sink: a text stream (sys.stdout, open(..., 'w')), a binary stream (open(..., 'wb'), pipe, socket.makefile)
+                or a socket. Binary sinks receive each chunk encoded once with the given encoding.
+            order_by (List[str], optional): see order_by in get_sorted_rows
+            ascending (List[bool], optional): see ascending in get_sorted_rows
+            offset, limit, tail, fit_window: see iter_table_lines
+            chunk_size (int, optional): number of chars buffered before a write is issued to the sink
+            encoding (str, optional): encoding used for binary sinks
+            workers (int, optional): when greater than 1, rows are formatted and rendered in chunks of
+                DEFAULT_RENDER_TASK_ROWS rows by that many worker processes (threads on free-threaded python) and
+                written in order. Processes are started with RENDER_START_METHOD, so the calling script needs the
+                usual if __name__ == '__main__' guard. Starting the workers and sending them the rows has a cost,
+                it only pays off with several CPUs and rows that are costly to format. Falls back to rendering in
+                this process for a single chunk, or when the column configs cannot be pickled.
+            max_line_width (int, optional): see iter_table_lines, lines fitted to max_line_width are rendered in this
+                process regardless of workers
+            caps (TerminalCapabilities, optional): see iter_table_lines. Defaults to get_terminal_capabilities(sink),
+                so files, pipes and sockets receive plain text without ANSI colors or OSC 8 hyperlinks.
+        """
+        if chunk_size <= 0:
+            raise ValueError(f'invalid chunk_size: {chunk_size}')
+        if workers is not None and workers <= 0:
+            raise ValueError(f'invalid workers: {workers}')
+        write, is_binary = _get_sink_writer(sink)
+        caps = caps or get_terminal_capabilities(sink)
+
+        window = (order_by, ascending, offset, limit, tail, fit_window)
+        if workers is not None and workers > 1 and max_line_width is None:
+            chunks = self._iter_table_chunks_parallel(*window, workers=workers, caps=caps)
+        else:
+            chunks = self._iter_table_chunks(*window, chunk_size=chunk_size, max_line_width=max_line_width, caps=caps)
+        if self.stats is None:
+            for chunk in chunks:
+                write(chunk.encode(encoding) if is_binary else chunk)
+        else:
+            self._write_chunks_with_stats(chunks, write, is_binary, encoding, caps)
+
+        flush = getattr(sink, 'flush', None)
+        if callable(flush):
+            flush()
+
+    def _write_chunks_with_stats(
+            self, chunks: Iterator[str], write: Callable[[Any], Any], is_binary: bool, encoding: str,
+            caps: 'TerminalCapabilities',
+            ) -> None:
+        """ write the chunks like write_table, recording the render, cond_fmt and write phases in self.stats """
+        stats, line_end = self.stats, self.CHAR_LN
+        while True:
+            with stats.phase('render') as phase:
+                # 条件格式在渲染函数内执行，作为 render 的子阶段记录
+                match_cnt, match_sec = self.row_type._get_cond_fmt_totals()
+                chunk = next(chunks, None)
+                match_cnt_after, match_sec_after = self.row_type._get_cond_fmt_totals()
+                if match_cnt_after > match_cnt:
+                    stats.add_nested_phase(
+                        'cond_fmt', match_sec_after - match_sec, cond_fmt_evaluations=match_cnt_after - match_cnt
+                    )
+                if chunk is not None:
+                    phase.add(lines_rendered=chunk.count(line_end))
+            if chunk is None:
+                break
+            with stats.phase('write') as phase:
+                write(chunk.encode(encoding) if is_binary else chunk)
+                phase.add(chars_written=len(chunk))
+
+    def _iter_table_chunks(
+            self, order_by: Optional[List[str]], ascending: Optional[List[bool]],
+            offset: int, limit: Optional[int], tail: Optional[int], fit_window: bool, chunk_size: int,
+            max_line_width: Optional[int] = None, caps: Optional['TerminalCapabilities'] = None,
+            ) -> Iterator[str]:
+        """ yield the output lines with line endings, joined into chunks of about chunk_size chars """
+        line_end = self.CHAR_LN
+        buffer: List[str] = []
+        buffer_size = 0
+        lines = self.iter_table_lines(
+            order_by=order_by, ascending=ascending, offset=offset, limit=limit, tail=tail, fit_window=fit_window,
+            max_line_width=max_line_width, caps=caps,
+        )
+        for line in lines:
+            buffer.append(line)
+            buffer.append(line_end)
+            buffer_size += len(line) + len(line_end)
+            if buffer_size >= chunk_size:
+                yield ''.join(buffer)
+                buffer.clear()
+                buffer_size = 0
+        if buffer:
+            yield ''.join(buffer)
+
+    def _iter_table_chunks_parallel(
+            self, order_by: Optional[List[str]], ascending: Optional[List[bool]],
+            offset: int, limit: Optional[int], tail: Optional[int], fit_window: bool, workers: int,
+            caps: Optional['TerminalCapabilities'] = None,
+            ) -> Iterator[str]:
+        """ same output as _iter_table_chunks, rows are formatted and rendered by a pool of workers in chunks of
+        DEFAULT_RENDER_TASK_ROWS rows. Worker processes receive the render spec once and then the column values of
+        each chunk, so formatting, measuring and conditional formats all run in the workers.
+        Rows already formatted, e.g. rows inserted into a BaseTable, only need padding and joining, which costs about
+        as much as sending them to a worker, so they are rendered in this process.
+        """
+        caps = caps or get_terminal_capabilities()
+        data_to_show, col_disp_len = self._get_render_window(order_by, ascending, offset, limit, tail, fit_window)
+        footer = self._get_footer_render_cache()
+        col_disp_len = self._merge_footer_col_disp_len(col_disp_len, footer)
+        line_end = self.CHAR_LN
+        table = self._get_table_for_caps(caps, data_to_show)
+        header = table.get_table_header_str(col_disp_len=col_disp_len)
+        header_sep = table.get_table_header_sep_str(col_disp_len=col_disp_len)
+        col_width = table._get_col_width(col_disp_len or self.get_col_disp_len_map())
+        yield f'{header}{line_end}{header_sep}{line_end}'
+
+        if (
+                len(data_to_show) <= DEFAULT_RENDER_TASK_ROWS or not _can_format_in_worker(self.row_type)
+                or all(row_data._render_cache is not None for row_data in data_to_show)
+                ):
+            # 只有一个任务，或者没有需要排版的行，启动工作进程得不偿失
+            yield from table._iter_row_chunks(data_to_show, col_width, caps)
+        elif not getattr(sys, '_is_gil_enabled', lambda: True)():
+            yield from self._iter_row_chunks_threads(table, data_to_show, col_width, caps, workers)
+        else:
+            yield from self._iter_row_chunks_processes(table, data_to_show, col_width, caps, workers)
+        if footer is not None:
+            footer_sep = table.get_table_header_sep_str(col_disp_len=col_disp_len)
+            yield f'{footer_sep}{line_end}{table._get_line_renderer(caps)(footer, col_width)}{line_end}'
+
+    def _iter_row_chunks_threads(
+            self, table: 'BaseTable[TBaseRow]', rows: Sequence[TBaseRow], col_width: Tuple[int, ...],
+            caps: 'TerminalCapabilities', workers: int,
+            ) -> Iterator[str]:
+        """ free-threaded python: threads format and render the rows in parallel without copying anything """
+        from concurrent.futures import ThreadPoolExecutor
+
+        col_order, cache_col_order = table._get_col_order(), self.row_type.get_col_attr_names()
+        # 独立编译的渲染函数，条件格式的统计只包含工作线程
+        render_line = _compile_line_renderer(
+            [self.row_type.get_config(attr_name) for attr_name in col_order], self.CHAR_COL_SEP,
+            self.ENABLE_COLOR and caps.can_disp_color, col_idx=[cache_col_order.index(name) for name in col_order],
+            hyperlinks=caps.hyperlinks,
+        )
+        render_rows = partial(_render_rows, render_line, col_width, self.CHAR_LN)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            yield from _iter_task_results(
+                executor, (partial(render_rows, rows[start:stop]) for start, stop in _get_task_ranges(rows)), workers,
+            )
+        _add_cond_fmt_phase(self.stats, *_get_cond_fmt_totals(render_line.cond_fmt_matchers))
+
+    def _iter_row_chunks_processes(
+            self, table: 'BaseTable[TBaseRow]', rows: Sequence[TBaseRow], col_width: Tuple[int, ...],
+            caps: 'TerminalCapabilities', workers: int,
+            ) -> Iterator[str]:
+        """ worker processes format and render the rows from their column values. Falls back to rendering in this
+        process when the column configs or the values cannot be pickled.
+        """
+        import multiprocessing
+        import pickle
+        from concurrent.futures import ProcessPoolExecutor
+
+        row_type = self.row_type
+        col_order, cache_col_order = table._get_col_order(), row_type.get_col_attr_names()
+        href_attr_map = row_type._get_col_href_attr_map()
+        initargs = (
+            [row_type.get_config(attr_name) for attr_name in col_order], self.CHAR_COL_SEP,
+            self.ENABLE_COLOR and caps.can_disp_color, caps.hyperlinks,
+            [cache_col_order.index(attr_name) for attr_name in col_order], col_width, self.CHAR_LN,
+            [row_type.get_config(attr_name) for attr_name in cache_col_order],
+            [cache_col_order.index(attr_name) for attr_name in href_attr_map],
+        )
+
+        def get_task(start: int, stop: int) -> Callable[[], Tuple[str, int, float]]:
+            batch = rows[start:stop]
+            col_values = [list(map(attrgetter(attr_name), batch)) for attr_name in cache_col_order]
+            href_values = [[row_data._get_col_href(attr_name) for row_data in batch] for attr_name in href_attr_map]
+            return partial(_render_worker_values, col_values, href_values)
+
+        task_ranges = _get_task_ranges(rows)
+        first_task = get_task(*task_ranges[0])
+        try:
+            pickle.dumps((initargs, first_task.args))
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            _get_logger().warning(f'cannot render with worker processes, rendering in this process instead: {e}')
+            yield from table._iter_row_chunks(rows, col_width, caps)
+            return
+
+        mp_context = multiprocessing.get_context(self.RENDER_START_METHOD or _get_default_start_method())
+        tasks = chain([first_task], (get_task(start, stop) for start, stop in task_ranges[1:]))
+        executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=mp_context, initializer=_init_render_worker, initargs=initargs,
+        )
+        with executor:
+            for chunk, match_cnt, match_sec in _iter_task_results(executor, tasks, workers):
+                # 条件格式在工作进程内执行，不属于本进程的 render 阶段
+                _add_cond_fmt_phase(self.stats, match_cnt, match_sec)
+                yield chunk
+
+    def _iter_row_chunks(
+            self, rows: Iterable[TBaseRow], col_width: Tuple[int, ...], caps: Optional['TerminalCapabilities'] = None,
+            ) -> Iterator[str]:
+        """ render the rows in this process, in the same chunks the workers would return """
+        render_line = self._get_line_renderer(caps)
+        for batch in _iter_batches(rows, DEFAULT_RENDER_TASK_ROWS):
+            render_caches = [row_data.get_render_cache() for row_data in batch]
+            yield _render_lines(render_line, col_width, self.CHAR_LN, render_caches)
+
+    async def aiter_table_lines(
+            self, order_by: List[str] = None, ascending: List[bool] = None,
+            offset: int = 0, limit: Optional[int] = None, tail: Optional[int] = None, fit_window: bool = False,
+            max_line_width: Optional[int] = None, caps: Optional['TerminalCapabilities'] = None,
+            batch_size: int = DEFAULT_ASYNC_BATCH_LINES, executor: Optional['Executor'] = None,
+            ) -> AsyncIterator[str]:
+        """ async version of iter_table_lines for asyncio applications. Lines are rendered batch_size at a time and
+        the event loop runs other tasks between batches, so rendering a large table does not block the loop.
+        Rows are still sorted in a single step before the first line, register_sort_index(order_by) beforehand keeps
+        a large table sorted so streaming it with order_by does not stall the loop either.
+        Args:
+            order_by, ascending, offset, limit, tail, fit_window, max_line_width, caps: see iter_table_lines
+            batch_size (int, optional): number of lines rendered before the event loop gets control back
+            executor (Executor, optional): when given, batches are rendered in the executor instead of the event loop
+                thread, sorting the rows included. The table must not be changed until the iteration ends.
+        Yields:
+            str: an output line without line ending
+        """
+        import asyncio
+        if batch_size <= 0:
+            raise ValueError(f'invalid batch_size: {batch_size}')
+        loop = asyncio.get_running_loop()
+        lines = self.iter_table_lines(
+            order_by=order_by, ascending=ascending, offset=offset, limit=limit, tail=tail, fit_window=fit_window,
+            max_line_width=max_line_width, caps=caps,
+        )
+        next_batch = partial(_next_batch, lines, batch_size)
+        while True:
+            batch = next_batch() if executor is None else await loop.run_in_executor(executor, next_batch)
+            for line in batch:
+                yield line
+            if len(batch) < batch_size:
+                break
+            await asyncio.sleep(0)
+
+    async def awrite_table(
+            self, writer: Any, order_by: List[str] = None, ascending: List[bool] = None,
+            offset: int = 0, limit: Optional[int] = None, tail: Optional[int] = None, fit_window: bool = False,
+            chunk_size: int = DEFAULT_WRITE_CHUNK_SIZE, encoding: str = 'utf-8',
+            max_line_width: Optional[int] = None, caps: Optional['TerminalCapabilities'] = None,
+            executor: Optional['Executor'] = None,
+            ) -> None:
+        """ async version of write_table for asyncio applications. After each chunk of about chunk_size chars is
+        written, writer.drain() is awaited, so a slow reader pauses the rendering instead of growing the write buffer,
+        and the event loop runs other tasks before the next chunk is rendered.
+        Args:
+            writer: an asyncio.StreamWriter, which receives each chunk encoded with encoding, or any sink accepted by
+                write_table
+            order_by, ascending, offset, limit, tail, fit_window, chunk_size, encoding, max_line_width, caps:
+                see write_table
+            executor (Executor, optional): see aiter_table_lines
+        """
+        import asyncio
+        if chunk_size <= 0:
+            raise ValueError(f'invalid chunk_size: {chunk_size}')
+        drain = getattr(writer, 'drain', None)
+        if drain is not None:
+            write, is_binary = writer.write, True
+        else:
+            write, is_binary = _get_sink_writer(writer)
+        loop = asyncio.get_running_loop()
+        caps = caps or get_terminal_capabilities(writer)
+        chunks = self._iter_table_chunks(
+            order_by, ascending, offset, limit, tail, fit_window, chunk_size=chunk_size, max_line_width=max_line_width,
+            caps=caps,
+        )
+        while True:
+            chunk = next(chunks, None) if executor is None else await loop.run_in_executor(executor, next, chunks, None)
+            if chunk is None:
+                break
+            write(chunk.encode(encoding) if is_binary else chunk)
+            if drain is not None:
+                # 缓冲区未满时 drain 不会挂起，仍然要交还一次事件循环
+                await drain()
+            await asyncio.sleep(0)
+
+        flush = getattr(writer, 'flush', None)
+        if drain is None and callable(flush):
+            flush()
+
+    def export_table(
+            self, sink: Any, fmt: str = 'csv', order_by: List[str] = None, ascending: List[bool] = None,
+            offset: int = 0, limit: Optional[int] = None, tail: Optional[int] = None,
+            batch_size: int = DEFAULT_EXPORT_BATCH_SIZE, encoding: str = 'utf-8',
+            ) -> int:
+        """ stream the rows to sink as csv, tsv, jsonl, markdown or html, see table_printer_export.
+        Column order, aliases, hidden columns and datetime formats follow the row_type, no layout is rendered.
+        Args:
+            sink: text stream, binary stream or socket, see write_table
+            fmt (str, optional): one of ExportFormat: csv, tsv, jsonl, markdown, html. Defaults to 'csv'.
+            order_by (List[str], optional): see order_by in get_sorted_rows
+            ascending (List[bool], optional): see ascending in get_sorted_rows
+            offset, limit, tail: see iter_table_lines
+            batch_size (int, optional): number of rows written at a time
+            encoding (str, optional): encoding used for binary sinks
+        Returns:
+            int: number of rows exported
+        """
+        from TablePrinter.table_printer_export import export_rows  # table_printer_export imports this module
+        rows = self._get_rows_to_show(order_by, ascending, offset=offset, limit=limit, tail=tail)
+        return export_rows(
+            self.row_type, rows, sink, fmt=fmt, batch_size=batch_size, encoding=encoding,
+            col_order=self._get_export_col_order(),
+        )
 
-    def print_table(self, order_by: List[str] = None, ascending: List[bool] = None):
+    def diff(
+            self, other: 'BaseTable[TBaseRow]', key: List[str], col_names: Optional[List[str]] = None,
+            ) -> 'TableDiff[TBaseRow]':
+        """ compare the rows of this table (old) with the rows of other (new), see table_printer_diff.
+        Rows are matched on the key columns with a hash join: memory grows with the number of keys, rows are neither
+        copied nor formatted, and only the changed rows are formatted when the diff is printed.
+        Args:
+            other (BaseTable): a table or view with the same row_type
+            key (List[str]): columns identifying a row, key values must be hashable and unique in each table
+            col_names (List[str], optional): columns compared between rows with the same key.
+                Defaults to the displayed columns that are not in key.
+        Raises:
+            TypeError: when other has a different row_type
+            ValueError: when key or col_names contain undefined attribute names, or a key is not unique
+        Returns:
+            TableDiff: the added, removed and changed rows, print_table renders the changes only
+        """
+        from TablePrinter.table_printer_diff import diff_rows  # table_printer_diff imports this module
+        if other.row_type is not self.row_type:
+            raise TypeError(f'other row_type: {other.row_type} does not match {self.row_type}')
+        return diff_rows(self.row_type, self.row_list, other.row_list, key, col_names=col_names)
+
+    def _get_export_col_order(self) -> Optional[List[str]]:
+        """ return the columns written by export_table, None for row_type.get_export_col_attr_names() """
+        return None
+
+    def print_table(
+            self, order_by: List[str] = None, ascending: List[bool] = None,
+            offset: int = 0, limit: Optional[int] = None, tail: Optional[int] = None, fit_window: bool = False,
+            workers: Optional[int] = None, auto_fit: Optional[bool] = None,
+            caps: Optional['TerminalCapabilities'] = None,
+            ):
         """print the table
         Args:
             order_by (List[str], optional): see order_by in get_sorted_rows
             ascending (List[bool], optional): see ascending in get_sorted_rows
+            offset, limit, tail, fit_window: see iter_table_lines
+            workers (int, optional): see write_table
+            auto_fit (bool, optional): fit the lines to the terminal width, see max_line_width in iter_table_lines.
+                Defaults to AUTO_FIT.
+            caps (TerminalCapabilities, optional): see write_table. Defaults to get_terminal_capabilities(sys.stdout),
+                detected again when auto_fit is on so the width follows the terminal.
         """
-        logger.debug(f'data_len:{len(self.row_list)}')
-        output_lines: List[str] = [self.get_table_header_str(), self.get_table_header_sep_str()]
+        _log_debug('data_len:%s', len(self.row_list))
+        auto_fit = self.AUTO_FIT if auto_fit is None else auto_fit
+        caps = caps or get_terminal_capabilities(sys.stdout, refresh=auto_fit)
+        sink = _PrintTableSink(sys.stdout, self.CHAR_LN)
+        self.write_table(
+            sink, order_by=order_by, ascending=ascending,
+            offset=offset, limit=limit, tail=tail, fit_window=fit_window, workers=workers,
+            max_line_width=caps.width if auto_fit else None, caps=caps,
+        )
+        sink.finish()
+
+
+class TableView(BaseTable[TBaseRow]):
+    """ read-only view of some rows and columns of a table, returned by BaseTable.where and BaseTable.select.
+
+    The view holds references to the row objects of the table, rows are not copied. Column widths are the widths of
+    the table the view was created from, pass fit_window=True to fit the widths to the rows of the view instead.
+    """
+
+    def __init__(self, table: BaseTable[TBaseRow], rows: Sequence[TBaseRow], col_names: Optional[List[str]] = None):
+        self.row_type = table.row_type
+        super().__init__()
+        self._table = table
+        if col_names is None:
+            self._col_names: Optional[List[str]] = table._col_names if isinstance(table, TableView) else None
+        else:
+            col_order = table._get_col_order()
+            attr_names_bad = [attr_name for attr_name in col_names if attr_name not in col_order]
+            if not col_names or attr_names_bad:
+                raise ValueError(f'Invalid col_names: {col_names}, displayed columns are {col_order}')
+            self._col_names = list(col_names)
+        self.row_list = rows
+
+    def _get_col_disp_len(self) -> Dict[str, int]:
+        return self._table.get_col_disp_len_map()
+
+    def _get_col_order(self) -> List[str]:
+        return self.row_type.get_col_attr_names() if self._col_names is None else self._col_names
+
+    def _get_export_col_order(self) -> Optional[List[str]]:
+        return self._col_names
+
+    def insert_row(self, row_data: TBaseRow):
+        raise NotImplementedError('TableView is read-only, change the table it was created from')
+
+    def _insert_batch(self, batch: List[TBaseRow]) -> None:
+        raise NotImplementedError('TableView is read-only, change the table it was created from')
+
+    def update_row(self, row_data: TBaseRow, **col_values: Any) -> None:
+        raise NotImplementedError('TableView is read-only, change the table it was created from')
+
+    def delete_row(self, row_data: TBaseRow) -> None:
+        raise NotImplementedError('TableView is read-only, change the table it was created from')
+
+    def delete_rows(self, rows: Iterable[TBaseRow]) -> int:
+        raise NotImplementedError('TableView is read-only, change the table it was created from')
+
+    def delete_where(self, predicate: Callable[[TBaseRow], bool]) -> int:
+        raise NotImplementedError('TableView is read-only, change the table it was created from')
+
+
+def _next_batch(lines: Iterator[str], batch_size: int) -> List[str]:
+    return list(islice(lines, batch_size))
+
+
+def _render_lines(
+        render_line: Callable[[RowRenderCache, Sequence[int]], str], col_width: Tuple[int, ...], line_end: str,
+        render_caches: List[RowRenderCache],
+        ) -> str:
+    """ render the given rows into one chunk of lines, each followed by line_end """
+    return ''.join([render_line(render_cache, col_width) + line_end for render_cache in render_caches])
+
+
+def _render_rows(
+        render_line: Callable[[RowRenderCache, Sequence[int]], str], col_width: Tuple[int, ...], line_end: str,
+        rows: Sequence['BaseRow'],
+        ) -> str:
+    """ format the given rows if needed and render them into one chunk of lines """
+    return _render_lines(render_line, col_width, line_end, [row_data.get_render_cache() for row_data in rows])
+
+
+def _get_task_ranges(rows: Sequence[Any]) -> List[Tuple[int, int]]:
+    """ return the (start, stop) of the render tasks, DEFAULT_RENDER_TASK_ROWS rows each """
+    return [
+        (start, min(start + DEFAULT_RENDER_TASK_ROWS, len(rows)))
+        for start in range(0, len(rows), DEFAULT_RENDER_TASK_ROWS)
+    ]
+
+
+def _iter_task_results(executor: 'Executor', tasks: Iterable[Callable[[], Any]], workers: int) -> Iterator[Any]:
+    """ submit the tasks and yield their results in submission order """
+    # 限制未完成任务数量，按提交顺序写出，内存占用与总行数无关
+    pending = deque()
+    for task in tasks:
+        pending.append(executor.submit(task))
+        if len(pending) >= workers * 2:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _get_default_start_method() -> str:
+    """ start method of the render worker processes when BaseTable.RENDER_START_METHOD is None.
+    fork is avoided, forking a process that runs threads is unsafe.
+    """
+    import multiprocessing
+    return 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def _can_format_in_worker(row_type: Type['BaseRow']) -> bool:
+    """ rows are formatted in the workers from their column values unless their class formats its cells itself """
+    return all(
+        getattr(row_type, method_name) is getattr(BaseRow, method_name)
+        for method_name in ('get_col_value_disp', 'get_render_cache', '_wrap_col_value_href', '_get_col_href')
+    )
+
 
-        data_to_show = self.row_list if not order_by else self.get_sorted_rows(order_by, ascending)
+def _get_cond_fmt_totals(matchers: Iterable[CondFmtMatcher]) -> Tuple[int, float]:
+    """ return the number of conditional format evaluations of the matchers and the seconds they took """
+    matchers = list(matchers)
+    return sum(matcher.match_cnt for matcher in matchers), sum(matcher.match_sec for matcher in matchers)
 
-        for row_data in data_to_show:
-            output_lines.append(self.get_table_line_str(row_data))
 
-        output_str = self.CHAR_LN.join(output_lines)
-        print(output_str, '\n', sep='')
+def _add_cond_fmt_phase(stats: Optional[TableStats], match_cnt: int, match_sec: float) -> None:
+    """ record conditional formats evaluated outside this thread, they are not part of the running phase """
+    if stats is not None and match_cnt:
+        stats.add_phase('cond_fmt', match_sec, cond_fmt_evaluations=match_cnt)
+
+
+# 渲染进程内的状态，由 _init_render_worker 在每个进程启动时设置一次
+_worker_render_args: Optional[Tuple[Callable[[RowRenderCache, Sequence[int]], str], Tuple[int, ...], str]] = None
+_worker_format_args: Optional[Tuple[List[ColumnConfig], List[int]]] = None
+
+
+def _init_render_worker(
+        col_config: List[ColumnConfig], col_sep: str, can_disp_color: bool, hyperlinks: bool, col_idx: List[int],
+        col_width: Tuple[int, ...], line_end: str, cache_col_config: List[ColumnConfig], href_idx: List[int],
+        ) -> None:
+    """ initializer of the render worker processes, compiles the line renderer once per process.
+    cache_col_config is the config of every column of the render cache, href_idx the index of the columns with href.
+    """
+    global _worker_render_args, _worker_format_args
+    render_line = _compile_line_renderer(col_config, col_sep, can_disp_color, col_idx=col_idx, hyperlinks=hyperlinks)
+    _worker_render_args = (render_line, col_width, line_end)
+    _worker_format_args = (cache_col_config, href_idx)
+
+
+def _render_worker_values(
+        col_values: List[List[Any]], href_values: List[List[Optional[str]]],
+        ) -> Tuple[str, int, float]:
+    """ format and measure one chunk from its column values like BaseRow.get_render_cache, then render it.
+    Returns the lines and the conditional formats evaluated for them: (chunk, evaluations, seconds).
+    """
+    render_line, col_width, line_end = _worker_render_args
+    col_configs, href_idx = _worker_format_args
+    col_disp = [_format_col_values(values, config) for values, config in zip(col_values, col_configs)]
+    col_true = list(col_disp)
+    for idx, hrefs in zip(href_idx, href_values):
+        col_true[idx] = [cell if href is None else _wrap_href(cell, href) for cell, href in zip(col_disp[idx], hrefs)]
+    col_disp_width = [list(map(get_display_ansi_width, disp)) for disp in col_disp]
+    render_caches = list(map(RowRenderCache, zip(*col_disp), zip(*col_true), zip(*col_disp_width)))
+
+    match_cnt, match_sec = _get_cond_fmt_totals(render_line.cond_fmt_matchers)
+    chunk = _render_lines(render_line, col_width, line_end, render_caches)
+    match_cnt_after, match_sec_after = _get_cond_fmt_totals(render_line.cond_fmt_matchers)
+    return chunk, match_cnt_after - match_cnt, match_sec_after - match_sec
+
+
+def _validate_window(offset: int, limit: Optional[int], tail: Optional[int]) -> None:
+    if offset < 0 or (limit is not None and limit < 0) or (tail is not None and tail < 0):
+        raise ValueError(f'invalid window: offset={offset}, limit={limit}, tail={tail}')
+    if tail is not None and (offset or limit is not None):
+        raise ValueError('tail cannot be used together with offset or limit')
+
+
+def _slice_window(rows: Sequence[Any], offset: int, limit: Optional[int], tail: Optional[int]) -> Sequence[Any]:
+    """ return rows[offset:offset + limit], or the last tail rows when tail is given """
+    if tail is not None:
+        return rows[max(len(rows) - tail, 0):]
+    if offset or limit is not None:
+        return rows[offset:None if limit is None else offset + limit]
+    return rows
+
+
+def _iter_batches(iterable: Iterable[Any], batch_size: int) -> Iterator[List[Any]]:
+    if batch_size <= 0:
+        raise ValueError(f'invalid batch_size: {batch_size}')
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _validate_record_batch(field_names: List[str], batch: List[TRecord]) -> None:
+    """ tuple records need exactly one value per field name """
+    record_lens_bad = {
+        len(record) for record in batch if not isinstance(record, dict) and len(record) != len(field_names)
+    }
+    if record_lens_bad:
+        raise ValueError(f'record length: {record_lens_bad} does not match field_names length: {len(field_names)}')
+
+
+def _get_sink_writer(sink: Any) -> Tuple[Callable[[Any], Any], bool]:
+    """ return the write function of the given sink and whether the sink expects bytes
+    Args:
+        sink: text stream, binary stream or socket
+    Raises:
+        TypeError: when sink has neither write nor sendall
+    Returns:
+        Tuple[Callable, bool]: (write function, True if sink is binary)
+    """
+    if isinstance(sink, io.TextIOBase):
+        return sink.write, False
+    if isinstance(sink, (io.RawIOBase, io.BufferedIOBase)):
+        return sink.write, True
+    if hasattr(sink, 'write'):
+        # 非标准 io 对象，根据 mode 判断是否为二进制
+        return sink.write, 'b' in getattr(sink, 'mode', '')
+    if hasattr(sink, 'sendall'):
+        # socket
+        return sink.sendall, True
+    raise TypeError(f'sink type: {type(sink)} is not writable')
+
+
+class _PrintTableSink:
+    """ text sink of print_table: lines are separated by line_end, the last line ends with a plain newline and is
+    followed by an empty line, the same output as printing the lines joined by line_end
+    """
+
+    def __init__(self, stream: Any, line_end: str):
+        self._stream = stream
+        self._line_end = line_end
+        # 最后一行的换行符先不写，留给 finish 替换
+        self._line_end_pending = False
+
+    def write(self, text: str) -> None:
+        if self._line_end_pending:
+            self._stream.write(self._line_end)
+        self._line_end_pending = text.endswith(self._line_end)
+        self._stream.write(text[:-len(self._line_end)] if self._line_end_pending else text)
+
+    def flush(self) -> None:
+        self._stream.flush()
+
+    def finish(self) -> None:
+        self._stream.write('\n\n')
 
 
 _ansi_color_supported: Optional[bool] = None
@@ -682,7 +2712,7 @@ def _win32_enable_vt_processing() -> bool:
         # 尝试启用
         new_mode = mode.value | ENABLE_VIRTUAL_TERMINAL_PROCESSING
         if kernel32.SetConsoleMode(handle, new_mode):
-            logger.debug('已通过 SetConsoleMode 启用 ENABLE_VIRTUAL_TERMINAL_PROCESSING')
+            _log_debug('已通过 SetConsoleMode 启用 ENABLE_VIRTUAL_TERMINAL_PROCESSING')
             return True
 
         # 启用失败
@@ -691,11 +2721,22 @@ def _win32_enable_vt_processing() -> bool:
         return False
 
 
+_href_supported: Optional[bool] = None
+
+
 def can_display_href() -> bool:
-    """ check if the current environment can display href
+    """ check if the current environment can display href. The result is cached, the environment is only checked on
+    the first call.
     Returns:
         bool: True if href is supported
     """
+    global _href_supported
+    if _href_supported is None:
+        _href_supported = _detect_href_support()
+    return _href_supported
+
+
+def _detect_href_support() -> bool:
     if sys.platform == 'win32':
         if 'WT_SESSION' in os.environ:
             return True
@@ -710,13 +2751,94 @@ def can_display_href() -> bool:
         raise NotImplementedError("Unsupported platform")
 
 
-def get_display_ansi_width(s: str) -> int:
-    """ return the display length of the given string. Any wide characters in the input string takes 2 spaces """
-    length = 0
-    for char in s:
-        # East_Asian_Width 'F'(Fullwidth) and 'W'(Wide) occupy 2 terminal columns
-        if unicodedata.east_asian_width(char) in ('F', 'W'):
-            length += 2
-        else:
-            length += 1
-    return length
+COLOR_DEPTH_NONE = 0
+COLOR_DEPTH_256 = 256
+COLOR_DEPTH_TRUE_COLOR = 1 << 24
+
+
+class TerminalCapabilities(NamedTuple):
+    """ what an output stream can display. Detected once per stream by get_terminal_capabilities and passed to the
+    rendering, so rendering a row does not check the platform or the environment.
+    Use _replace to override a detected value, e.g. caps._replace(color_depth=COLOR_DEPTH_NONE).
+
+    Attributes:
+        color_depth: number of colors, COLOR_DEPTH_NONE when no ANSI escape sequence may be written
+        hyperlinks: whether href columns are written as OSC 8 hyperlinks
+        isatty: whether the stream is a terminal
+        width: width of the terminal in display columns, used by auto-fit
+        encoding: encoding of the stream
+    """
+    color_depth: int = COLOR_DEPTH_NONE
+    hyperlinks: bool = False
+    isatty: bool = False
+    width: int = 80
+    encoding: str = 'utf-8'
+
+    @property
+    def can_disp_color(self) -> bool:
+        return self.color_depth > COLOR_DEPTH_NONE
+
+
+# 不是终端的输出 (文件、管道、socket): 纯文本
+PLAIN_TEXT_CAPABILITIES = TerminalCapabilities()
+
+_platform_capabilities: Optional[TerminalCapabilities] = None
+# stream 被回收后自动移除
+_stream_capabilities: 'weakref.WeakKeyDictionary[Any, TerminalCapabilities]' = weakref.WeakKeyDictionary()
+
+
+def get_terminal_capabilities(stream: Any = None, refresh: bool = False) -> TerminalCapabilities:
+    """ return the capabilities of an output stream, detected on the first call for the stream and cached.
+    Args:
+        stream (optional): the stream written to. When None, a terminal of the current platform is assumed, which is
+            what iter_table_lines renders for when no stream is known.
+        refresh (bool, optional): detect again, e.g. after the terminal is resized
+    Returns:
+        TerminalCapabilities: PLAIN_TEXT_CAPABILITIES (apart from width and encoding) when the stream is not a terminal
+    """
+    global _platform_capabilities
+    if stream is None:
+        if _platform_capabilities is None or refresh:
+            _platform_capabilities = TerminalCapabilities(
+                color_depth=_detect_color_depth(), hyperlinks=can_display_href(), isatty=True,
+                width=_get_terminal_width(), encoding=getattr(sys.stdout, 'encoding', None) or 'utf-8',
+            )
+        return _platform_capabilities
+    try:
+        caps = None if refresh else _stream_capabilities.get(stream)
+        if caps is None:
+            caps = _stream_capabilities[stream] = detect_terminal_capabilities(stream)
+    except TypeError:
+        # 不能弱引用或者不可 hash 的 stream，每次都检测
+        caps = detect_terminal_capabilities(stream)
+    return caps
+
+
+def detect_terminal_capabilities(stream: Any) -> TerminalCapabilities:
+    """ detect the capabilities of an output stream without caching, see get_terminal_capabilities """
+    try:
+        isatty = bool(stream.isatty())
+    except (AttributeError, ValueError, OSError):
+        # 没有 isatty 或者 stream 已关闭
+        isatty = False
+    encoding = getattr(stream, 'encoding', None) or 'utf-8'
+    if not isatty:
+        return PLAIN_TEXT_CAPABILITIES._replace(width=_get_terminal_width(), encoding=encoding)
+    return TerminalCapabilities(
+        color_depth=_detect_color_depth(), hyperlinks=can_display_href(), isatty=True,
+        width=_get_terminal_width(), encoding=encoding,
+    )
+
+
+def _detect_color_depth() -> int:
+    """ return the color depth of the terminal of the current platform, see https://no-color.org for NO_COLOR """
+    if 'NO_COLOR' in os.environ or os.environ.get('TERM') == 'dumb' or not can_display_ansi_color():
+        return COLOR_DEPTH_NONE
+    if os.environ.get('COLORTERM', '').lower() in ('truecolor', '24bit'):
+        return COLOR_DEPTH_TRUE_COLOR
+    return COLOR_DEPTH_256
+
+
+def _get_terminal_width() -> int:
+    import shutil
+    return shutil.get_terminal_size().columns
@@ -0,0 +1,511 @@
+from array import array
+from collections.abc import Sequence
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from TablePrinter.table_printer import (
+    BaseTable, TableView, TBaseRow, TerminalCapabilities, TRecord, _slice_window, _validate_record_batch,
+    _validate_window, get_display_ansi_width,
+)
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, columns fall back to the stdlib array module
+    np = None
+
+_EPOCH = datetime(1970, 1, 1)
+_ONE_MICROSECOND = timedelta(microseconds=1)
+
+
+def _none_first_key(value: Any) -> tuple:
+    """ sort key that orders None before any other value instead of raising TypeError """
+    return (value is not None, value)
+
+
+class _Column:
+    """ one contiguous storage per column. Subclasses decide the physical layout. """
+
+    def __init__(self, disp_fmt: Optional[str] = None):
+        self.disp_fmt = disp_fmt
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def accepts(self, value: Any) -> bool:
+        """ return True if value can be stored without changing the column layout """
+        raise NotImplementedError
+
+    def append(self, value: Any) -> None:
+        raise NotImplementedError
+
+    def extend(self, values: List[Any]) -> None:
+        for value in values:
+            self.append(value)
+
+    def get(self, idx: int) -> Any:
+        raise NotImplementedError
+
+    def values(self, start: int = 0, stop: Optional[int] = None) -> List[Any]:
+        """ return the python values in [start, stop) """
+        return [self.get(idx) for idx in range(start, len(self) if stop is None else stop)]
+
+    def to_disp(self, value: Any) -> str:
+        """ same formatting as BaseRow.get_col_value_disp """
+        if self.disp_fmt and isinstance(value, datetime):
+            return value.strftime(self.disp_fmt)
+        return str(value)
+
+    def max_disp_width(self, start: int = 0) -> int:
+        """ return the max display width of the values from start to the end of the column """
+        if start >= len(self):
+            return 0
+        return max(map(get_display_ansi_width, map(self.to_disp, self.values(start))))
+
+    def distinct_mask(self, predicate: Callable[[Any], bool]) -> List[bool]:
+        """ evaluate predicate once per distinct value and return the per-row match mask """
+        cache: Dict[Any, bool] = {}
+        mask = []
+        for value in self.values():
+            try:
+                matched = cache[value]
+            except KeyError:
+                matched = cache[value] = bool(predicate(value))
+            except TypeError:  # unhashable value
+                matched = bool(predicate(value))
+            mask.append(matched)
+        return mask
+
+    def sort_ranks(self) -> Sequence:
+        """ return one int per row, ordered the same way as the values (None first) """
+        vals = self.values()
+        order = sorted(range(len(vals)), key=lambda idx: _none_first_key(vals[idx]))
+        ranks = [0] * len(vals)
+        rank, prev = -1, object()
+        for idx in order:
+            if rank < 0 or vals[idx] != prev:
+                rank += 1
+                prev = vals[idx]
+            ranks[idx] = rank
+        return ranks
+
+
+class _ObjectColumn(_Column):
+    """ fallback layout: a plain list of python objects """
+
+    def __init__(self, disp_fmt: Optional[str] = None, data: Optional[List[Any]] = None):
+        super().__init__(disp_fmt)
+        self.data: List[Any] = data if data is not None else []
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def accepts(self, value: Any) -> bool:
+        return True
+
+    def append(self, value: Any) -> None:
+        self.data.append(value)
+
+    def extend(self, values: List[Any]) -> None:
+        self.data.extend(values)
+
+    def get(self, idx: int) -> Any:
+        return self.data[idx]
+
+    def values(self, start: int = 0, stop: Optional[int] = None) -> List[Any]:
+        return self.data[start:stop]
+
+
+class _NumericColumn(_Column):
+    """ int or float values packed in an array('q') / array('d'), exposed to numpy without copy """
+    TYPECODES = {int: 'q', float: 'd'}
+    NP_DTYPES = {'q': 'int64', 'd': 'float64'}
+
+    def __init__(self, value_type: type, disp_fmt: Optional[str] = None):
+        super().__init__(disp_fmt)
+        self.value_type = value_type
+        self.data = array(self.TYPECODES[value_type])
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def accepts(self, value: Any) -> bool:
+        if type(value) is not self.value_type:
+            return False
+        if self.value_type is int and not (-2 ** 63 <= value < 2 ** 63):
+            return False
+        return True
+
+    def append(self, value: Any) -> None:
+        self.data.append(value)
+
+    def extend(self, values: List[Any]) -> None:
+        self.data.extend(values)
+
+    def get(self, idx: int) -> Any:
+        return self.data[idx]
+
+    def values(self, start: int = 0, stop: Optional[int] = None) -> List[Any]:
+        return self.data[start:stop].tolist()
+
+    def as_numpy(self):
+        return np.frombuffer(self.data, dtype=self.NP_DTYPES[self.data.typecode])
+
+    def max_disp_width(self, start: int = 0) -> int:
+        if start >= len(self):
+            return 0
+        if np is not None and self.value_type is int:
+            # digits of int64 values computed on the whole segment at once
+            seg = self.as_numpy()[start:]
+            return int(np.char.str_len(seg.astype(str)).max())
+        return max(map(len, map(str, self.values(start))))
+
+    def distinct_mask(self, predicate: Callable[[Any], bool]) -> List[bool]:
+        if np is None:
+            return super().distinct_mask(predicate)
+        uniques, inverse = np.unique(self.as_numpy(), return_inverse=True)
+        matched = np.fromiter((bool(predicate(v)) for v in uniques.tolist()), dtype=bool, count=len(uniques))
+        return matched[inverse].tolist()
+
+    def sort_ranks(self) -> Sequence:
+        if np is None:
+            return super().sort_ranks()
+        return np.unique(self.as_numpy(), return_inverse=True)[1]
+
+
+class _DatetimeColumn(_NumericColumn):
+    """ naive datetime values stored as int64 microseconds since epoch (numpy datetime64[us] compatible) """
+
+    def __init__(self, disp_fmt: Optional[str] = None):
+        super().__init__(int, disp_fmt)
+
+    def accepts(self, value: Any) -> bool:
+        return type(value) is datetime and value.tzinfo is None
+
+    def append(self, value: Any) -> None:
+        self.data.append((value - _EPOCH) // _ONE_MICROSECOND)
+
+    def extend(self, values: List[Any]) -> None:
+        self.data.extend([(value - _EPOCH) // _ONE_MICROSECOND for value in values])
+
+    def get(self, idx: int) -> Any:
+        return _EPOCH + timedelta(microseconds=self.data[idx])
+
+    def values(self, start: int = 0, stop: Optional[int] = None) -> List[Any]:
+        return [_EPOCH + timedelta(microseconds=us) for us in self.data[start:stop]]
+
+    def as_datetime64(self):
+        return self.as_numpy().view('datetime64[us]')
+
+    def max_disp_width(self, start: int = 0) -> int:
+        return _Column.max_disp_width(self, start)
+
+    def distinct_mask(self, predicate: Callable[[Any], bool]) -> List[bool]:
+        return _Column.distinct_mask(self, predicate)
+
+
+class _DictEncodedColumn(_Column):
+    """ str values stored as int codes into a dictionary of distinct values """
+
+    def __init__(self, disp_fmt: Optional[str] = None):
+        super().__init__(disp_fmt)
+        self.codes = array('I')
+        self.dictionary: List[Any] = []
+        self.code_map: Dict[Any, int] = {}
+        self.code_widths: List[int] = []  # display width per dictionary entry, measured once
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def accepts(self, value: Any) -> bool:
+        try:
+            hash(value)
+        except TypeError:
+            return False
+        return True
+
+    def append(self, value: Any) -> None:
+        code = self.code_map.get(value)
+        if code is None:
+            code = self.code_map[value] = len(self.dictionary)
+            self.dictionary.append(value)
+            self.code_widths.append(get_display_ansi_width(self.to_disp(value)))
+        self.codes.append(code)
+
+    def get(self, idx: int) -> Any:
+        return self.dictionary[self.codes[idx]]
+
+    def values(self, start: int = 0, stop: Optional[int] = None) -> List[Any]:
+        dictionary = self.dictionary
+        return [dictionary[code] for code in self.codes[start:stop]]
+
+    def max_disp_width(self, start: int = 0) -> int:
+        if start >= len(self):
+            return 0
+        if start == 0:
+            # append only, every dictionary entry is referenced by at least one row
+            return max(self.code_widths)
+        return max(self.code_widths[code] for code in set(self.codes[start:]))
+
+    def distinct_mask(self, predicate: Callable[[Any], bool]) -> List[bool]:
+        matched = [bool(predicate(value)) for value in self.dictionary]
+        if np is not None:
+            return np.asarray(matched, dtype=bool)[np.frombuffer(self.codes, dtype=np.uint32)].tolist()
+        return [matched[code] for code in self.codes]
+
+    def sort_ranks(self) -> Sequence:
+        order = sorted(range(len(self.dictionary)), key=lambda code: _none_first_key(self.dictionary[code]))
+        rank_of_code = [0] * len(self.dictionary)
+        for rank, code in enumerate(order):
+            rank_of_code[code] = rank
+        if np is not None:
+            return np.asarray(rank_of_code, dtype=np.int64)[np.frombuffer(self.codes, dtype=np.uint32)]
+        return [rank_of_code[code] for code in self.codes]
+
+
+def _new_column(value_type: Any, disp_fmt: Optional[str]) -> _Column:
+    if value_type is int or value_type is float:
+        return _NumericColumn(value_type, disp_fmt)
+    if value_type is datetime:
+        return _DatetimeColumn(disp_fmt)
+    if value_type is str:
+        return _DictEncodedColumn(disp_fmt)
+    return _ObjectColumn(disp_fmt)
+
+
+class _ColumnarRowView(Sequence):
+    """ read-only sequence of rows materialized from the columns on access """
+
+    def __init__(self, table: 'ColumnarTable', indices: Optional[Sequence] = None):
+        self._table = table
+        self._indices = indices
+
+    def __len__(self) -> int:
+        return len(self._indices) if self._indices is not None else self._table.row_count
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            indices = range(self._table.row_count) if self._indices is None else self._indices
+            return _ColumnarRowView(self._table, indices[idx])
+        if self._indices is not None:
+            idx = self._indices[idx]
+        elif idx < 0:
+            idx += self._table.row_count
+        return self._table.get_row(idx)
+
+    def __iter__(self):
+        indices = range(self._table.row_count) if self._indices is None else self._indices
+        get_row = self._table.get_row
+        for idx in indices:
+            yield get_row(int(idx))
+
+
+class ColumnarTable(BaseTable[TBaseRow]):
+    """ BaseTable that keeps one contiguous storage per column instead of one row object per row.
+
+    The row_type is still the schema definition: every dataclass field becomes a column. int/float/naive datetime
+    columns are packed arrays (numpy views when numpy is installed), str columns are dictionary encoded, everything
+    else falls back to a list. A column falls back to a list as soon as it receives a value that does not fit its
+    layout (e.g. None in an int column).
+
+    Rows are not kept after insert_row: row_list is a read-only view that materializes row objects on access, so
+    mutating a row after insertion does not change the table.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._field_names: List[str] = self.row_type.get_record_field_names()
+        self._columns: Dict[str, _Column] = {}
+        self._row_count: int = 0
+        self._width_synced_count: int = 0
+        super().__init__(*args, **kwargs)
+
+    @property
+    def row_count(self) -> int:
+        return self._row_count
+
+    @property
+    def row_list(self) -> _ColumnarRowView:
+        return _ColumnarRowView(self)
+
+    @row_list.setter
+    def row_list(self, rows: List[TBaseRow]) -> None:
+        self._columns = {name: self._new_column(name) for name in self._field_names}
+        self._row_count = 0
+        self._width_synced_count = 0
+        for row_data in rows:
+            self.insert_row(row_data)
+
+    def _new_column(self, attr_name: str) -> _Column:
+        value_type = self.row_type.__dataclass_fields__[attr_name].type
+        disp_fmt = None
+        if self.row_type.is_col_attr_exist(attr_name):
+            disp_fmt = self.row_type.get_config(attr_name).format
+        return _new_column(value_type, disp_fmt)
+
+    def _append_value(self, attr_name: str, value: Any) -> None:
+        column = self._columns[attr_name]
+        if not column.accepts(value):
+            column = self._columns[attr_name] = _ObjectColumn(column.disp_fmt, column.values())
+        column.append(value)
+
+    def _extend_values(self, attr_name: str, values: List[Any]) -> None:
+        column = self._columns[attr_name]
+        if not all(map(column.accepts, values)):
+            column = self._columns[attr_name] = _ObjectColumn(column.disp_fmt, column.values())
+        column.extend(values)
+
+    def _sync_col_max_disp_len(self) -> None:
+        """ measure the rows inserted since the last sync, one pass per column """
+        if self._width_synced_count == self._row_count:
+            return
+        start = self._width_synced_count
+        col_max_disp_len = {}
+        for attr_name in self.row_type.get_col_attr_names():
+            width = self._columns[attr_name].max_disp_width(start)
+            max_width = self.row_type.get_config(attr_name).max_width
+            # 超过 max_width 的值在渲染时会被截断
+            col_max_disp_len[attr_name] = width if max_width is None else min(width, max_width)
+        self._merge_col_max_disp_len(col_max_disp_len)
+        self._width_synced_count = self._row_count
+
+    def _update_col_max_disp_len(self, row_data: TBaseRow) -> None:
+        # widths are measured lazily per column by _sync_col_max_disp_len
+        pass
+
+    def get_col_disp_len_map(self) -> Dict[str, int]:
+        self._sync_col_max_disp_len()
+        return super().get_col_disp_len_map()
+
+    def get_column(self, attr_name: str) -> List[Any]:
+        """ return the values of a column as a python list """
+        if attr_name not in self._columns:
+            raise ValueError(f'Unknown column: {attr_name}')
+        return self._columns[attr_name].values()
+
+    def get_row(self, idx: int) -> TBaseRow:
+        """ materialize the row at the given position """
+        if not 0 <= idx < self._row_count:
+            raise IndexError(f'row index out of range: {idx}')
+        return self.row_type(**{name: column.get(idx) for name, column in self._columns.items()})
+
+    def insert_row(self, row_data: TBaseRow):
+        """ split row_data into the column storages """
+        if type(row_data) is not self.row_type:
+            raise TypeError(f'row_data type: {type(row_data)} does not match {self.row_type}')
+        for attr_name in self._field_names:
+            self._append_value(attr_name, getattr(row_data, attr_name))
+        self._row_count += 1
+        for index in self._get_indexes():
+            index.add(row_data)
+
+    def _insert_batch(self, batch: List[TBaseRow]) -> None:
+        for attr_name in self._field_names:
+            self._extend_values(attr_name, [getattr(row_data, attr_name) for row_data in batch])
+        self._row_count += len(batch)
+        for index in self._get_indexes():
+            index.add_many(batch)
+
+    def _insert_record_batch(self, field_names: List[str], batch: List[TRecord]) -> None:
+        if (
+                field_names != self._field_names or any(isinstance(record, dict) for record in batch)
+                or self._get_indexes()
+        ):
+            # dict records and partial records need the dataclass defaults, aggregations need row objects
+            super()._insert_record_batch(field_names, batch)
+            return
+        _validate_record_batch(field_names, batch)
+        # full tuple records are transposed straight into the columns without creating row objects
+        for attr_name, values in zip(self._field_names, zip(*batch)):
+            self._extend_values(attr_name, list(values))
+        self._row_count += len(batch)
+
+    def update_row(self, row_data: TBaseRow, **col_values: Any) -> None:
+        raise NotImplementedError('rows of ColumnarTable are materialized copies and cannot be updated in place')
+
+    def delete_row(self, row_data: TBaseRow) -> None:
+        raise NotImplementedError('ColumnarTable is append only')
+
+    def delete_rows(self, rows: Iterable[TBaseRow]) -> int:
+        raise NotImplementedError('ColumnarTable is append only')
+
+    def delete_where(self, predicate: Callable[[TBaseRow], bool]) -> int:
+        raise NotImplementedError('ColumnarTable is append only')
+
+    def register_sort_index(self, order_by: List[str], ascending: Optional[List[bool]] = None):
+        raise NotImplementedError('ColumnarTable sorts whole columns, use get_sorted_indices instead')
+
+    def create_hash_index(self, attr_name: str):
+        raise NotImplementedError('ColumnarTable filters whole columns, use where or filter_indices instead')
+
+    def where(self, predicate: Optional[Callable[[TBaseRow], bool]] = None, **col_values: Any) -> TableView[TBaseRow]:
+        """ see BaseTable.where. Equality conditions are evaluated once per distinct value of each column, the view
+        materializes the matching rows on access.
+        """
+        attr_names_bad = [attr_name for attr_name in col_values if attr_name not in self._columns]
+        if attr_names_bad:
+            raise ValueError(f'Unknown attribute names in col_values: {attr_names_bad}')
+        indices: Optional[List[int]] = None
+        for attr_name, value in col_values.items():
+            matched = self.filter_indices(attr_name, lambda col_value, _value=value: col_value == _value)
+            indices = matched if indices is None else sorted(set(indices).intersection(matched))
+        rows = _ColumnarRowView(self, indices)
+        if predicate is not None:
+            rows = [row_data for row_data in rows if predicate(row_data)]
+        return TableView(self, rows)
+
+    def filter_indices(self, attr_name: str, predicate: Callable[[Any], bool]) -> List[int]:
+        """ return the positions of the rows whose attr_name value matches predicate.
+        predicate is evaluated once per distinct value of the column, not once per row.
+        """
+        if attr_name not in self._columns:
+            raise ValueError(f'Unknown column: {attr_name}')
+        mask = self._columns[attr_name].distinct_mask(predicate)
+        return [idx for idx, matched in enumerate(mask) if matched]
+
+    def filter_rows(self, attr_name: str, predicate: Callable[[Any], bool]) -> _ColumnarRowView:
+        """ return a row view of the rows whose attr_name value matches predicate """
+        return _ColumnarRowView(self, self.filter_indices(attr_name, predicate))
+
+    def get_sorted_indices(self, order_by: List[str], ascending: Optional[List[bool]] = None) -> List[int]:
+        """ return the row positions sorted by order_by. Arguments are the same as get_sorted_rows.
+        Each column is turned into an int rank array once, then all keys are sorted in a single stable pass.
+        """
+        order_by, ascending = self._get_order_spec(order_by, ascending)
+        rank_keys = [self._columns[attr_name].sort_ranks() for attr_name in order_by]
+        if np is not None:
+            # np.lexsort is stable and uses the last key as the primary key
+            keys = [np.asarray(ranks, dtype=np.int64) * (1 if asc else -1) for ranks, asc in zip(rank_keys, ascending)]
+            return np.lexsort(keys[::-1]).tolist()
+        signed = [ranks if asc else [-rank for rank in ranks] for ranks, asc in zip(rank_keys, ascending)]
+        return sorted(range(self._row_count), key=list(zip(*signed)).__getitem__)
+
+    def get_sorted_rows(self, order_by: List[str], ascending: Optional[List[bool]] = None) -> _ColumnarRowView:
+        """ see BaseTable.get_sorted_rows. Sorting runs on whole columns and None is ordered first. """
+        return _ColumnarRowView(self, self.get_sorted_indices(order_by, ascending))
+
+    def _get_rows_to_show(
+            self, order_by: List[str] = None, ascending: List[bool] = None,
+            offset: int = 0, limit: Optional[int] = None, tail: Optional[int] = None,
+            ) -> _ColumnarRowView:
+        if not order_by:
+            return super()._get_rows_to_show(offset=offset, limit=limit, tail=tail)
+        # sort the positions, then materialize only the rows in the window
+        _validate_window(offset, limit, tail)
+        return _ColumnarRowView(self, _slice_window(self.get_sorted_indices(order_by, ascending), offset, limit, tail))
+
+    def get_table_header_str(self, col_disp_len: Optional[Dict[str, int]] = None) -> str:
+        self._sync_col_max_disp_len()
+        return super().get_table_header_str(col_disp_len=col_disp_len)
+
+    def get_table_line_sep_str(
+            self, sep_h: str = None, sep_v: str = None, dense: bool = True,
+            col_disp_len: Optional[Dict[str, int]] = None,
+            ) -> str:
+        self._sync_col_max_disp_len()
+        return super().get_table_line_sep_str(sep_h=sep_h, sep_v=sep_v, dense=dense, col_disp_len=col_disp_len)
+
+    def get_table_line_str(
+            self, row_data: TBaseRow, col_disp_len: Optional[Dict[str, int]] = None,
+            caps: Optional[TerminalCapabilities] = None,
+            ) -> str:
+        self._sync_col_max_disp_len()
+        return super().get_table_line_str(row_data, col_disp_len=col_disp_len, caps=caps)
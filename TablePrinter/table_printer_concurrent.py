@@ -0,0 +1,239 @@
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from TablePrinter.table_printer import (
+    BaseTable, GroupAggregation, HashIndex, RowRenderCache, SortIndex, TableView, TBaseRow, TOrderSpec,
+    _slice_window, _validate_window,
+)
+
+if TYPE_CHECKING:
+    from TablePrinter.table_printer_diff import TableDiff
+
+
+class _InsertBuffer:
+    """ rows inserted by one thread and not merged into the table yet """
+    __slots__ = ('lock', 'rows', 'thread')
+
+    def __init__(self):
+        # 只有 flush 其它线程的缓冲区时才会竞争
+        self.lock = threading.Lock()
+        self.rows: List[Any] = []
+        self.thread = threading.current_thread()
+
+
+class TableSnapshot(TableView[TBaseRow]):
+    """ read-only copy of a ConcurrentTable at one point in time: the rows, the column widths, the footer and the
+    order of the registered sort indexes. Rows inserted after the snapshot was taken do not show up in it.
+
+    The row objects are shared with the table, a row changed by update_row after the snapshot shows its new values.
+    """
+
+    def __init__(
+            self, table: BaseTable[TBaseRow], rows: List[TBaseRow], col_disp_len: Dict[str, int],
+            footer: Optional[RowRenderCache], sorted_rows: Dict[TOrderSpec, List[TBaseRow]],
+            ):
+        super().__init__(table, rows)
+        self._col_disp_len = col_disp_len
+        self._footer_render_cache = footer
+        self._sorted_rows = sorted_rows
+        self.stats = table.stats
+
+    def _get_col_disp_len(self) -> Dict[str, int]:
+        return self._col_disp_len
+
+    def _get_footer_render_cache(self) -> Optional[RowRenderCache]:
+        return self._footer_render_cache
+
+    def get_sorted_rows(self, order_by: List[str], ascending: Optional[List[bool]] = None) -> List[TBaseRow]:
+        sorted_rows = self._sorted_rows.get(self._get_order_spec(order_by, ascending))
+        if sorted_rows is not None:
+            return list(sorted_rows)
+        return super().get_sorted_rows(order_by, ascending)
+
+    def _get_rows_to_show(
+            self, order_by: List[str] = None, ascending: List[bool] = None,
+            offset: int = 0, limit: Optional[int] = None, tail: Optional[int] = None,
+            ) -> Sequence[TBaseRow]:
+        if order_by:
+            sorted_rows = self._sorted_rows.get(self._get_order_spec(order_by, ascending))
+            if sorted_rows is not None:
+                _validate_window(offset, limit, tail)
+                return _slice_window(sorted_rows, offset, limit, tail)
+        return super()._get_rows_to_show(order_by, ascending, offset=offset, limit=limit, tail=tail)
+
+
+class ConcurrentTable(BaseTable[TBaseRow]):
+    """ BaseTable that many threads can insert into while another thread prints it.
+
+    insert_row appends to a buffer owned by the calling thread, no lock shared with the other threads is taken.
+    Every INSERT_BUFFER_ROWS rows the buffer is formatted and measured in the calling thread, and only appending the
+    finished batch to row_list, the column widths and the indexes is done under the table lock. insert_rows and
+    insert_records format their batches the same way, after merging the rows buffered by the calling thread.
+
+    Rows still in a buffer are not part of the table yet. flush() merges the buffers of all threads, and it is called
+    before every read, so a row whose insert_row returned is visible to the reads that start afterwards.
+    Reads render a TableSnapshot taken under the table lock: print_table, write_table and iter_table_lines see a
+    stable set of rows and column widths while the producers keep appending, and the producers are not blocked
+    while the lines are rendered.
+
+    Stats collected by enable_stats do not include the format and measure phases of concurrent inserts.
+    """
+    # 每个线程缓冲的行数，达到后在该线程内排版并合并到表中
+    INSERT_BUFFER_ROWS: int = 256
+
+    def __init__(self, *args, **kwargs):
+        # RLock: BaseTable methods called under the lock may call each other
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._buffers: List[_InsertBuffer] = []
+        super().__init__(*args, **kwargs)
+
+    def _get_buffer(self) -> _InsertBuffer:
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = self._local.buffer = _InsertBuffer()
+            with self._lock:
+                self._buffers.append(buffer)
+        return buffer
+
+    def insert_row(self, row_data: TBaseRow):
+        """ buffer a row_data in the calling thread, it is merged into row_list in a batch, see flush """
+        if type(row_data) is not self.row_type:
+            raise TypeError(f'row_data type: {type(row_data)} does not match {self.row_type}')
+        buffer = self._get_buffer()
+        with buffer.lock:
+            buffer.rows.append(row_data)
+            if len(buffer.rows) >= self.INSERT_BUFFER_ROWS:
+                rows, buffer.rows = buffer.rows, []
+                # 持有缓冲区锁合并，同一线程插入的行保持插入顺序
+                self._merge_batch(rows)
+
+    def _insert_batch(self, batch: List[TBaseRow]) -> None:
+        """ merge a batch of insert_rows or insert_records, after the rows buffered by the calling thread """
+        buffer = self._get_buffer()
+        with buffer.lock:
+            rows, buffer.rows = buffer.rows, []
+            rows.extend(batch)
+            self._merge_batch(rows)
+
+    def _merge_batch(self, batch: List[TBaseRow]) -> None:
+        # 排版和测量列宽在调用线程完成，TableStats 不是线程安全的，不记录
+        col_widths = self.row_type._init_render_caches(batch)
+        with self._lock:
+            self._append_rendered_batch(batch, col_widths)
+
+    def flush(self) -> int:
+        """ merge the rows buffered by every thread into the table
+        Returns:
+            int: number of rows merged
+        """
+        with self._lock:
+            buffers = list(self._buffers)
+        row_cnt = 0
+        for buffer in buffers:
+            with buffer.lock:
+                rows, buffer.rows = buffer.rows, []
+                if rows:
+                    self._merge_batch(rows)
+            row_cnt += len(rows)
+        with self._lock:
+            # 已结束的线程不会再插入，清空后丢弃其缓冲区
+            self._buffers = [buffer for buffer in self._buffers if buffer.rows or buffer.thread.is_alive()]
+        return row_cnt
+
+    def snapshot(self) -> TableSnapshot[TBaseRow]:
+        """ flush the buffers and return a read-only copy of the table, see TableSnapshot """
+        self.flush()
+        with self._lock:
+            return TableSnapshot(
+                self, list(self.row_list), self.get_col_disp_len_map(), self._get_footer_render_cache(),
+                {order_spec: sort_index.get_rows() for order_spec, sort_index in self._sort_indexes.items()},
+            )
+
+    @property
+    def row_count(self) -> int:
+        """ number of rows merged into the table, rows still buffered are not counted """
+        return len(self.row_list)
+
+    def update_row(self, row_data: TBaseRow, **col_values: Any) -> None:
+        self.flush()
+        with self._lock:
+            super().update_row(row_data, **col_values)
+
+    def delete_row(self, row_data: TBaseRow) -> None:
+        self.flush()
+        with self._lock:
+            super().delete_row(row_data)
+
+    def delete_rows(self, rows: Iterable[TBaseRow]) -> int:
+        self.flush()
+        with self._lock:
+            return super().delete_rows(rows)
+
+    def delete_where(self, predicate: Callable[[TBaseRow], bool]) -> int:
+        self.flush()
+        with self._lock:
+            return super().delete_where(predicate)
+
+    def register_sort_index(self, order_by: List[str], ascending: Optional[List[bool]] = None) -> SortIndex[TBaseRow]:
+        with self._lock:
+            return super().register_sort_index(order_by, ascending)
+
+    def drop_sort_index(self, order_by: List[str], ascending: Optional[List[bool]] = None) -> None:
+        with self._lock:
+            super().drop_sort_index(order_by, ascending)
+
+    def create_hash_index(self, attr_name: str) -> HashIndex[TBaseRow]:
+        with self._lock:
+            return super().create_hash_index(attr_name)
+
+    def drop_hash_index(self, attr_name: str) -> None:
+        with self._lock:
+            super().drop_hash_index(attr_name)
+
+    def register_aggregation(
+            self, group_by: List[str], aggregates: Dict[str, List[str]]
+            ) -> GroupAggregation[TBaseRow]:
+        with self._lock:
+            return super().register_aggregation(group_by, aggregates)
+
+    def drop_aggregation(self, aggregation: GroupAggregation[TBaseRow]) -> None:
+        with self._lock:
+            super().drop_aggregation(aggregation)
+
+    def set_footer(self, aggregates: Optional[Dict[str, str]], label: str = 'Total') -> None:
+        with self._lock:
+            super().set_footer(aggregates, label)
+
+    def get_sorted_rows(self, order_by: List[str], ascending: Optional[List[bool]] = None) -> List[TBaseRow]:
+        return self.snapshot().get_sorted_rows(order_by, ascending)
+
+    def where(self, predicate: Optional[Callable[[TBaseRow], bool]] = None, **col_values: Any) -> TableView[TBaseRow]:
+        # 哈希索引只能在锁内查找，predicate 在锁外对快照执行
+        self.flush()
+        with self._lock:
+            rows = list(super().where(**col_values).row_list)
+            snapshot = TableSnapshot(self, rows, self.get_col_disp_len_map(), None, {})
+        return snapshot if predicate is None else snapshot.where(predicate)
+
+    def select(self, col_names: List[str]) -> TableView[TBaseRow]:
+        return self.snapshot().select(col_names)
+
+    def diff(
+            self, other: BaseTable[TBaseRow], key: List[str], col_names: Optional[List[str]] = None,
+            ) -> 'TableDiff[TBaseRow]':
+        """ see BaseTable.diff, snapshots of the tables are compared """
+        if isinstance(other, ConcurrentTable):
+            other = other.snapshot()
+        return self.snapshot().diff(other, key, col_names=col_names)
+
+    def iter_table_lines(self, *args, **kwargs):
+        """ see BaseTable.iter_table_lines, the lines are rendered from a snapshot taken when this is called """
+        return self.snapshot().iter_table_lines(*args, **kwargs)
+
+    def write_table(self, sink: Any, *args, **kwargs) -> None:
+        """ see BaseTable.write_table, the lines are rendered from a snapshot taken when this is called """
+        self.snapshot().write_table(sink, *args, **kwargs)
+
+    def export_table(self, sink: Any, *args, **kwargs) -> int:
+        return self.snapshot().export_table(sink, *args, **kwargs)
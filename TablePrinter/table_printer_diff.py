@@ -0,0 +1,244 @@
+import sys
+from operator import attrgetter
+from typing import Any, Callable, Dict, Generic, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Type
+
+from ColorHelper.color_xterm_256 import ColorXTerm256
+from TablePrinter.table_printer import (
+    DEFAULT_WRITE_CHUNK_SIZE, BaseRow, BaseTable, ColumnAlignment, ColumnConfig, FontFormat, TBaseRow,
+    TerminalCapabilities, _PrintTableSink, _format_col_values, _get_sink_writer, get_display_ansi_width,
+    get_sort_key_func, get_terminal_capabilities, truncate_display_width,
+)
+from TablePrinter.table_printer_export import _get_row_values_getter
+
+# 差异表第一列的标记
+DIFF_ADDED = '+'
+DIFF_REMOVED = '-'
+DIFF_CHANGED = '~'
+
+
+class ChangedRow(NamedTuple):
+    """ a row whose key is in both tables and whose compared columns differ """
+    old: Any
+    new: Any
+    col_names: Tuple[str, ...]  # compared columns that differ, in the order of TableDiff.col_names
+
+
+class TableDiff(Generic[TBaseRow]):
+    """ rows added, removed and changed between an old and a new table, returned by BaseTable.diff.
+
+    print_table, write_table and iter_table_lines render the changes only: a diff marker column, the key columns and
+    the columns that changed in at least one row. Added rows are highlighted with FMT_ADDED, removed rows with
+    FMT_REMOVED, and changed cells show the old and the new value highlighted with FMT_CHANGED.
+    """
+    CHAR_COL_SEP: str = BaseTable.CHAR_COL_SEP
+    CHAR_HEADER_H_SEP: str = BaseTable.CHAR_HEADER_H_SEP
+    CHAR_HEADER_V_SEP: str = BaseTable.CHAR_HEADER_V_SEP
+    CHAR_LN: str = BaseTable.CHAR_LN
+    CHAR_CHANGE: str = ' -> '
+    ENABLE_COLOR: bool = True
+    HEADER_DIFF: str = 'Diff'
+    FMT_ADDED: FontFormat = FontFormat(BgColor=ColorXTerm256.GREEN, FgColor=ColorXTerm256.BLACK)
+    FMT_REMOVED: FontFormat = FontFormat(BgColor=ColorXTerm256.RED, FgColor=ColorXTerm256.WHITE)
+    FMT_CHANGED: FontFormat = FontFormat(BgColor=ColorXTerm256.YELLOW, FgColor=ColorXTerm256.BLACK)
+
+    def __init__(
+            self, row_type: Type[TBaseRow], key: List[str], col_names: List[str],
+            added: List[TBaseRow], removed: List[TBaseRow], changed: List[ChangedRow],
+            ):
+        self.row_type = row_type
+        self.key = key
+        self.col_names = col_names
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+
+    def __len__(self) -> int:
+        return len(self.added) + len(self.removed) + len(self.changed)
+
+    def get_summary(self) -> Dict[str, int]:
+        return {'added': len(self.added), 'removed': len(self.removed), 'changed': len(self.changed)}
+
+    def get_changed_col_names(self) -> List[str]:
+        """ return the compared columns that differ in at least one changed row, in the order of col_names """
+        changed_col_names = {col_name for changed_row in self.changed for col_name in changed_row.col_names}
+        return [col_name for col_name in self.col_names if col_name in changed_col_names]
+
+    def _get_diff_rows(self) -> Tuple[List[str], List[Tuple[List[str], List[Optional[FontFormat]]]]]:
+        """ return the columns shown and the cells of every change with their format, ordered by key """
+        col_order = [*self.key, *(col_name for col_name in self.get_changed_col_names() if col_name not in self.key)]
+        format_cells = _get_cells_formatter(self.row_type, col_order)
+        col_configs = [self.row_type.get_config(attr_name) for attr_name in col_order]
+        changes: List[Tuple[Any, str, Any]] = [
+            *((row_data, DIFF_ADDED, None) for row_data in self.added),
+            *((row_data, DIFF_REMOVED, None) for row_data in self.removed),
+            *((changed_row.new, DIFF_CHANGED, changed_row) for changed_row in self.changed),
+        ]
+        sort_key = get_sort_key_func(self.key, [True] * len(self.key))
+        changes.sort(key=lambda change: sort_key(change[0]))
+
+        diff_rows = []
+        for row_data, marker, changed_row in changes:
+            cells = [marker, *format_cells(row_data)]
+            if changed_row is None:
+                fmt = self.FMT_ADDED if marker == DIFF_ADDED else self.FMT_REMOVED
+                diff_rows.append((cells, [fmt] * len(cells)))
+                continue
+            fmts: List[Optional[FontFormat]] = [self.FMT_CHANGED] + [None] * len(col_order)
+            old_cells = format_cells(changed_row.old)
+            for idx, col_name in enumerate(col_order, start=1):
+                if col_name in changed_row.col_names:
+                    cells[idx] = self._get_change_cell(old_cells[idx - 1], cells[idx], col_configs[idx - 1])
+                    fmts[idx] = self.FMT_CHANGED
+            diff_rows.append((cells, fmts))
+        return col_order, diff_rows
+
+    def _get_change_cell(self, old_cell: str, new_cell: str, config: ColumnConfig) -> str:
+        """ return 'old -> new', cut like the other cells so it is not wider than the column max_width. Both values
+        are kept visible by giving each of them half of the width left by CHAR_CHANGE
+        """
+        cell = old_cell + self.CHAR_CHANGE + new_cell
+        max_width = config.max_width
+        if max_width is None or get_display_ansi_width(cell) <= max_width:
+            return cell
+        value_width = max_width - get_display_ansi_width(self.CHAR_CHANGE)
+        if value_width >= 2:
+            old_cell, old_width = truncate_display_width(old_cell, value_width // 2, config.truncate, config.ellipsis)
+            new_cell = truncate_display_width(new_cell, value_width - old_width, config.truncate, config.ellipsis)[0]
+            cell = old_cell + self.CHAR_CHANGE + new_cell
+        # max_width 放不下 CHAR_CHANGE 时整体截断
+        return truncate_display_width(cell, max_width, config.truncate, config.ellipsis)[0]
+
+    def iter_table_lines(self, caps: Optional[TerminalCapabilities] = None) -> Iterator[str]:
+        """ yield the output lines of the diff table: header, header separator and one line per change
+        Args:
+            caps (TerminalCapabilities, optional): see BaseTable.iter_table_lines, the changes are highlighted only
+                when caps can display colors
+        Yields:
+            str: an output line without line ending
+        """
+        caps = caps or get_terminal_capabilities()
+        can_disp_color = self.ENABLE_COLOR and caps.can_disp_color
+        col_order, diff_rows = self._get_diff_rows()
+        header = [self.HEADER_DIFF, *(self.row_type.get_config(attr).alias or attr for attr in col_order)]
+        col_align = [ColumnAlignment.CENTER, *(self.row_type.get_config(attr).align for attr in col_order)]
+        col_width = list(map(get_display_ansi_width, header))
+        for cells, _ in diff_rows:
+            col_width = list(map(max, col_width, map(get_display_ansi_width, cells)))
+
+        yield self.CHAR_COL_SEP.join(map(_pad_cell, header, col_align, col_width))
+        yield self.CHAR_HEADER_V_SEP.join(self.CHAR_HEADER_H_SEP * (width + 2) for width in col_width)
+        for cells, fmts in diff_rows:
+            padded = map(_pad_cell, cells, col_align, col_width)
+            if can_disp_color:
+                padded = [cell if fmt is None else fmt.apply_format(cell) for cell, fmt in zip(padded, fmts)]
+            yield self.CHAR_COL_SEP.join(padded)
+
+    def write_table(
+            self, sink: Any, chunk_size: int = DEFAULT_WRITE_CHUNK_SIZE, encoding: str = 'utf-8',
+            caps: Optional[TerminalCapabilities] = None,
+            ) -> None:
+        """ write the diff table to sink, see BaseTable.write_table """
+        if chunk_size <= 0:
+            raise ValueError(f'invalid chunk_size: {chunk_size}')
+        write, is_binary = _get_sink_writer(sink)
+        caps = caps or get_terminal_capabilities(sink)
+        buffer: List[str] = []
+        buffer_size = 0
+        for line in self.iter_table_lines(caps=caps):
+            buffer.append(line + self.CHAR_LN)
+            buffer_size += len(buffer[-1])
+            if buffer_size >= chunk_size:
+                chunk = ''.join(buffer)
+                write(chunk.encode(encoding) if is_binary else chunk)
+                buffer.clear()
+                buffer_size = 0
+        if buffer:
+            chunk = ''.join(buffer)
+            write(chunk.encode(encoding) if is_binary else chunk)
+
+        flush = getattr(sink, 'flush', None)
+        if callable(flush):
+            flush()
+
+    def print_table(self, caps: Optional[TerminalCapabilities] = None) -> None:
+        """ print the diff table """
+        sink = _PrintTableSink(sys.stdout, self.CHAR_LN)
+        self.write_table(sink, caps=caps or get_terminal_capabilities(sys.stdout))
+        sink.finish()
+
+
+def _pad_cell(text: str, align: ColumnAlignment, width: int) -> str:
+    return f' {text:{align}{width - get_display_ansi_width(text) + len(text)}} '
+
+
+def _get_cells_formatter(row_type: Type[BaseRow], col_order: List[str]) -> Callable[[BaseRow], List[str]]:
+    """ return a function formatting the columns in col_order of a row like print_table, cells wider than the column
+    max_width are cut. The render cache of the row is not filled, so unchanged rows are never formatted
+    """
+    get_values = _get_row_values_getter(col_order)
+    col_configs = [row_type.get_config(attr_name) for attr_name in col_order]
+    if not any(config.format or config.max_width is not None for config in col_configs):
+        return lambda row_data: list(map(str, get_values(row_data)))
+
+    def format_cells(row_data: BaseRow) -> List[str]:
+        return [_format_col_values((val,), config)[0] for val, config in zip(get_values(row_data), col_configs)]
+    return format_cells
+
+
+def _is_value_changed(old_val: Any, new_val: Any) -> bool:
+    """ compare two column values, NaN is not equal to itself but two NaN values are not a change """
+    return old_val != new_val and (old_val == old_val or new_val == new_val)
+
+
+def _index_by_key(rows: Sequence[TBaseRow], get_key: Callable[[TBaseRow], Any], side: str) -> Dict[Any, TBaseRow]:
+    """ return {key: row}, the index only holds references to the rows. rows is read once, so paged row lists of
+    SqliteTable and ColumnarTable are not loaded again
+    """
+    rows_by_key: Dict[Any, TBaseRow] = {}
+    for row_data in rows:
+        row_key = get_key(row_data)
+        if row_key in rows_by_key:
+            raise ValueError(f'Duplicate key in the {side} rows: {row_key}')
+        rows_by_key[row_key] = row_data
+    return rows_by_key
+
+
+def diff_rows(
+        row_type: Type[TBaseRow], old_rows: Sequence[TBaseRow], new_rows: Sequence[TBaseRow], key: List[str],
+        col_names: Optional[List[str]] = None,
+        ) -> TableDiff[TBaseRow]:
+    """ hash join old_rows and new_rows on the key columns and classify the rows as added, removed or changed,
+    see BaseTable.diff
+    """
+    if not key:
+        raise ValueError(f'invalid key: {key}')
+    if col_names is None:
+        col_names = [attr_name for attr_name in row_type.get_col_attr_names() if attr_name not in key]
+    attr_names_bad = [attr_name for attr_name in [*key, *col_names] if not row_type.is_col_attr_exist(attr_name)]
+    if attr_names_bad:
+        raise ValueError(f'Unknown attribute names: {attr_names_bad}')
+
+    # 单列 key 直接用列值作为字典的 key
+    get_key = attrgetter(*key)
+    old_by_key = _index_by_key(old_rows, get_key, 'old')
+    new_by_key = _index_by_key(new_rows, get_key, 'new')
+
+    get_values = _get_row_values_getter(col_names)
+    added, changed = [], []
+    get_old = old_by_key.get
+    for row_key, new_row in new_by_key.items():
+        old_row = get_old(row_key)
+        if old_row is None:
+            added.append(new_row)
+            continue
+        old_values, new_values = get_values(old_row), get_values(new_row)
+        if old_values != new_values:
+            # 元组比较对不同的 NaN 对象返回不等，逐列确认
+            changed_col_names = tuple(
+                col_name for col_name, old_val, new_val in zip(col_names, old_values, new_values)
+                if _is_value_changed(old_val, new_val)
+            )
+            if changed_col_names:
+                changed.append(ChangedRow(old_row, new_row, changed_col_names))
+    removed = [old_row for row_key, old_row in old_by_key.items() if row_key not in new_by_key]
+    return TableDiff(row_type, list(key), list(col_names), added, removed, changed)
@@ -0,0 +1,220 @@
+import csv
+import html
+import io
+import json
+from datetime import datetime
+from enum import Enum
+from operator import attrgetter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Type
+
+from TablePrinter.table_printer import (
+    DEFAULT_EXPORT_BATCH_SIZE, BaseRow, ColumnAlignment, _get_sink_writer, _iter_batches
+)
+
+
+class ExportFormat(str, Enum):
+    CSV = 'csv'
+    TSV = 'tsv'
+    JSONL = 'jsonl'
+    MARKDOWN = 'markdown'
+    HTML = 'html'
+
+    def __str__(self):
+        return self.value
+
+
+class TableExporter:
+    """ turn rows of a row_type into text chunks of an export format.
+
+    Columns follow BaseRow.get_export_col_attr_names, headers use the column alias and datetime values use the column
+    format. Values are read straight from the rows: no padding and no display width measurement.
+    """
+
+    def __init__(self, row_type: Type[BaseRow], col_order: Optional[List[str]] = None):
+        self.row_type = row_type
+        self.col_order: List[str] = row_type.get_export_col_attr_names() if col_order is None else list(col_order)
+        header_map = row_type.get_export_col_header_map()
+        self.col_header: List[str] = [header_map[attr_name] for attr_name in self.col_order]
+        self._get_row_values = _get_row_values_getter(self.col_order)
+        # 只有定义了 format 的列需要转换
+        self._col_formats: Dict[int, str] = {}
+        for idx, attr_name in enumerate(self.col_order):
+            fmt = row_type.get_config(attr_name).format
+            if fmt:
+                self._col_formats[idx] = fmt
+
+    def get_values(self, rows: Iterable[BaseRow]) -> Iterable[Sequence[Any]]:
+        """ return the column values of each row, datetime values of formatted columns are converted to str """
+        values = map(self._get_row_values, rows)
+        if not self._col_formats:
+            return values
+        return map(self._format_values, values)
+
+    def get_text_values(self, rows: Iterable[BaseRow]) -> Iterable[List[str]]:
+        """ same as get_values, with every value converted to str like print_table does """
+        return (list(map(str, values)) for values in self.get_values(rows))
+
+    def _format_values(self, values: Sequence[Any]) -> List[Any]:
+        values = list(values)
+        for idx, fmt in self._col_formats.items():
+            if isinstance(values[idx], datetime):
+                values[idx] = values[idx].strftime(fmt)
+        return values
+
+    def get_header(self) -> str:
+        """ text written before the first row """
+        return ''
+
+    def get_rows(self, rows: List[BaseRow]) -> str:
+        """ text of the given rows """
+        raise NotImplementedError
+
+    def get_footer(self) -> str:
+        """ text written after the last row """
+        return ''
+
+
+class CsvExporter(TableExporter):
+    dialect: str = 'excel'
+
+    def __init__(self, row_type: Type[BaseRow], col_order: Optional[List[str]] = None):
+        super().__init__(row_type, col_order)
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, dialect=self.dialect)
+
+    def _pop_buffer(self) -> str:
+        text = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return text
+
+    def get_header(self) -> str:
+        self._writer.writerow(self.col_header)
+        return self._pop_buffer()
+
+    def get_rows(self, rows: List[BaseRow]) -> str:
+        # None is written as an empty field by csv.writer
+        self._writer.writerows(self.get_values(rows))
+        return self._pop_buffer()
+
+
+class TsvExporter(CsvExporter):
+    dialect: str = 'excel-tab'
+
+
+class JsonLinesExporter(TableExporter):
+    """ one JSON object per row keyed by column header. int, float, bool and None keep their JSON type, datetime
+    values without format are written in ISO 8601 and other values as str.
+    """
+
+    def __init__(self, row_type: Type[BaseRow], col_order: Optional[List[str]] = None):
+        super().__init__(row_type, col_order)
+        self._encode = json.JSONEncoder(ensure_ascii=False, default=_json_default).encode
+
+    def get_rows(self, rows: List[BaseRow]) -> str:
+        encode, col_header = self._encode, self.col_header
+        return ''.join([encode(dict(zip(col_header, values))) + '\n' for values in self.get_values(rows)])
+
+
+class MarkdownExporter(TableExporter):
+    """ GitHub flavored markdown table, the column alignment is kept in the delimiter row """
+
+    _ALIGN_DELIMITER = {
+        ColumnAlignment.LEFT: ':---',
+        ColumnAlignment.CENTER: ':---:',
+        ColumnAlignment.RIGHT: '---:',
+    }
+
+    def get_header(self) -> str:
+        delimiters = [
+            self._ALIGN_DELIMITER.get(self.row_type.get_config(attr_name).align, '---') for attr_name in self.col_order
+        ]
+        return _get_markdown_line(self.col_header) + _get_markdown_line(delimiters)
+
+    def get_rows(self, rows: List[BaseRow]) -> str:
+        return ''.join([_get_markdown_line(values) for values in self.get_text_values(rows)])
+
+
+class HtmlExporter(TableExporter):
+
+    def get_header(self) -> str:
+        header = ''.join(f'<th>{html.escape(text)}</th>' for text in self.col_header)
+        return f'<table>\n<thead>\n<tr>{header}</tr>\n</thead>\n<tbody>\n'
+
+    def get_rows(self, rows: List[BaseRow]) -> str:
+        escape = html.escape
+        return ''.join([
+            '<tr>' + ''.join([f'<td>{escape(text)}</td>' for text in values]) + '</tr>\n'
+            for values in self.get_text_values(rows)
+        ])
+
+    def get_footer(self) -> str:
+        return '</tbody>\n</table>\n'
+
+
+EXPORTERS: Dict[ExportFormat, Type[TableExporter]] = {
+    ExportFormat.CSV: CsvExporter,
+    ExportFormat.TSV: TsvExporter,
+    ExportFormat.JSONL: JsonLinesExporter,
+    ExportFormat.MARKDOWN: MarkdownExporter,
+    ExportFormat.HTML: HtmlExporter,
+}
+
+
+def export_rows(
+        row_type: Type[BaseRow], rows: Iterable[BaseRow], sink: Any, fmt: str = ExportFormat.CSV,
+        batch_size: int = DEFAULT_EXPORT_BATCH_SIZE, encoding: str = 'utf-8', col_order: Optional[List[str]] = None,
+        ) -> int:
+    """ stream rows of row_type to sink in the given export format, one write per batch of rows
+    Args:
+        row_type (Type[BaseRow]): row class defining the columns
+        rows (Iterable[BaseRow]): rows to export
+        sink: text stream, binary stream or socket, see BaseTable.write_table
+        fmt (str, optional): one of ExportFormat. Defaults to csv.
+        batch_size (int, optional): number of rows written at a time
+        encoding (str, optional): encoding used for binary sinks
+        col_order (List[str], optional): columns to export, in order. Defaults to row_type.get_export_col_attr_names()
+    Raises:
+        ValueError: when fmt is not a known ExportFormat
+    Returns:
+        int: number of rows exported
+    """
+    exporter = EXPORTERS[ExportFormat(fmt)](row_type, col_order)
+    write, is_binary = _get_sink_writer(sink)
+
+    def write_text(text: str) -> None:
+        if text:
+            write(text.encode(encoding) if is_binary else text)
+
+    write_text(exporter.get_header())
+    row_cnt = 0
+    for batch in _iter_batches(rows, batch_size):
+        write_text(exporter.get_rows(batch))
+        row_cnt += len(batch)
+    write_text(exporter.get_footer())
+
+    flush = getattr(sink, 'flush', None)
+    if callable(flush):
+        flush()
+    return row_cnt
+
+
+def _get_row_values_getter(col_order: List[str]) -> Callable[[BaseRow], Sequence[Any]]:
+    """ return a function returning the values of the columns in col_order of a row """
+    if not col_order:
+        return lambda row_data: ()
+    getter = attrgetter(*col_order)
+    if len(col_order) == 1:
+        # attrgetter with a single attribute does not return a tuple
+        return lambda row_data: (getter(row_data),)
+    return getter
+
+
+def _json_default(value: Any) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _get_markdown_line(values: Iterable[str]) -> str:
+    return '| ' + ' | '.join(value.replace('|', '\\|').replace('\n', '<br>') for value in values) + ' |\n'
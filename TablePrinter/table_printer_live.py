@@ -0,0 +1,104 @@
+import sys
+from typing import Dict, Iterable, List, Optional, Set
+
+from SystemTools.terminal_updater import TerminalUpdater
+from TablePrinter.table_printer import BaseTable, TBaseRow, TerminalCapabilities, get_terminal_capabilities
+
+
+class LiveTable(BaseTable[TBaseRow]):
+    """ BaseTable that is redrawn in place through TerminalUpdater.
+
+    Rows inserted, updated or deleted since the last frame are tracked. A frame only renders the lines of dirty rows,
+    the lines of the other rows are reused from a line cache. All lines are re-rendered only when a column width
+    changes, because every line has to be padded to the new width.
+
+    Rows must be changed through update_row, otherwise the change is not picked up.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._line_cache: Dict[int, str] = {}
+        self._dirty_row_ids: Set[int] = set()
+        self._frame_col_disp_len: Optional[Dict[str, int]] = None
+        self._frame_caps: Optional[TerminalCapabilities] = None
+        self._frame_header_lines: List[str] = []
+        self.frame_rendered_line_cnt: int = 0  # number of row lines rendered by the last frame
+        super().__init__(*args, **kwargs)
+
+    def insert_row(self, row_data: TBaseRow):
+        super().insert_row(row_data)
+        self._dirty_row_ids.add(id(row_data))
+
+    def _insert_batch(self, batch: List[TBaseRow]) -> None:
+        super()._insert_batch(batch)
+        self._dirty_row_ids.update(map(id, batch))
+
+    def update_row(self, row_data: TBaseRow, **col_values) -> None:
+        super().update_row(row_data, **col_values)
+        self._dirty_row_ids.add(id(row_data))
+
+    def delete_row(self, row_data: TBaseRow) -> None:
+        super().delete_row(row_data)
+        self._line_cache.pop(id(row_data), None)
+        self._dirty_row_ids.discard(id(row_data))
+
+    def delete_rows(self, rows: Iterable[TBaseRow]) -> int:
+        row_cnt = super().delete_rows(rows)
+        if row_cnt:
+            row_ids = set(map(id, self.row_list))
+            self._line_cache = {row_id: line for row_id, line in self._line_cache.items() if row_id in row_ids}
+            self._dirty_row_ids &= row_ids
+        return row_cnt
+
+    def get_frame_lines(
+            self, order_by: List[str] = None, ascending: List[bool] = None,
+            offset: int = 0, limit: Optional[int] = None, tail: Optional[int] = None,
+            caps: Optional[TerminalCapabilities] = None,
+            ) -> List[str]:
+        """ return the lines of the next frame, arguments are the same as iter_table_lines """
+        caps = caps or get_terminal_capabilities()
+        footer = self._get_footer_render_cache()
+        col_disp_len = self._merge_footer_col_disp_len(self.get_col_disp_len_map(), footer)
+        rows = self._get_rows_to_show(order_by, ascending, offset=offset, limit=limit, tail=tail)
+        table = self._get_table_for_caps(caps, rows)
+        if col_disp_len != self._frame_col_disp_len or caps != self._frame_caps:
+            # 列宽或输出能力变化，所有行都需要重新排版
+            self._frame_col_disp_len = col_disp_len
+            self._frame_caps = caps
+            self._frame_header_lines = [
+                table.get_table_header_str(col_disp_len=col_disp_len),
+                table.get_table_header_sep_str(col_disp_len=col_disp_len),
+            ]
+            self._line_cache.clear()
+
+        line_cache, dirty_row_ids = self._line_cache, self._dirty_row_ids
+        lines = list(self._frame_header_lines)
+        rendered_line_cnt = 0
+        render_line, col_width = table._get_line_renderer(caps), table._get_col_width(col_disp_len)
+        for row_data in rows:
+            row_id = id(row_data)
+            line = None if row_id in dirty_row_ids else line_cache.get(row_id)
+            if line is None:
+                line = line_cache[row_id] = render_line(row_data.get_render_cache(), col_width)
+                rendered_line_cnt += 1
+                dirty_row_ids.discard(row_id)
+            lines.append(line)
+        if footer is not None:
+            lines.extend([self._frame_header_lines[1], render_line(footer, col_width)])
+        self.frame_rendered_line_cnt = rendered_line_cnt
+        return lines
+
+    def render_frame(
+            self, order_by: List[str] = None, ascending: List[bool] = None,
+            offset: int = 0, limit: Optional[int] = None, tail: Optional[int] = None,
+            caps: Optional[TerminalCapabilities] = None,
+            ) -> None:
+        """ redraw the table in the terminal, only lines that differ from the previous frame are rewritten
+        Args:
+            order_by, ascending, offset, limit, tail: see iter_table_lines
+            caps (TerminalCapabilities, optional): see iter_table_lines. Defaults to
+                get_terminal_capabilities(sys.stdout), the stream TerminalUpdater writes to, so a redirected or piped
+                stdout receives the frames without ANSI colors or OSC 8 hyperlinks.
+        """
+        caps = caps or get_terminal_capabilities(sys.stdout)
+        lines = self.get_frame_lines(order_by, ascending, offset=offset, limit=limit, tail=tail, caps=caps)
+        TerminalUpdater().update(lines)
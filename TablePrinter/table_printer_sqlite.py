@@ -0,0 +1,489 @@
+import pickle
+import sqlite3
+from collections import OrderedDict
+from collections.abc import Sequence
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import (
+    Any, Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union, get_args, get_origin, get_type_hints,
+)
+
+from TablePrinter.table_printer import BaseTable, TableView, TBaseRow, _iter_batches, _validate_window
+
+DEFAULT_PAGE_SIZE: int = 1000
+DEFAULT_ROW_CACHE_SIZE: int = 10000
+
+# 记录行在 sqlite 中的 rowid，只设置在 SqliteTable 返回或插入过的行上
+_ROWID_ATTR = '_sqlite_rowid'
+_NATIVE_TYPES = (int, float, str, bytes)
+_NATIVE_TYPE_NAMES = ('int', 'float', 'str', 'bytes')
+_NONE_TYPE = type(None)
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _encode_iso(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, (date, time)) else value
+
+
+def _decode_datetime(value: Any) -> Any:
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _decode_date(value: Any) -> Any:
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _decode_time(value: Any) -> Any:
+    return time.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _encode_decimal(value: Any) -> Any:
+    return str(value) if isinstance(value, Decimal) else value
+
+
+def _decode_decimal(value: Any) -> Any:
+    return Decimal(value) if isinstance(value, str) else value
+
+
+def _decode_bool(value: Any) -> Any:
+    return None if value is None else bool(value)
+
+
+def _encode_pickle(value: Any) -> Any:
+    # None 保存为 NULL，IS NULL 与排序时 NULL 在前都与 BaseTable 一致
+    return None if value is None else pickle.dumps(value)
+
+
+def _decode_pickle(value: Any) -> Any:
+    return pickle.loads(value) if isinstance(value, bytes) else value
+
+
+class _Codec(NamedTuple):
+    """ how the values of a field are stored in sqlite. None is always stored as NULL.
+
+    Attributes:
+        encode: value -> sqlite value, None when the value is stored as is
+        decode: sqlite value -> value, None when the value is read as is
+        sql_expr: sql expression of the column that sorts and compares like the values, {} is the quoted column name.
+            None when the stored values do not sort like the values (pickled), such columns are sorted in python.
+    """
+    encode: Optional[Callable[[Any], Any]] = None
+    decode: Optional[Callable[[Any], Any]] = None
+    sql_expr: Optional[str] = '{}'
+
+
+def _unwrap_optional(field_type: Any) -> Any:
+    """ return X of Optional[X] / Union[X, None], other types are returned as is """
+    if get_origin(field_type) is Union:
+        args = [arg for arg in get_args(field_type) if arg is not _NONE_TYPE]
+        if len(args) == 1:
+            return args[0]
+    return field_type
+
+
+def _get_codec(field_type: Any) -> _Codec:
+    """ return the codec of a field type. datetime, date and time are stored as ISO 8601 text and Decimal as exact
+    text compared as a number, so they sort in sqlite like in python. Only types sqlite cannot store are pickled.
+    """
+    field_type = _unwrap_optional(field_type)
+    if field_type in (datetime, 'datetime'):
+        return _Codec(_encode_iso, _decode_datetime)
+    if field_type in (date, 'date'):
+        return _Codec(_encode_iso, _decode_date)
+    if field_type in (time, 'time'):
+        return _Codec(_encode_iso, _decode_time)
+    if field_type in (Decimal, 'Decimal'):
+        return _Codec(_encode_decimal, _decode_decimal, 'CAST({} AS REAL)')
+    if field_type in (bool, 'bool'):
+        return _Codec(decode=_decode_bool)
+    if field_type in _NATIVE_TYPES or field_type in _NATIVE_TYPE_NAMES:
+        return _Codec()
+    if get_origin(field_type) is Union and all(arg in _NATIVE_TYPES for arg in get_args(field_type)):
+        # Union[int, float] 等，sqlite 可以直接保存
+        return _Codec()
+    return _Codec(_encode_pickle, _decode_pickle, None)
+
+
+def _get_field_types(row_type: type, field_names: List[str]) -> List[Any]:
+    """ return the annotations of the fields, string annotations are resolved when possible """
+    try:
+        type_hints = get_type_hints(row_type)
+    except (NameError, TypeError):
+        type_hints = {}
+    return [type_hints.get(name, row_type.__dataclass_fields__[name].type) for name in field_names]
+
+
+class _SqliteRowView(Sequence):
+    """ read-only sequence of the rows matching a query, rows are fetched page by page and rehydrated on access.
+    Iterating streams through a single cursor, indexing fetches the page holding the index.
+    """
+
+    def __init__(
+            self, table: 'SqliteTable', where: str = '', params: Tuple[Any, ...] = (), order_sql: str = 'rowid',
+            offset: int = 0, limit: Optional[int] = None,
+            ):
+        self._table = table
+        self._where = where
+        self._params = params
+        self._order_sql = order_sql
+        self._offset = offset
+        self._limit = limit
+        self._page_start: int = -1
+        self._page: List[TBaseRow] = []
+
+    def _get_sql(self, offset: int, limit: Optional[int]) -> Tuple[str, Tuple[Any, ...]]:
+        sql = f'SELECT rowid, {self._table._col_sql} FROM rows'
+        if self._where:
+            sql += f' WHERE {self._where}'
+        # LIMIT -1 表示不限制行数
+        sql += f' ORDER BY {self._order_sql} LIMIT ? OFFSET ?'
+        return sql, self._params + (-1 if limit is None else limit, offset)
+
+    def __len__(self) -> int:
+        row_cnt = self._table.count_rows(self._where, self._params) - self._offset
+        if self._limit is not None:
+            row_cnt = min(row_cnt, self._limit)
+        return max(row_cnt, 0)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(len(self))
+            if step != 1:
+                raise ValueError('slice step is not supported')
+            return _SqliteRowView(
+                self._table, self._where, self._params, self._order_sql,
+                offset=self._offset + start, limit=max(stop - start, 0),
+            )
+        row_cnt = len(self) if idx < 0 or self._limit is not None else None
+        if idx < 0:
+            idx += row_cnt
+        if idx < 0 or (row_cnt is not None and idx >= row_cnt):
+            raise IndexError('row index out of range')
+        page_size = self._table.page_size
+        page_start = idx - idx % page_size
+        if page_start != self._page_start:
+            sql, params = self._get_sql(self._offset + page_start, page_size)
+            self._page = [self._table._get_row(record) for record in self._table._conn.execute(sql, params)]
+            self._page_start = page_start
+        if idx - page_start >= len(self._page):
+            raise IndexError('row index out of range')
+        return self._page[idx - page_start]
+
+    def __iter__(self) -> Iterator[TBaseRow]:
+        sql, params = self._get_sql(self._offset, self._limit)
+        cursor = self._table._conn.execute(sql, params)
+        get_row = self._table._get_row
+        while True:
+            records = cursor.fetchmany(self._table.page_size)
+            if not records:
+                return
+            for record in records:
+                yield get_row(record)
+
+
+class SqliteTable(BaseTable[TBaseRow]):
+    """ BaseTable that spills its rows to a sqlite database instead of keeping them in memory.
+
+    Only the column width statistics and a LRU cache of recently rehydrated rows are kept in memory. Rows are
+    rehydrated into row_type instances page by page while printing, sorting and windows are pushed down to sqlite as
+    ORDER BY / LIMIT / OFFSET, and query_rows pushes filters down as a WHERE clause.
+
+    The database is scratch storage: the rows table is recreated when the table is created. The default db_path ''
+    makes sqlite use a private temporary file that is removed when the table is closed.
+
+    None is stored as NULL. datetime, date, time and Decimal columns are stored so that sqlite sorts and compares
+    them like python, values of other types sqlite cannot store are pickled and sorted in python instead.
+
+    Rows returned by the table are copies, use update_row and delete_row on them to change the table.
+    Compact row types are not supported, rows in sqlite do not take memory anyway.
+    """
+
+    def __init__(
+            self, *args, db_path: str = '', page_size: int = DEFAULT_PAGE_SIZE,
+            row_cache_size: int = DEFAULT_ROW_CACHE_SIZE, **kwargs,
+            ):
+        if page_size <= 0:
+            raise ValueError(f'invalid page_size: {page_size}')
+        if self.row_type.is_compact():
+            # rowid 保存在行对象上，compact 行没有 __dict__
+            raise TypeError(f'compact row type {self.row_type.__name__} cannot be stored in a SqliteTable')
+        self.page_size: int = page_size
+        self.row_cache_size: int = row_cache_size
+        self._row_cache: OrderedDict = OrderedDict()
+        self._field_names: List[str] = self.row_type.get_record_field_names()
+        self._col_sql: str = ', '.join(map(_quote, self._field_names))
+        codecs = [_get_codec(field_type) for field_type in _get_field_types(self.row_type, self._field_names)]
+        self._encoders = [codec.encode for codec in codecs]
+        self._decoders = [codec.decode for codec in codecs]
+        self._sql_exprs = {name: codec.sql_expr for name, codec in zip(self._field_names, codecs)}
+        self._next_rowid: int = 1
+
+        self._conn = sqlite3.connect(db_path)
+        # 数据库只作为临时存储，不需要崩溃后恢复
+        self._conn.execute('PRAGMA journal_mode = OFF')
+        self._conn.execute('PRAGMA synchronous = OFF')
+        self._conn.execute('DROP TABLE IF EXISTS rows')
+        self._conn.execute(f'CREATE TABLE rows (rowid INTEGER PRIMARY KEY, {self._col_sql})')
+        super().__init__(*args, **kwargs)
+
+    @property
+    def row_count(self) -> int:
+        return self.count_rows()
+
+    @property
+    def row_list(self) -> _SqliteRowView:
+        return _SqliteRowView(self)
+
+    @row_list.setter
+    def row_list(self, rows: List[TBaseRow]) -> None:
+        self._conn.execute('DELETE FROM rows')
+        self._row_cache.clear()
+        self.insert_rows(rows)
+
+    def close(self) -> None:
+        """ close the database, the table cannot be used afterwards """
+        self._conn.close()
+
+    def _encode_row(self, row_data: TBaseRow) -> Tuple[Any, ...]:
+        values = [getattr(row_data, name) for name in self._field_names]
+        return tuple(value if encode is None else encode(value) for value, encode in zip(values, self._encoders))
+
+    def _get_row(self, record: Tuple[Any, ...]) -> TBaseRow:
+        """ return the row of a (rowid, *values) record, rows in the row cache are reused with their render cache """
+        rowid = record[0]
+        row_data = self._row_cache.get(rowid)
+        if row_data is not None:
+            self._row_cache.move_to_end(rowid)
+            return row_data
+        values = [
+            value if decode is None else decode(value) for value, decode in zip(record[1:], self._decoders)
+        ]
+        row_data = self.row_type(**dict(zip(self._field_names, values)))
+        setattr(row_data, _ROWID_ATTR, rowid)
+        if self.row_cache_size > 0:
+            self._row_cache[rowid] = row_data
+            if len(self._row_cache) > self.row_cache_size:
+                self._row_cache.popitem(last=False)
+        return row_data
+
+    def _get_rowid(self, row_data: TBaseRow) -> int:
+        rowid = getattr(row_data, _ROWID_ATTR, None)
+        if rowid is None:
+            raise ValueError(f'row_data is not in the table: {row_data}')
+        return rowid
+
+    def count_rows(self, where: str = '', params: Tuple[Any, ...] = ()) -> int:
+        """ return the number of rows, or of the rows matching the where clause """
+        sql = 'SELECT COUNT(*) FROM rows' + (f' WHERE {where}' if where else '')
+        return self._conn.execute(sql, params).fetchone()[0]
+
+    def insert_row(self, row_data: TBaseRow):
+        """ store row_data in the database """
+        if type(row_data) is not self.row_type:
+            raise TypeError(f'row_data type: {type(row_data)} does not match {self.row_type}')
+        self._insert_batch([row_data])
+
+    def _insert_batch(self, batch: List[TBaseRow]) -> None:
+        # rowid 由这里分配，插入后的行可以直接用于 update_row/delete_row
+        rowids = range(self._next_rowid, self._next_rowid + len(batch))
+        placeholders = ', '.join('?' * (len(self._field_names) + 1))
+        # 按列编码，比逐行编码少很多函数调用
+        col_values = []
+        for name, encode in zip(self._field_names, self._encoders):
+            values = [getattr(row_data, name) for row_data in batch]
+            col_values.append(values if encode is None else list(map(encode, values)))
+        with self._conn:
+            self._conn.executemany(
+                f'INSERT INTO rows (rowid, {self._col_sql}) VALUES ({placeholders})', zip(rowids, *col_values)
+            )
+        for rowid, row_data in zip(rowids, batch):
+            setattr(row_data, _ROWID_ATTR, rowid)
+        self._next_rowid += len(batch)
+        self._update_col_max_disp_len_batch(self.row_type._init_render_caches(batch, stats=self.stats))
+        for index in self._get_indexes():
+            index.add_many(batch)
+
+    def update_row(self, row_data: TBaseRow, **col_values: Any) -> None:
+        """ update column values of a row returned by the table, see BaseTable.update_row """
+        attr_names_bad = [attr_name for attr_name in col_values if not self.row_type.is_col_attr_exist(attr_name)]
+        if attr_names_bad:
+            raise ValueError(f'Unknown attribute names in col_values: {attr_names_bad}')
+        rowid = self._get_rowid(row_data)
+        indexes = [
+            index for index in self._get_indexes() if any(attr_name in col_values for attr_name in index.attr_names)
+        ]
+        for index in indexes:
+            index.remove(row_data)
+        self._discard_col_disp_len([width] for width in row_data.get_render_cache().width)
+        for attr_name, value in col_values.items():
+            setattr(row_data, attr_name, value)
+        for index in indexes:
+            index.add(row_data)
+        row_data.invalidate_render_cache()
+        self._update_col_max_disp_len(row_data=row_data)
+        assignments = ', '.join(f'{_quote(name)} = ?' for name in self._field_names)
+        with self._conn:
+            self._conn.execute(f'UPDATE rows SET {assignments} WHERE rowid = ?', (*self._encode_row(row_data), rowid))
+        # 缓存中可能是同一行的另一个副本
+        if self._row_cache.get(rowid) is not row_data:
+            self._row_cache.pop(rowid, None)
+
+    def delete_row(self, row_data: TBaseRow) -> None:
+        """ remove a row returned by the table
+        Raises:
+            ValueError: when row_data is not in the table
+        """
+        rowid = self._get_rowid(row_data)
+        with self._conn:
+            if not self._conn.execute('DELETE FROM rows WHERE rowid = ?', (rowid,)).rowcount:
+                raise ValueError(f'row_data is not in the table: {row_data}')
+        self._row_cache.pop(rowid, None)
+        setattr(row_data, _ROWID_ATTR, None)
+        self._discard_col_disp_len([width] for width in row_data.get_render_cache().width)
+        for index in self._get_indexes():
+            index.remove(row_data)
+
+    def delete_rows(self, rows: Iterable[TBaseRow]) -> int:
+        """ remove many rows returned by the table in one transaction
+        Raises:
+            ValueError: when one of the rows is not in the table, no row is removed then
+        """
+        rows_removed = list({id(row_data): row_data for row_data in rows}.values())
+        if not rows_removed:
+            return 0
+        rowids = [(self._get_rowid(row_data),) for row_data in rows_removed]
+        with self._conn:
+            if self._conn.executemany('DELETE FROM rows WHERE rowid = ?', rowids).rowcount != len(rowids):
+                # 抛出异常时事务回滚
+                raise ValueError('some of the rows are not in the table')
+        for row_data in rows_removed:
+            self._row_cache.pop(self._get_rowid(row_data), None)
+            setattr(row_data, _ROWID_ATTR, None)
+        self._discard_col_disp_len(zip(*(row_data.get_render_cache().width for row_data in rows_removed)))
+        for index in self._get_indexes():
+            index.remove_many(rows_removed)
+        return len(rows_removed)
+
+    def delete_where(self, predicate: Callable[[TBaseRow], bool]) -> int:
+        """ remove every row for which predicate(row) is True. Every row is rehydrated to evaluate predicate, use
+        delete_where_sql when the condition can be expressed in sql.
+        """
+        return self.delete_rows([row_data for row_data in self.row_list if predicate(row_data)])
+
+    def delete_where_sql(self, where: str, params: Tuple[Any, ...] = ()) -> int:
+        """ remove the rows matching a sql where clause, e.g. delete_where_sql('"Age" > ?', (60,)).
+        Only the removed rows are rehydrated, to shrink the column widths.
+        """
+        removed_cnt = 0
+        for batch in _iter_batches(self.query_rows(where, params), self.page_size):
+            self._discard_col_disp_len(zip(*(row_data.get_render_cache().width for row_data in batch)))
+            for index in self._get_indexes():
+                index.remove_many(batch)
+            rowids = [(self._get_rowid(row_data),) for row_data in batch]
+            for (rowid,) in rowids:
+                self._row_cache.pop(rowid, None)
+            removed_cnt += len(rowids)
+        with self._conn:
+            self._conn.execute(f'DELETE FROM rows WHERE {where}', params)
+        return removed_cnt
+
+    def register_sort_index(self, order_by: List[str], ascending: Optional[List[bool]] = None):
+        raise NotImplementedError('SqliteTable sorts in sqlite, use create_index instead')
+
+    def create_index(self, order_by: List[str], ascending: Optional[List[bool]] = None) -> None:
+        """ create a sqlite index for ORDER BY order_by or for filters on these columns
+        Raises:
+            ValueError: when order_by contains pickled columns, see _get_order_sql
+        """
+        order_by, ascending = self._get_order_spec(order_by, ascending)
+        index_name = 'idx_' + '_'.join(f'{attr_name}_{int(asc)}' for attr_name, asc in zip(order_by, ascending))
+        self._conn.execute(
+            f'CREATE INDEX IF NOT EXISTS {_quote(index_name)} ON rows ({self._get_order_sql(order_by, ascending)})'
+        )
+
+    def create_hash_index(self, attr_name: str):
+        raise NotImplementedError('SqliteTable looks up rows in sqlite, use create_index instead')
+
+    def where(self, predicate: Optional[Callable[[TBaseRow], bool]] = None, **col_values: Any) -> TableView[TBaseRow]:
+        """ see BaseTable.where, equality conditions are pushed down to sqlite as a WHERE clause """
+        attr_names_bad = [attr_name for attr_name in col_values if attr_name not in self._field_names]
+        if attr_names_bad:
+            raise ValueError(f'Unknown attribute names in col_values: {attr_names_bad}')
+        conditions, params = [], []
+        col_values_py = {}
+        for attr_name, value in col_values.items():
+            if value is None:
+                conditions.append(f'{_quote(attr_name)} IS NULL')
+                continue
+            sql_expr = self._sql_exprs[attr_name]
+            if sql_expr is None:
+                # pickle 的字节不能用来判断相等，在 python 中比较
+                col_values_py[attr_name] = value
+                continue
+            encode = self._encoders[self._field_names.index(attr_name)]
+            conditions.append(f'{sql_expr.format(_quote(attr_name))} = {sql_expr.format("?")}')
+            params.append(value if encode is None else encode(value))
+        rows = self.query_rows(' AND '.join(conditions), tuple(params))
+        if col_values_py:
+            rows = [
+                row_data for row_data in rows
+                if all(getattr(row_data, attr_name) == value for attr_name, value in col_values_py.items())
+            ]
+        if predicate is not None:
+            rows = [row_data for row_data in rows if predicate(row_data)]
+        return TableView(self, rows)
+
+    def _is_sortable_in_sql(self, order_by: Optional[List[str]]) -> bool:
+        """ return False when order_by contains pickled columns, which sqlite cannot sort """
+        return not order_by or all(self._sql_exprs.get(attr_name, '') is not None for attr_name in order_by)
+
+    def _get_order_sql(self, order_by: Optional[List[str]], ascending: Optional[List[bool]]) -> str:
+        """
+        Raises:
+            ValueError: when order_by contains pickled columns
+        """
+        if not order_by:
+            return 'rowid'
+        order_by, ascending = self._get_order_spec(order_by, ascending)
+        if not self._is_sortable_in_sql(order_by):
+            raise ValueError(f'Columns stored pickled cannot be sorted by sqlite: {order_by}')
+        # sqlite 升序时 NULL 在前，降序时在后，与 get_sort_key_func 一致；rowid 保证排序稳定
+        return ', '.join(
+            f'{self._sql_exprs[attr_name].format(_quote(attr_name))} {"ASC" if asc else "DESC"}'
+            for attr_name, asc in zip(order_by, ascending)
+        ) + ', rowid'
+
+    def query_rows(
+            self, where: str = '', params: Tuple[Any, ...] = (),
+            order_by: List[str] = None, ascending: List[bool] = None,
+            ) -> _SqliteRowView:
+        """ return a view of the rows matching a sql where clause, sorted by sqlite.
+        Args:
+            where (str, optional): sql condition on the quoted column names, e.g. '"Salary" >= ?'
+            params (Tuple, optional): parameters of the where clause
+            order_by (List[str], optional): see order_by in get_sorted_rows
+            ascending (List[bool], optional): see ascending in get_sorted_rows
+        Raises:
+            ValueError: when order_by contains pickled columns
+        """
+        return _SqliteRowView(self, where, tuple(params), self._get_order_sql(order_by, ascending))
+
+    def get_sorted_rows(self, order_by: List[str], ascending: Optional[List[bool]] = None) -> Sequence[TBaseRow]:
+        """ see BaseTable.get_sorted_rows, sorting runs in sqlite. Pickled columns are sorted in python. """
+        if not self._is_sortable_in_sql(order_by):
+            return super().get_sorted_rows(order_by, ascending)
+        return _SqliteRowView(self, order_sql=self._get_order_sql(order_by, ascending))
+
+    def _get_rows_to_show(
+            self, order_by: List[str] = None, ascending: List[bool] = None,
+            offset: int = 0, limit: Optional[int] = None, tail: Optional[int] = None,
+            ) -> Sequence[TBaseRow]:
+        if not self._is_sortable_in_sql(order_by):
+            return super()._get_rows_to_show(order_by, ascending, offset=offset, limit=limit, tail=tail)
+        _validate_window(offset, limit, tail)
+        if tail is not None:
+            offset = max(self.count_rows() - tail, 0)
+        return _SqliteRowView(self, order_sql=self._get_order_sql(order_by, ascending), offset=offset, limit=limit)
@@ -0,0 +1,118 @@
+from collections import defaultdict
+from time import perf_counter
+from typing import Callable, Dict, List, Optional
+
+# callback(phase, seconds, counters) called every time a phase ends
+TStatsCallback = Callable[[str, float, Dict[str, int]], None]
+
+
+class _NullPhase:
+    """ phase returned when stats are disabled, does nothing """
+
+    def add(self, **counters: int) -> None:
+        pass
+
+    def __enter__(self) -> '_NullPhase':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> bool:
+        return False
+
+
+NULL_PHASE = _NullPhase()
+
+
+class _Phase:
+    """ time one run of a phase. Time spent in phases nested inside is not counted, so phase times add up to the
+    total time.
+    """
+    __slots__ = ('stats', 'name', 'counters', 'start', 'child_sec')
+
+    def __init__(self, stats: 'TableStats', name: str):
+        self.stats = stats
+        self.name = name
+        self.counters: Dict[str, int] = {}
+        self.start = 0.0
+        self.child_sec = 0.0
+
+    def add(self, **counters: int) -> None:
+        """ add to the counters reported with this phase """
+        for name, value in counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def __enter__(self) -> '_Phase':
+        self.stats._phase_stack.append(self)
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> bool:
+        sec = perf_counter() - self.start
+        stack = self.stats._phase_stack
+        stack.pop()
+        if stack:
+            stack[-1].child_sec += sec
+        self.stats.add_phase(self.name, sec - self.child_sec, **self.counters)
+        return False
+
+
+class TableStats:
+    """ wall time and call count per rendering phase, plus counters, collected by a table after
+    BaseTable.enable_stats. Nothing is collected and nothing is timed while stats are disabled.
+
+    Phases:
+        format: cells converted to text, when rows are inserted or first rendered
+        measure: display width of the cells, when rows are inserted in batch
+        sort: rows sorted for order_by
+        render: row lines rendered by write_table / print_table, conditional formats excluded
+        cond_fmt: conditional formats evaluated, once per distinct cell text
+        write: chunks written to the sink
+    """
+
+    def __init__(self, callback: Optional[TStatsCallback] = None):
+        self.callback = callback
+        self.phase_sec: Dict[str, float] = defaultdict(float)
+        self.phase_calls: Dict[str, int] = defaultdict(int)
+        self.counters: Dict[str, int] = defaultdict(int)
+        self._phase_stack: List[_Phase] = []
+
+    def phase(self, name: str) -> _Phase:
+        """ return a context manager timing one run of the phase """
+        return _Phase(self, name)
+
+    def add_phase(self, name: str, sec: float, **counters: int) -> None:
+        """ record one run of a phase measured by the caller """
+        self.phase_sec[name] += sec
+        self.phase_calls[name] += 1
+        self.add_counters(**counters)
+        if self.callback is not None:
+            self.callback(name, sec, counters)
+
+    def add_nested_phase(self, name: str, sec: float, **counters: int) -> None:
+        """ record one run of a phase measured by the caller that ran inside the current phase, its time is not
+        counted in the current phase
+        """
+        if self._phase_stack:
+            self._phase_stack[-1].child_sec += sec
+        self.add_phase(name, sec, **counters)
+
+    def add_counters(self, **counters: int) -> None:
+        for name, value in counters.items():
+            self.counters[name] += value
+
+    def reset(self) -> None:
+        self.phase_sec.clear()
+        self.phase_calls.clear()
+        self.counters.clear()
+
+    def as_dict(self) -> Dict[str, Dict[str, float]]:
+        return {
+            'phase_sec': dict(self.phase_sec), 'phase_calls': dict(self.phase_calls), 'counters': dict(self.counters),
+        }
+
+    def __str__(self) -> str:
+        total_sec = sum(self.phase_sec.values()) or 1.0
+        lines = [f'{"phase":<10} {"calls":>8} {"seconds":>10} {"share":>6}']
+        for name, sec in sorted(self.phase_sec.items(), key=lambda item: -item[1]):
+            lines.append(f'{name:<10} {self.phase_calls[name]:>8} {sec:>10.4f} {sec / total_sec:>6.1%}')
+        lines.extend(f'{name}: {value}' for name, value in sorted(self.counters.items()))
+        return '\n'.join(lines)
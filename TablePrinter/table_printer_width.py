@@ -0,0 +1,171 @@
+import os
+import sys
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
+
+# code points below U+0300 (ASCII, latin-1, latin extended, IPA, spacing modifiers) are all 1 column wide
+_NARROW_MAX_CHAR = '\u02ff'
+
+WIDTH_CACHE_SIZE: int = 4096
+
+_RANGE_STARTS: Optional[Tuple[int, ...]] = None
+_RANGE_ENDS: Optional[Tuple[int, ...]] = None
+_RANGE_WIDTHS: Optional[Tuple[int, ...]] = None
+
+
+def _load_width_table() -> None:
+    """ load the range table on first use, ASCII-only output never needs it """
+    global _RANGE_STARTS, _RANGE_ENDS, _RANGE_WIDTHS
+    from TablePrinter.table_printer_width_table import WIDTH_RANGES
+    _RANGE_STARTS = tuple(start for start, _, _ in WIDTH_RANGES)
+    _RANGE_ENDS = tuple(end for _, end, _ in WIDTH_RANGES)
+    _RANGE_WIDTHS = tuple(width for _, _, width in WIDTH_RANGES)
+
+
+def get_char_width(char: str) -> int:
+    """ return the number of terminal columns taken by a single character: 0, 1 or 2 """
+    if char <= _NARROW_MAX_CHAR:
+        return 1
+    if _RANGE_STARTS is None:
+        _load_width_table()
+    code_point = ord(char)
+    idx = bisect_right(_RANGE_STARTS, code_point) - 1
+    if idx >= 0 and code_point <= _RANGE_ENDS[idx]:
+        return _RANGE_WIDTHS[idx]
+    return 1
+
+
+@lru_cache(maxsize=WIDTH_CACHE_SIZE)
+def _get_wide_str_width(s: str) -> int:
+    if _RANGE_STARTS is None:
+        _load_width_table()
+    starts, ends, widths = _RANGE_STARTS, _RANGE_ENDS, _RANGE_WIDTHS
+    length = 0
+    for char in s:
+        if char <= _NARROW_MAX_CHAR:
+            length += 1
+            continue
+        code_point = ord(char)
+        idx = bisect_right(starts, code_point) - 1
+        if idx >= 0 and code_point <= ends[idx]:
+            length += widths[idx]
+        else:
+            length += 1
+    return length
+
+
+def get_width_cache_info() -> Tuple[int, int]:
+    """ return the (hits, misses) of the width cache of non ASCII strings """
+    cache_info = _get_wide_str_width.cache_info()
+    return cache_info.hits, cache_info.misses
+
+
+def get_display_ansi_width(s: str) -> int:
+    """ return the display length of the given string.
+    Wide and fullwidth characters (East_Asian_Width W/F) take 2 spaces, combining marks and zero width characters
+    (ZWJ, variation selectors, ...) take 0, anything else takes 1.
+    """
+    if s.isascii() or max(s, default='') <= _NARROW_MAX_CHAR:
+        return len(s)
+    return _get_wide_str_width(s)
+
+
+def _get_fit_char_cnt(chars: Iterable[str], max_width: int) -> Tuple[int, int]:
+    """ return the number of leading chars fitting in max_width columns and their display width.
+    Scanning stops at the first char going past max_width, so the cost is bounded by max_width, not by the length.
+    """
+    width = 0
+    char_cnt = 0
+    for char in chars:
+        char_width = get_char_width(char)
+        if width + char_width > max_width:
+            break
+        width += char_width
+        char_cnt += 1
+    return char_cnt, width
+
+
+def truncate_display_width(s: str, max_width: int, position: str = 'end', ellipsis: str = '\u2026') -> Tuple[str, int]:
+    """ cut s to at most max_width display columns, replacing the removed part with ellipsis
+    Args:
+        s (str): text to cut
+        max_width (int): max display width of the result
+        position (str, optional): part of s removed: 'end', 'start' or 'middle'. Defaults to 'end'.
+        ellipsis (str, optional): placeholder of the removed part, dropped when it does not fit in max_width
+    Returns:
+        Tuple[str, int]: the text and its display width, s itself when it already fits
+    """
+    is_ascii = s.isascii()
+    if is_ascii:
+        if len(s) <= max_width:
+            return s, len(s)
+    else:
+        char_cnt, width = _get_fit_char_cnt(s, max_width)
+        if char_cnt == len(s):
+            return s, width
+    ellipsis_width = get_display_ansi_width(ellipsis)
+    if ellipsis_width > max_width:
+        ellipsis, ellipsis_width = '', 0
+    keep_width = max_width - ellipsis_width
+    if position == 'start':
+        keep_left_width, keep_right_width = 0, keep_width
+    elif position == 'middle':
+        keep_left_width, keep_right_width = keep_width - keep_width // 2, keep_width // 2
+    else:
+        keep_left_width, keep_right_width = keep_width, 0
+    if is_ascii:
+        left_cnt, left_width = keep_left_width, keep_left_width
+        right_cnt, right_width = keep_right_width, keep_right_width
+    else:
+        left_cnt, left_width = _get_fit_char_cnt(s, keep_left_width)
+        right_cnt, right_width = _get_fit_char_cnt(reversed(s), keep_right_width)
+    return f'{s[:left_cnt]}{ellipsis}{s[len(s) - right_cnt:]}', left_width + ellipsis_width + right_width
+
+
+def _generate_width_ranges() -> List[Tuple[int, int, int]]:
+    """ build the (start, end, width) ranges of every code point whose width is not 1 from unicodedata """
+    import unicodedata
+
+    def char_width(code_point: int) -> int:
+        char = chr(code_point)
+        category = unicodedata.category(char)
+        if category in ('Mn', 'Me', 'Cf') and code_point != 0xAD:  # soft hyphen is displayed
+            return 0
+        if category == 'Cn' and not 0x20000 <= code_point <= 0x3FFFD:
+            # unassigned code points are only wide in the CJK ideograph planes
+            return 1
+        if unicodedata.east_asian_width(char) in ('F', 'W'):
+            return 2
+        return 1
+
+    ranges: List[List[int]] = []
+    for code_point in range(sys.maxunicode + 1):
+        width = char_width(code_point)
+        if width == 1:
+            continue
+        if ranges and ranges[-1][1] == code_point - 1 and ranges[-1][2] == width:
+            ranges[-1][1] = code_point
+        else:
+            ranges.append([code_point, code_point, width])
+    return [tuple(r) for r in ranges]
+
+
+def _write_width_table() -> None:
+    """ regenerate table_printer_width_table.py with the unicodedata of the running python """
+    import unicodedata
+    ranges = _generate_width_ranges()
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'table_printer_width_table.py')
+    with open(path, 'w', encoding='utf-8', newline='\n') as f_out:
+        f_out.write(
+            f'# generated by table_printer_width.py from unicodedata {unicodedata.unidata_version}, do not edit\n'
+            '# (start, end, width) of every code point range whose display width is not 1\n'
+            'WIDTH_RANGES = (\n'
+        )
+        for start, end, width in ranges:
+            f_out.write(f'    (0x{start:04X}, 0x{end:04X}, {width}),\n')
+        f_out.write(')\n')
+
+
+if __name__ == '__main__':
+    _write_width_table()
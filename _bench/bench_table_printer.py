@@ -0,0 +1,465 @@
+""" TablePrinter benchmarks: throughput and peak memory of the hot paths at several table sizes.
+
+    python _bench/bench_table_printer.py                      # compare with the baseline, exit 1 on regression
+    python _bench/bench_table_printer.py --sizes 1000 100000  # smaller run
+    python _bench/bench_table_printer.py --update-baseline    # store the results as the new baseline
+
+Throughput is the best of a few repeats measured without tracemalloc; peak memory is measured in a separate run
+under tracemalloc, so tracing does not slow down the timings. Baselines are machine specific: the baseline stores
+the meta data of the machine it was recorded on, and when one of MACHINE_META_KEYS differs the run exits with
+status 2 unless --allow-foreign-baseline is given. Regenerate the baseline on the machine the benchmark runs on.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, ClassVar, Dict, List, Optional, Tuple, Type
+
+PROJ_PATH = str(Path(__file__).resolve().parent.parent)
+if PROJ_PATH not in sys.path:
+    sys.path.insert(0, PROJ_PATH)
+
+from TablePrinter.table_printer import (  # noqa: E402
+    BaseRow, BaseTable, ColumnAlignment, ColumnConfig, CondFmtExactMatch, can_display_href, get_display_ansi_width
+)
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'bench_table_printer_baseline.json'
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+DEFAULT_TOLERANCE = 0.25  # allowed throughput drop, 0.25 = 25% slower than the baseline
+DEFAULT_MEM_TOLERANCE = 0.25  # allowed peak memory growth
+# 基线只在这些信息都相同的机器上用于判定性能回退，python 只比较 major.minor
+MACHINE_META_KEYS = ('python', 'implementation', 'system', 'machine')
+LARGE_SIZE = 100_000  # sizes above this are measured once instead of best of REPEAT
+REPEAT = 3
+
+_DT_START = datetime(2024, 1, 1)
+_STATUSES = ['OK', 'FAIL', 'SKIP', 'RETRY']
+
+
+@dataclass
+class RowBenchAscii(BaseRow):
+    Id: int = None
+    Name: str = None
+    Status: str = None
+    __Status_config: ClassVar[ColumnConfig] = ColumnConfig(conditional_format=CondFmtExactMatch(match_target='FAIL'))
+    Value: float = None
+    __Value_config: ClassVar[ColumnConfig] = ColumnConfig(align=ColumnAlignment.RIGHT)
+
+
+@dataclass(slots=True)
+class RowBenchAsciiCompact(BaseRow):
+    """ RowBenchAscii stored without __dict__ """
+    Id: int = None
+    Name: str = None
+    Status: str = None
+    __Status_config: ClassVar[ColumnConfig] = ColumnConfig(conditional_format=CondFmtExactMatch(match_target='FAIL'))
+    Value: float = None
+    __Value_config: ClassVar[ColumnConfig] = ColumnConfig(align=ColumnAlignment.RIGHT)
+
+
+@dataclass
+class RowBenchCjk(BaseRow):
+    Id: int = None
+    Name: str = None
+    __Name_config: ClassVar[ColumnConfig] = ColumnConfig(alias='名字')
+    City: str = None
+    __City_config: ClassVar[ColumnConfig] = ColumnConfig(alias='城市', align=ColumnAlignment.LEFT)
+    Note: str = None
+    __Note_config: ClassVar[ColumnConfig] = ColumnConfig(alias='备注')
+
+
+@dataclass
+class RowBenchDatetime(BaseRow):
+    Id: int = None
+    Start: datetime = None
+    __Start_config: ClassVar[ColumnConfig] = ColumnConfig(format='%Y-%m-%d %H:%M:%S')
+    End: datetime = None
+    __End_config: ClassVar[ColumnConfig] = ColumnConfig(format='%H:%M:%S.%f')
+
+
+@dataclass
+class RowBenchHref(BaseRow):
+    Id: int = None
+    Name: str = None
+    Name_href: str = None
+    Status: str = None
+
+
+def _new_ascii_row(idx: int) -> RowBenchAscii:
+    return RowBenchAscii(Id=idx, Name=f'name_{idx % 5000}', Status=_STATUSES[idx % 4], Value=idx * 0.25)
+
+
+def _new_ascii_compact_row(idx: int) -> RowBenchAsciiCompact:
+    return RowBenchAsciiCompact(Id=idx, Name=f'name_{idx % 5000}', Status=_STATUSES[idx % 4], Value=idx * 0.25)
+
+
+def _new_cjk_row(idx: int) -> RowBenchCjk:
+    return RowBenchCjk(
+        Id=idx, Name=f'用户{idx % 5000}', City=['北京', '上海', '深圳'][idx % 3], Note=f'备注 {idx % 97}'
+    )
+
+
+def _new_datetime_row(idx: int) -> RowBenchDatetime:
+    start = _DT_START + timedelta(seconds=idx)
+    return RowBenchDatetime(Id=idx, Start=start, End=start + timedelta(microseconds=idx % 1_000_000))
+
+
+def _new_href_row(idx: int) -> RowBenchHref:
+    return RowBenchHref(
+        Id=idx, Name=f'issue-{idx}', Name_href=f'https://example.com/issues/{idx}', Status=_STATUSES[idx % 4]
+    )
+
+
+@dataclass
+class Dataset:
+    name: str
+    row_type: Type[BaseRow]
+    new_row: Callable[[int], BaseRow]
+    order_by: List[str]
+    ascending: List[bool] = field(default_factory=lambda: [True, False])
+
+    def new_rows(self, size: int) -> List[BaseRow]:
+        return [self.new_row(idx) for idx in range(size)]
+
+    def new_table(self) -> BaseTable:
+        return type(f'Table{self.row_type.__name__}', (BaseTable,), {'row_type': self.row_type})()
+
+
+DATASETS: Dict[str, Dataset] = {
+    'ascii': Dataset('ascii', RowBenchAscii, _new_ascii_row, ['Status', 'Value']),
+    'ascii_compact': Dataset('ascii_compact', RowBenchAsciiCompact, _new_ascii_compact_row, ['Status', 'Value']),
+    'cjk': Dataset('cjk', RowBenchCjk, _new_cjk_row, ['City', 'Id']),
+    'datetime': Dataset('datetime', RowBenchDatetime, _new_datetime_row, ['End', 'Id']),
+    'href': Dataset('href', RowBenchHref, _new_href_row, ['Status', 'Id']),
+}
+
+
+class _NullSink:
+    """ text sink discarding everything, print_table is measured without terminal or file io """
+
+    def write(self, text: str) -> int:
+        return len(text)
+
+    def isatty(self) -> bool:
+        # 按终端输出渲染，包括颜色和超链接
+        return True
+
+    def flush(self) -> None:
+        pass
+
+
+def _bench_new_rows(dataset: Dataset, size: int) -> Callable[[], int]:
+    """ build rows from values created beforehand, the peak memory is the memory of the row objects alone """
+    row_type = dataset.row_type
+    names = row_type.get_record_field_names()
+    records = [tuple(getattr(row_data, name) for name in names) for row_data in dataset.new_rows(size)]
+
+    def run() -> int:
+        rows = [row_type(*record) for record in records]
+        return len(rows)
+    return run
+
+
+def _bench_insert_row(dataset: Dataset, size: int) -> Callable[[], int]:
+    rows = dataset.new_rows(size)  # render caches are filled by insert_row, so every run needs new rows
+    table = dataset.new_table()
+
+    def run() -> int:
+        for row_data in rows:
+            table.insert_row(row_data)
+        return size
+    return run
+
+
+# 只读的 benchmark 共用同一张表，避免每次重复插入
+_filled_tables: Dict[Tuple[str, int], BaseTable] = {}
+
+
+def _new_filled_table(dataset: Dataset, size: int) -> BaseTable:
+    key = (dataset.name, size)
+    if key not in _filled_tables:
+        _filled_tables.clear()
+        table = _filled_tables[key] = dataset.new_table()
+        table.insert_rows(dataset.new_rows(size))
+    return _filled_tables[key]
+
+
+def _bench_get_sorted_rows(dataset: Dataset, size: int) -> Callable[[], int]:
+    table = _new_filled_table(dataset, size)
+
+    def run() -> int:
+        table.get_sorted_rows(dataset.order_by, dataset.ascending)
+        return size
+    return run
+
+
+def _bench_get_table_line_str(dataset: Dataset, size: int) -> Callable[[], int]:
+    table = _new_filled_table(dataset, size)
+
+    def run() -> int:
+        get_table_line_str = table.get_table_line_str
+        for row_data in table.row_list:
+            get_table_line_str(row_data)
+        return size
+    return run
+
+
+def _bench_print_table(dataset: Dataset, size: int) -> Callable[[], int]:
+    table = _new_filled_table(dataset, size)
+
+    def run() -> int:
+        stdout = sys.stdout
+        sys.stdout = _NullSink()
+        try:
+            table.print_table()
+        finally:
+            sys.stdout = stdout
+        return size
+    return run
+
+
+def _bench_get_display_ansi_width(dataset: Dataset, size: int) -> Callable[[], int]:
+    table = _new_filled_table(dataset, size)
+    cells = [cell for row_data in table.row_list for cell in row_data.get_render_cache().disp]
+
+    def run() -> int:
+        for cell in cells:
+            get_display_ansi_width(cell)
+        return len(cells)
+    return run
+
+
+def _bench_diff(dataset: Dataset, size: int) -> Callable[[], int]:
+    """ diff with a table where 1% of the rows are removed, 1% are added and 1% are changed """
+    table = _new_filled_table(dataset, size)
+    rows_new = []
+    for idx, row_data in enumerate(table.row_list):
+        if idx % 100 == 0:
+            row_data = dataset.new_row(idx + size)
+        elif idx % 100 == 1:
+            row_data = replace(dataset.new_row(idx + size), Id=row_data.Id)
+        rows_new.append(row_data)
+    table_new = dataset.new_table()
+    table_new.insert_rows(rows_new)
+
+    def run() -> int:
+        table.diff(table_new, key=['Id'])
+        return size
+    return run
+
+
+# 每个 benchmark 返回一个函数，函数执行一次被测操作并返回处理的行数
+# (get_display_ansi_width 为单元格数)
+BENCHES: Dict[str, Callable[[Dataset, int], Callable[[], int]]] = {
+    'new_rows': _bench_new_rows,
+    'insert_row': _bench_insert_row,
+    'get_sorted_rows': _bench_get_sorted_rows,
+    'get_table_line_str': _bench_get_table_line_str,
+    'print_table': _bench_print_table,
+    'get_display_ansi_width': _bench_get_display_ansi_width,
+    'diff': _bench_diff,
+}
+
+
+def run_bench(bench: str, dataset: Dataset, size: int, measure_memory: bool = True) -> Dict[str, float]:
+    """ run one benchmark
+    Returns:
+        Dict[str, float]: ops_per_sec (rows or cells per second, best run), seconds (best run) and peak_mem_kb
+            (memory allocated by the operation at its peak, setup excluded) when measure_memory is True
+    """
+    repeat = REPEAT if size <= LARGE_SIZE else 1
+    best_sec, op_cnt = None, 0
+    for _ in range(repeat):
+        run = BENCHES[bench](dataset, size)
+        gc.collect()
+        start = time.perf_counter()
+        op_cnt = run()
+        sec = time.perf_counter() - start
+        best_sec = sec if best_sec is None else min(best_sec, sec)
+    result = {'ops_per_sec': round(op_cnt / best_sec, 1) if best_sec else 0.0, 'seconds': round(best_sec, 4)}
+
+    if measure_memory:
+        run = BENCHES[bench](dataset, size)
+        gc.collect()
+        tracemalloc.start()
+        try:
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        result['peak_mem_kb'] = round(peak / 1024, 1)
+    return result
+
+
+def run_benches(
+        sizes: List[int], datasets: List[str], benches: List[str], measure_memory: bool = True,
+        ) -> Dict[str, Dict[str, float]]:
+    """ run every benchmark on every dataset and size
+    Returns:
+        Dict[str, Dict[str, float]]: key: <dataset>/<size>/<bench>; value: see run_bench
+    """
+    results = {}
+    for size in sizes:
+        for dataset_name in datasets:
+            for bench in benches:
+                key = f'{dataset_name}/{size}/{bench}'
+                results[key] = run_bench(bench, DATASETS[dataset_name], size, measure_memory=measure_memory)
+                print(f'{key}: {results[key]}', file=sys.stderr, flush=True)
+    _filled_tables.clear()
+    return results
+
+
+@dataclass
+class RowBenchReport(BaseRow):
+    Bench: str = None
+    Rows: int = None
+    __Rows_config: ClassVar[ColumnConfig] = ColumnConfig(align=ColumnAlignment.RIGHT)
+    OpsPerSec: float = None
+    __OpsPerSec_config: ClassVar[ColumnConfig] = ColumnConfig(alias='ops/s', align=ColumnAlignment.RIGHT)
+    BaselineOpsPerSec: Optional[float] = None
+    __BaselineOpsPerSec_config: ClassVar[ColumnConfig] = ColumnConfig(
+        alias='baseline ops/s', align=ColumnAlignment.RIGHT
+    )
+    PeakMemKb: Optional[float] = None
+    __PeakMemKb_config: ClassVar[ColumnConfig] = ColumnConfig(alias='peak KB', align=ColumnAlignment.RIGHT)
+    BaselinePeakMemKb: Optional[float] = None
+    __BaselinePeakMemKb_config: ClassVar[ColumnConfig] = ColumnConfig(
+        alias='baseline peak KB', align=ColumnAlignment.RIGHT
+    )
+    Status: str = None
+    __Status_config: ClassVar[ColumnConfig] = ColumnConfig(
+        conditional_format=CondFmtExactMatch(match_target='REGRESSION')
+    )
+
+
+class TableBenchReport(BaseTable):
+    row_type = RowBenchReport
+
+
+def compare_with_baseline(
+        results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+        tolerance: float = DEFAULT_TOLERANCE, mem_tolerance: float = DEFAULT_MEM_TOLERANCE,
+        ) -> Tuple[TableBenchReport, List[str]]:
+    """ compare results with the baseline results
+    Returns:
+        Tuple[TableBenchReport, List[str]]: report table and the keys that regressed
+    """
+    report = TableBenchReport()
+    regressions = []
+    for key, result in results.items():
+        dataset_name, size, bench = key.split('/')
+        expected = baseline.get(key)
+        status = 'NEW'
+        if expected is not None:
+            status = 'OK'
+            if result['ops_per_sec'] < expected['ops_per_sec'] * (1 - tolerance):
+                status = 'REGRESSION'
+            base_peak, peak = expected.get('peak_mem_kb'), result.get('peak_mem_kb')
+            # 内存很小时忽略波动
+            if base_peak is not None and peak is not None and peak > max(base_peak * (1 + mem_tolerance), 64):
+                status = 'REGRESSION'
+        if status == 'REGRESSION':
+            regressions.append(key)
+        report.insert_row(RowBenchReport(
+            Bench=f'{dataset_name}/{bench}', Rows=int(size), OpsPerSec=result['ops_per_sec'],
+            BaselineOpsPerSec=expected['ops_per_sec'] if expected else None, PeakMemKb=result.get('peak_mem_kb'),
+            BaselinePeakMemKb=expected.get('peak_mem_kb') if expected else None, Status=status,
+        ))
+    return report, regressions
+
+
+def _get_meta() -> Dict[str, Any]:
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'system': platform.system(),
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'href': can_display_href(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+def get_meta_mismatch(baseline_meta: Dict[str, Any], meta: Dict[str, Any]) -> Dict[str, Tuple[Any, Any]]:
+    """ return the MACHINE_META_KEYS that differ between the baseline and this machine
+    Returns:
+        Dict[str, Tuple[Any, Any]]: key: meta key; value: (baseline value, value of this machine)
+    """
+    mismatch = {}
+    for key in MACHINE_META_KEYS:
+        baseline_val, val = baseline_meta.get(key), meta.get(key)
+        if key == 'python':
+            baseline_val, val = (_get_python_minor(version) for version in (baseline_val, val))
+        if baseline_val != val:
+            mismatch[key] = (baseline_val, val)
+    return mismatch
+
+
+def _get_python_minor(version: Optional[str]) -> Optional[str]:
+    return '.'.join(version.split('.')[:2]) if version else version
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='TablePrinter benchmarks')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--datasets', nargs='+', choices=list(DATASETS), default=list(DATASETS))
+    parser.add_argument('--benches', nargs='+', choices=list(BENCHES), default=list(BENCHES))
+    parser.add_argument('--baseline', type=Path, default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--mem-tolerance', type=float, default=DEFAULT_MEM_TOLERANCE)
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc run')
+    parser.add_argument('--output', type=Path, help='also write the results to this JSON file')
+    parser.add_argument(
+        '--allow-foreign-baseline', action='store_true',
+        help='compare with a baseline recorded on a machine with different MACHINE_META_KEYS',
+    )
+    args = parser.parse_args(argv)
+
+    results = run_benches(args.sizes, args.datasets, args.benches, measure_memory=not args.no_memory)
+    meta = _get_meta()
+    if args.output:
+        args.output.write_text(json.dumps({'meta': meta, 'results': results}, indent=2), encoding='utf-8')
+
+    baseline: Dict[str, Dict[str, float]] = {}
+    meta_mismatch: Dict[str, Tuple[Any, Any]] = {}
+    if args.baseline.exists():
+        baseline_data = json.loads(args.baseline.read_text(encoding='utf-8'))
+        baseline = baseline_data['results']
+        meta_mismatch = get_meta_mismatch(baseline_data.get('meta', {}), meta)
+    if args.update_baseline:
+        # 同一台机器只更新本次运行的项，其他项保留; 其他机器的基线整体替换
+        baseline = {} if meta_mismatch else baseline
+        baseline.update(results)
+        args.baseline.write_text(
+            json.dumps({'meta': meta, 'results': baseline}, indent=2, sort_keys=True) + '\n', encoding='utf-8'
+        )
+        print(f'baseline written to {args.baseline}')
+        return 0
+
+    if meta_mismatch and not args.allow_foreign_baseline:
+        print(
+            f'baseline recorded on another machine: {meta_mismatch}. Run with --update-baseline to record a baseline '
+            'on this machine, or with --allow-foreign-baseline to compare anyway', file=sys.stderr,
+        )
+        return 2
+    if meta_mismatch:
+        print(f'comparing with a baseline recorded on another machine: {meta_mismatch}', file=sys.stderr)
+    report, regressions = compare_with_baseline(results, baseline, args.tolerance, args.mem_tolerance)
+    report.print_table()
+    if regressions:
+        print(f'{len(regressions)} regression(s) over the baseline: {regressions}', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
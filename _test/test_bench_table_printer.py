@@ -0,0 +1,80 @@
+import json
+import sys
+from pathlib import Path
+
+PROJ_PATH = str(Path(__file__).resolve().parent.parent)
+if PROJ_PATH not in sys.path:
+    sys.path.insert(0, PROJ_PATH)
+
+from _bench.bench_table_printer import (  # noqa: E402
+    BENCHES, DATASETS, compare_with_baseline, get_meta_mismatch, main, run_bench, run_benches
+)
+
+
+def test_bench_table_printer():
+    print('test benchmark suite smoke run and baseline comparison')
+    results = run_benches([200], list(DATASETS), list(BENCHES), measure_memory=True)
+    assert len(results) == len(DATASETS) * len(BENCHES)
+    assert all(result['ops_per_sec'] > 0 and 'peak_mem_kb' in result for result in results.values())
+
+    # 基线快 10 倍 -> 全部判定为性能回退
+    baseline_fast = {key: {**result, 'ops_per_sec': result['ops_per_sec'] * 10} for key, result in results.items()}
+    report, regressions = compare_with_baseline(results, baseline_fast)
+    report.print_table(limit=5)
+    assert sorted(regressions) == sorted(results)
+
+    baseline_slow = {key: {**result, 'ops_per_sec': result['ops_per_sec'] / 10} for key, result in results.items()}
+    assert compare_with_baseline(results, baseline_slow)[1] == []
+
+    # 内存增长超过容忍度同样判定为回退
+    key = 'ascii/200/insert_row'
+    result = {key: {'ops_per_sec': 100.0, 'seconds': 2.0, 'peak_mem_kb': 2048.0}}
+    assert compare_with_baseline(result, {key: {**result[key], 'peak_mem_kb': 1024.0}})[1] == [key]
+    assert compare_with_baseline(result, {key: {**result[key], 'peak_mem_kb': 1900.0}})[1] == []
+
+
+def test_bench_compact_row_memory():
+    print('test compact rows take less memory than the default rows')
+    size = 20000
+    row_mem = {name: run_bench('new_rows', DATASETS[name], size)['peak_mem_kb'] for name in ('ascii', 'ascii_compact')}
+    print({name: f'{mem_kb * 1024 / size:.0f} bytes/row' for name, mem_kb in row_mem.items()})
+    assert row_mem['ascii_compact'] < row_mem['ascii'] * 0.8
+
+
+def test_bench_table_printer_main(tmp_path):
+    baseline = tmp_path / 'baseline.json'
+    args = [
+        '--sizes', '100', '--datasets', 'ascii', '--benches', 'insert_row', '--no-memory', '--baseline', str(baseline),
+    ]
+    assert main([*args, '--update-baseline']) == 0 and baseline.exists()
+    assert main([*args, '--tolerance', '0.99']) == 0
+
+    # 基线快 1000 倍: 同一台机器判定为回退
+    baseline_data = json.loads(baseline.read_text(encoding='utf-8'))
+    for result in baseline_data['results'].values():
+        result['ops_per_sec'] *= 1000
+    baseline.write_text(json.dumps(baseline_data), encoding='utf-8')
+    assert main(args) == 1
+
+    # cpu_count 和 python 的 patch 版本不影响比较
+    meta = baseline_data['meta']
+    python_minor = '.'.join(meta['python'].split('.')[:2])
+    assert get_meta_mismatch({**meta, 'cpu_count': 64, 'python': f'{python_minor}.99'}, meta) == {}
+
+    # 其他机器的基线: 默认以状态 2 退出，--allow-foreign-baseline 时照常判定回退
+    baseline_data['meta'] = {**meta, 'machine': 'other-arch'}
+    baseline.write_text(json.dumps(baseline_data), encoding='utf-8')
+    assert get_meta_mismatch(baseline_data['meta'], meta) == {'machine': ('other-arch', meta['machine'])}
+    assert main(args) == 2
+    assert main([*args, '--allow-foreign-baseline']) == 1
+
+    # 在其他机器上更新基线时整体替换，不保留其他机器的结果
+    baseline_data['results']['ascii/100/other'] = {'ops_per_sec': 1.0, 'seconds': 1.0}
+    baseline.write_text(json.dumps(baseline_data), encoding='utf-8')
+    assert main([*args, '--update-baseline']) == 0
+    baseline_data = json.loads(baseline.read_text(encoding='utf-8'))
+    assert list(baseline_data['results']) == ['ascii/100/insert_row']
+    assert baseline_data['meta']['machine'] == meta['machine']
+
+if __name__ == '__main__':
+    test_bench_table_printer()
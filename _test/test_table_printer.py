@@ -1,20 +1,35 @@
+import asyncio
+import io
+import json
 import logging
+import sqlite3
 import sys
+import threading
 import time
-from dataclasses import dataclass, field
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from dataclasses import asdict, astuple, dataclass, field, fields
+from datetime import date, datetime
+from decimal import Decimal
 from pathlib import Path
-from typing import ClassVar
+from typing import ClassVar, Optional
 
 PROJ_PATH = str(Path(__file__).resolve().parent.parent)
 if PROJ_PATH not in sys.path:
     sys.path.insert(0, PROJ_PATH)
 
+import TablePrinter.table_printer as table_printer  # noqa: E402
+from ColorHelper.color_xterm_256 import ColorXTerm256  # noqa: E402
 from TablePrinter.table_printer import (  # noqa: E402
     BaseRow, BaseTable,
-    ColumnAlignment, ColumnConfig, CondFmtContain, CondFmtExactMatch, get_display_ansi_width
+    ColumnAlignment, ColumnConfig, ColumnTruncation, CondFmtContain, CondFmtExactMatch, CondFmtRange, CondFmtRegex,
+    FontFormat, TerminalCapabilities, get_display_ansi_width, get_terminal_capabilities
 )
+from TablePrinter.table_printer_columnar import ColumnarTable  # noqa: E402
+from TablePrinter.table_printer_concurrent import ConcurrentTable  # noqa: E402
 from TablePrinter.table_printer_consts import BoxDrawingChar  # noqa: E402
+from TablePrinter.table_printer_live import LiveTable  # noqa: E402
+from TablePrinter.table_printer_sqlite import SqliteTable  # noqa: E402
 
 
 @dataclass
@@ -186,6 +201,64 @@ def test_table_with_conditional_formatting():
     table.print_table()
 
 
+def test_table_with_conditional_formatting_rules():
+    print('test print table with a list of conditional formatting rules per column')
+    fmt_warn = FontFormat(BgColor=ColorXTerm256.YELLOW, FgColor=ColorXTerm256.BLACK)
+    fmt_ok = FontFormat(BgColor=ColorXTerm256.GREEN, FgColor=ColorXTerm256.BLACK)
+
+    @dataclass
+    class RowCondFmtRulesExample(BaseRow):
+        Host: str = None
+        __Host_config = ColumnConfig(conditional_format=[
+            CondFmtExactMatch(match_target=['db-01', 'db-02']),
+            CondFmtContain(contain_target=['-test', '-dev'], format=fmt_warn),
+        ])
+        Status: int = None
+        __Status_config = ColumnConfig(conditional_format=[
+            CondFmtRange(min_value=500),
+            CondFmtRange(min_value=400, max_value=499, format=fmt_warn),
+            CondFmtRegex(pattern=r'^2\d\d$', format=fmt_ok),
+        ])
+
+    class TableCondFmtRulesExample(BaseTable):
+        row_type = RowCondFmtRulesExample
+
+    table = TableCondFmtRulesExample()
+    hosts = ['db-01', 'web-test', 'web-01', 'db-02', 'api-dev']
+    statuses = [200, 204, 302, 404, 500, 503]
+    table.insert_rows(
+        RowCondFmtRulesExample(Host=hosts[idx % len(hosts)], Status=statuses[idx % len(statuses)])
+        for idx in range(3000)
+    )
+    table.print_table(limit=len(hosts) * len(statuses))
+
+    def get_fmt_prefix(font_format: FontFormat) -> str:
+        return font_format.apply_format('').replace('\033[0m', '')
+
+    fmt_default = CondFmtContain().format
+    render_line = RowCondFmtRulesExample.get_line_renderer(table.CHAR_COL_SEP, True)
+    col_width = table._get_col_width(table.get_col_disp_len_map())
+    for row_data in table.row_list:
+        host_cell, status_cell = render_line(row_data.get_render_cache(), col_width).split(table.CHAR_COL_SEP)
+        if row_data.Host.startswith('db-'):
+            assert host_cell.startswith(get_fmt_prefix(fmt_default))
+        elif row_data.Host.endswith(('-test', '-dev')):
+            assert host_cell.startswith(get_fmt_prefix(fmt_warn))
+        else:
+            assert '\033' not in host_cell
+        if row_data.Status >= 500:
+            assert status_cell.startswith(get_fmt_prefix(fmt_default))
+        elif row_data.Status >= 400:
+            assert status_cell.startswith(get_fmt_prefix(fmt_warn))
+        elif row_data.Status < 300:
+            assert status_cell.startswith(get_fmt_prefix(fmt_ok))
+        else:
+            assert '\033' not in status_cell
+
+    # 每个不同的值只匹配一次
+    assert [matcher.match_cnt for matcher in render_line.cond_fmt_matchers] == [len(hosts), len(statuses)]
+
+
 def test_override_logger_handler():
     """演示如何覆写 TablePrinter 的默认 logger handler"""
     print('test override logger handler', '=' * 50)
@@ -257,6 +330,972 @@ def test_table_with_href():
     table_url.print_table()
 
 
+def test_table_write_table():
+    print('test write table to text and binary sinks')
+    table = TableEmployeeExample()
+    for idx in range(100):
+        table.insert_row(RowEmployeeExample(Name=f'员工 {idx}', Age=20 + idx % 30, Salary=1000 * (idx % 7)))
+
+    lines = list(table.iter_table_lines(order_by=['Salary', 'Name']))
+    expected = ''.join(f'{line}{table.CHAR_LN}' for line in lines)
+
+    # small chunk_size forces multiple writes
+    text_sink = io.StringIO()
+    table.write_table(text_sink, order_by=['Salary', 'Name'], chunk_size=256)
+    print(text_sink.getvalue()[:300])
+    assert text_sink.getvalue() == expected
+
+    binary_sink = io.BytesIO()
+    table.write_table(binary_sink, order_by=['Salary', 'Name'], chunk_size=256)
+    assert binary_sink.getvalue() == expected.encode('utf-8')
+
+    # print_table 的输出与基线相同: 最后一行以 \n 结尾，之后是空行
+    stdout = io.StringIO()
+    with redirect_stdout(stdout):
+        table.print_table(order_by=['Salary', 'Name'], caps=TerminalCapabilities())
+    assert stdout.getvalue() == table.CHAR_LN.join(lines) + '\n\n'
+
+
+def test_table_write_table_workers():
+    print('test write table rendered by worker processes')
+    table = TableEmployeeExample()
+    table.insert_rows(
+        RowEmployeeExample(Name=f'员工 {idx}', Age=20 + idx % 30, Salary=1000 * (idx % 7)) for idx in range(10000)
+    )
+    serial_sink = io.StringIO()
+    table.write_table(serial_sink, order_by=['Salary', 'Name'])
+    parallel_sink = io.StringIO()
+    table.write_table(parallel_sink, order_by=['Salary', 'Name'], workers=2)
+    print(parallel_sink.getvalue()[:300])
+    # chunks are written back in order
+    assert parallel_sink.getvalue() == serial_sink.getvalue()
+
+    # rows that are not formatted yet are formatted by the workers, not in this process
+    for row_data in table.row_list:
+        row_data.invalidate_render_cache()
+    stats = table.enable_stats()
+    parallel_sink = io.StringIO()
+    table.write_table(parallel_sink, order_by=['Salary', 'Name'], workers=2)
+    assert parallel_sink.getvalue() == serial_sink.getvalue()
+    assert all(row_data._render_cache is None for row_data in table.row_list)
+    assert stats.counters['lines_rendered'] == 10000 + 2 and stats.phase_sec['render'] >= 0
+
+
+def test_table_export():
+    print('test export table as csv, tsv, jsonl, markdown and html')
+    table = TableExample()
+    table.insert_row(RowExample(ColInt=1, ColStr='a, "quoted" | text', LastModifiedDate=datetime(2024, 1, 2, 3, 4, 5)))
+    table.insert_row(RowExample(ColInt=2, ColStr='中文', ColStrCn='hidden', LastModifiedDate=datetime(2024, 1, 3)))
+
+    csv_sink = io.StringIO()
+    assert table.export_table(csv_sink, 'csv', order_by=['ColInt'], ascending=[False]) == 2
+    print(csv_sink.getvalue())
+    # hidden columns are skipped, headers use the alias and datetime uses the column format
+    assert csv_sink.getvalue().splitlines() == [
+        'ColInt,EN column alias,最后修改日期',
+        '2,中文,2024-01-03 00:00:00',
+        '1,"a, ""quoted"" | text",2024-01-02 03:04:05',
+    ]
+
+    jsonl_sink = io.BytesIO()
+    table.export_table(jsonl_sink, 'jsonl')
+    records = [json.loads(line) for line in jsonl_sink.getvalue().decode('utf-8').splitlines()]
+    print(records)
+    assert records[0] == {
+        'ColInt': 1, 'EN column alias': 'a, "quoted" | text', '最后修改日期': '2024-01-02 03:04:05'
+    }
+
+    markdown_sink = io.StringIO()
+    table.export_table(markdown_sink, 'markdown')
+    print(markdown_sink.getvalue())
+    assert markdown_sink.getvalue().splitlines()[:3] == [
+        '| ColInt | EN column alias | 最后修改日期 |',
+        '| :---: | :--- | :---: |',
+        '| 1 | a, "quoted" \\| text | 2024-01-02 03:04:05 |',
+    ]
+
+    for fmt in ('tsv', 'html'):
+        sink = io.StringIO()
+        table.export_table(sink, fmt)
+        print(sink.getvalue())
+
+
+def test_table_update_row():
+    print('test update row refreshes the cached rendering')
+    table = TableEmployeeExample()
+    row = RowEmployeeExample(Name='Rylee Mcdaniel', Age=21, Salary=5000)
+    table.insert_row(row)
+    table.insert_row(RowEmployeeExample(Name='Miley Ritter', Age=25, Salary=6000))
+    line_before = table.get_table_line_str(row)
+    assert row.get_render_cache() is row.get_render_cache()
+
+    table.update_row(row, Name='Rylee Mcdaniel-Hinton', Salary=123456)
+    line_after = table.get_table_line_str(row)
+    assert line_before != line_after and 'Rylee Mcdaniel-Hinton' in line_after and '123456' in line_after
+    table.print_table()
+
+
+def test_display_width():
+    print('test display width of ascii, latin, wide, combining and zero width characters')
+    cases = [
+        ('aF', 2), ('', 0), ('café', 4), ('中', 2), ('中a', 3), ('ｆｕｌｌ', 8), ('한국어', 6),
+        ('e\u0301', 1),  # e + combining acute accent
+        ('👨\u200d👩\u200d👧', 6),  # zero width joiner takes no space
+        ('❤\ufe0f', 1),  # variation selector takes no space
+    ]
+    for text, width in cases:
+        print(repr(text), get_display_ansi_width(text))
+        assert get_display_ansi_width(text) == width, text
+
+
+def test_columnar_table():
+    print('test columnar table')
+
+    class ColumnarEmployeeExample(ColumnarTable):
+        row_type = RowEmployeeExample
+
+    table = TableEmployeeExample()
+    table_columnar = ColumnarEmployeeExample()
+    for idx in range(50):
+        row = RowEmployeeExample(
+            Name=f'员工 {idx % 7}', Age=20 + idx % 30, Salary=1000 * (idx % 7),
+            InsertDt=datetime(2024, 1, 1, idx % 24),
+        )
+        table.insert_row(row)
+        table_columnar.insert_row(row)
+    # None in an int column makes the column fall back to a plain list
+    row = RowEmployeeExample(Name='Nobody', Age=None, Salary=0, InsertDt=datetime(2024, 1, 2))
+    table.insert_row(row)
+    table_columnar.insert_row(row)
+
+    order_by, ascending = ['Salary', 'InsertDt'], [False, True]
+    lines = list(table.iter_table_lines(order_by=order_by, ascending=ascending))
+    lines_columnar = list(table_columnar.iter_table_lines(order_by=order_by, ascending=ascending))
+    assert lines == lines_columnar
+    table_columnar.print_table(order_by=['Age', 'Name'])
+
+    rows_filtered = table_columnar.filter_rows('Name', lambda name: name.endswith('3'))
+    assert list(rows_filtered) == [row for row in table.row_list if row.Name.endswith('3')]
+
+
+def test_table_bulk_insert():
+    print('test bulk insert from rows, records and DB-API cursor')
+
+    @dataclass
+    class RowScoreExample(BaseRow):
+        Id: int = -1
+        Name: str = 'NA'
+        Score: float = 0.0
+
+    class TableScoreExample(BaseTable):
+        row_type = RowScoreExample
+
+    class ColumnarScoreExample(ColumnarTable):
+        row_type = RowScoreExample
+
+    records = [(idx, f'名字{idx % 13}', idx * 1.5) for idx in range(1000)]
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE score (Id INTEGER, Name TEXT, Score REAL)')
+    conn.executemany('INSERT INTO score VALUES (?, ?, ?)', records)
+
+    table_rows = TableScoreExample.from_iterable(
+        RowScoreExample(Id=idx, Name=name, Score=score) for idx, name, score in records
+    )
+    table_records = TableScoreExample.from_records(
+        [dict(Id=idx, Name=name, Score=score) for idx, name, score in records], batch_size=128
+    )
+    table_cursor = TableScoreExample.from_cursor(conn.execute('SELECT * FROM score'), batch_size=100)
+    table_columnar = ColumnarScoreExample.from_cursor(conn.execute('SELECT * FROM score'), batch_size=100)
+    conn.close()
+
+    lines = list(table_rows.iter_table_lines(order_by=['Name', 'Score'], ascending=[True, False]))
+    for table in (table_records, table_cursor, table_columnar):
+        assert len(table.row_list) == len(records)
+        assert list(table.iter_table_lines(order_by=['Name', 'Score'], ascending=[True, False])) == lines
+    print('\n'.join(lines[:5]))
+
+
+def test_table_sort_index():
+    print('test sort index kept up to date while rows are inserted')
+    table = TableEmployeeExample()
+    order_by, ascending = ['Salary', 'Age', 'Name'], [False, True, False]
+    sort_index = table.register_sort_index(order_by, ascending)
+
+    for idx in range(200):
+        table.insert_row(RowEmployeeExample(
+            Name=f'Name {idx % 17}', Age=None if idx % 11 == 0 else 20 + idx % 9, Salary=1000 * (idx % 5)
+        ))
+    table.insert_rows([RowEmployeeExample(Name=f'Bulk {idx}', Age=30, Salary=1000 * (idx % 3)) for idx in range(100)])
+    table.update_row(table.row_list[0], Salary=99999)
+    assert len(sort_index) == len(table.row_list)
+
+    rows_indexed = table.get_sorted_rows(order_by, ascending)
+    table.drop_sort_index(order_by, ascending)
+    rows_sorted = table.get_sorted_rows(order_by, ascending)
+    assert list(map(id, rows_indexed)) == list(map(id, rows_sorted)) and rows_indexed[0] is table.row_list[0]
+
+    # None is ordered first when ascending, same result as sorting by the columns one by one
+    rows_expected = list(table.row_list)
+    for attr_name, asc in zip(order_by[::-1], ascending[::-1]):
+        rows_expected = sorted(
+            rows_expected, key=lambda row, _a=attr_name: (getattr(row, _a) is not None, getattr(row, _a)),
+            reverse=not asc,
+        )
+    assert list(map(id, rows_sorted)) == list(map(id, rows_expected))
+    table.print_table(order_by=['Age'], ascending=[False])
+
+
+def test_table_window():
+    print('test print a window of the table')
+
+    class ColumnarEmployeeExample(ColumnarTable):
+        row_type = RowEmployeeExample
+
+    rows = [
+        RowEmployeeExample(
+            Name=f'Name {idx:03}', Age=20 + idx % 9, Salary=1000 * (idx % 5), InsertDt=datetime(2024, 1, 1)
+        )
+        for idx in range(300)
+    ]
+    table = TableEmployeeExample.from_iterable(rows)
+    table_columnar = ColumnarEmployeeExample.from_iterable(rows)
+    order_by, ascending = ['Salary', 'Name'], [False, True]
+    lines_all = list(table.iter_table_lines(order_by=order_by, ascending=ascending))
+    header = lines_all[:2]
+
+    for tbl in (table, table_columnar):
+        assert list(tbl.iter_table_lines(offset=20, limit=10)) == header + list(table.iter_table_lines())[22:32]
+        assert list(tbl.iter_table_lines(order_by, ascending, offset=20, limit=10)) == header + lines_all[22:32]
+        assert list(tbl.iter_table_lines(order_by, ascending, tail=5)) == header + lines_all[-5:]
+        assert list(tbl.iter_table_lines(order_by, ascending, offset=297, limit=10)) == header + lines_all[-3:]
+    table.register_sort_index(order_by, ascending)
+    assert list(table.iter_table_lines(order_by, ascending, offset=20, limit=10)) == header + lines_all[22:32]
+
+    table.insert_row(RowEmployeeExample(Name='A very very long name', Age=99, Salary=0))
+    table.print_table(order_by=order_by, ascending=ascending, limit=3)
+    table.print_table(order_by=order_by, ascending=ascending, limit=3, fit_window=True)
+    table.print_table(tail=2)
+
+
+def test_table_delete_row():
+    print('test delete and update rows shrink the column widths')
+    table = TableEmployeeExample()
+    order_by = ['Salary', 'Name']
+    table.register_sort_index(order_by)
+    table.insert_rows(
+        RowEmployeeExample(Name=f'Name {idx}', Age=20 + idx, Salary=1000 * (idx % 5), InsertDt=datetime(2024, 1, 1))
+        for idx in range(100)
+    )
+    row_widest = RowEmployeeExample(Name='The widest name of the table', Age=1, Salary=123456789)
+    table.insert_row(row_widest)
+    row_wide = RowEmployeeExample(Name='A rather wide name', Age=2, Salary=0)
+    table.insert_row(row_wide)
+
+    def assert_same_as_rebuilt():
+        table_rebuilt = TableEmployeeExample.from_iterable(table.row_list)
+        assert list(table.iter_table_lines(order_by)) == list(table_rebuilt.iter_table_lines(order_by))
+
+    table.delete_row(row_widest)
+    assert_same_as_rebuilt()
+    table.update_row(row_wide, Name='Short')
+    assert_same_as_rebuilt()
+    assert table.delete_where(lambda row: row.Age >= 100) == 20
+    assert len(table.row_list) == 81
+    assert_same_as_rebuilt()
+    # 批量删除只遍历一次 row_list，有不在表中的行时不删除任何行
+    try:
+        table.delete_rows([table.row_list[0], row_widest])
+    except ValueError as e:
+        print(f'expected error: {e}')
+    else:
+        raise AssertionError('ValueError expected')
+    assert len(table.row_list) == 81
+    assert table.delete_rows(table.row_list[::2]) == 41 and len(table.row_list) == 40
+    assert_same_as_rebuilt()
+    assert table.delete_where(lambda row: True) == 40
+    assert_same_as_rebuilt()
+    table.print_table()
+
+
+def test_live_table():
+    print('test live table only renders dirty rows')
+
+    class LiveEmployeeExample(LiveTable):
+        row_type = RowEmployeeExample
+
+    table = LiveEmployeeExample()
+    rows = [
+        RowEmployeeExample(Name=f'Worker {idx:02}', Age=20 + idx, Salary=1000, InsertDt=datetime(2024, 1, 1))
+        for idx in range(10)
+    ]
+    table.insert_rows(rows)
+    table.render_frame()
+    assert table.frame_rendered_line_cnt == 10
+
+    table.update_row(rows[3], Salary=2000)
+    table.insert_row(RowEmployeeExample(Name='Worker 10', Age=30, Salary=1000, InsertDt=datetime(2024, 1, 1)))
+    table.delete_row(rows[5])
+    table.render_frame()
+    assert table.frame_rendered_line_cnt == 2
+
+    # a wider value changes the column width, every line is laid out again
+    table.update_row(rows[0], Salary=1234567)
+    table.render_frame()
+    assert table.frame_rendered_line_cnt == 10
+    assert table.get_frame_lines() == list(table.iter_table_lines())
+
+    # render_frame 按 sys.stdout 检测输出能力，重定向到文件时没有颜色
+    table.update_row(rows[1], Salary=99999)
+    stdout = io.StringIO()
+    with redirect_stdout(stdout):
+        table.render_frame()
+    assert table._frame_caps == get_terminal_capabilities(stdout) and not table._frame_caps.can_disp_color
+    color_caps = TerminalCapabilities(color_depth=table_printer.COLOR_DEPTH_256, hyperlinks=True)
+    with redirect_stdout(io.StringIO()):
+        table.render_frame(caps=color_caps)
+    assert table._frame_caps == color_caps
+    print()
+
+
+def test_line_renderer():
+    print('test line renderer is compiled once per row type')
+    table = TableExample()
+    table.insert_row(RowExample(ColInt=1, ColStr='中文', LastModifiedDate=datetime(2024, 1, 1)))
+    table.insert_row(RowExample(ColInt=12345, ColStr='some text', LastModifiedDate=datetime(2024, 1, 1)))
+    render_line = RowExample.get_line_renderer(table.CHAR_COL_SEP, False)
+    assert RowExample.get_line_renderer(table.CHAR_COL_SEP, False) is render_line
+    assert RowEmployeeExample.get_line_renderer(table.CHAR_COL_SEP, False) is not render_line
+
+    # ColInt is centered, ColStr is left aligned and 中文 takes 4 columns
+    line = render_line(table.row_list[0].get_render_cache(), (7, 15, 19))
+    assert line == table.CHAR_COL_SEP.join(['    1    ', ' 中文            ', ' 2024-01-01 00:00:00 '])
+    table.print_table()
+    print()
+
+
+def test_sqlite_table():
+    print('test table spilled to sqlite')
+
+    class SqliteEmployeeExample(SqliteTable):
+        row_type = RowEmployeeExample
+
+    rows = [
+        RowEmployeeExample(
+            Name=f'员工 {idx}', Age=20 + idx % 30, Salary=1000 * (idx % 7), InsertDt=datetime(2024, 1, 1)
+        )
+        for idx in range(300)
+    ]
+    table_mem = TableEmployeeExample()
+    table_mem.insert_rows(rows)
+    table = SqliteEmployeeExample(page_size=64, row_cache_size=100)
+    table.insert_rows(rows)
+    assert table.row_count == 300
+
+    # sorting and windows run in sqlite and give the same output as the in memory table
+    windows = [{}, {'order_by': ['Salary', 'Age'], 'ascending': [False, True], 'offset': 10, 'limit': 20}, {'tail': 5}]
+    for kwargs in windows:
+        assert list(table.iter_table_lines(**kwargs)) == list(table_mem.iter_table_lines(**kwargs))
+    table.print_table(order_by=['Age'], limit=5)
+
+    rich = table.query_rows('"Salary" >= ?', (6000,), order_by=['Age'], ascending=[False])
+    assert len(rich) == len([row_data for row_data in rows if row_data.Salary >= 6000])
+    assert rich[0].Age == 49 and rich[0].InsertDt == datetime(2024, 1, 1)
+
+    table.update_row(rich[0], Name='Employee with a long name')
+    assert table.get_col_disp_len_map()['Name'] == len('Employee with a long name')
+    assert table.delete_where_sql('"Name" = ?', ('Employee with a long name',)) == 1
+    assert table.get_col_disp_len_map()['Name'] == get_display_ansi_width('员工 100')
+    assert table.delete_where(lambda row_data: row_data.Salary == 0) == 43
+    table.delete_row(table.row_list[0])
+    assert table.delete_rows(table.row_list[:2]) == 2
+    assert table.row_count == 300 - 1 - 43 - 1 - 2
+    table.close()
+    print()
+
+
+def test_sqlite_table_types():
+    print('test sqlite sorting and None filtering match BaseTable for optional, date, Decimal and pickled columns')
+
+    @dataclass
+    class RowTypesExample(BaseRow):
+        Name: str = ''
+        Score: Optional[int] = None
+        Day: date = None
+        Price: Decimal = None
+        Tags: tuple = None  # sqlite 不能直接保存，按 pickle 保存
+
+    class TableTypesExample(BaseTable):
+        row_type = RowTypesExample
+
+    class SqliteTypesExample(SqliteTable):
+        row_type = RowTypesExample
+
+    rows = [
+        RowTypesExample('a', 300, date(2024, 3, 1), Decimal('10.50'), (2,)),
+        RowTypesExample('b', None, None, Decimal('9.75'), (1,)),
+        RowTypesExample('c', 1, date(2023, 12, 31), None, None),
+        RowTypesExample('d', 70000, date(2024, 1, 5), Decimal('100'), (3,)),
+        RowTypesExample('e', 2, None, Decimal('-1'), (0, 5)),
+    ]
+    table_mem = TableTypesExample()
+    table_mem.insert_rows(rows)
+    table = SqliteTypesExample()
+    table.insert_rows(rows)
+    caps = TerminalCapabilities()
+    for attr_name in ['Score', 'Day', 'Price', 'Tags']:
+        for asc in [True, False]:
+            expected = [row_data.Name for row_data in table_mem.get_sorted_rows([attr_name], [asc])]
+            assert [row_data.Name for row_data in table.get_sorted_rows([attr_name], [asc])] == expected
+            kwargs = {'order_by': [attr_name], 'ascending': [asc], 'limit': 3}
+            lines_mem = list(table_mem.iter_table_lines(caps=caps, **kwargs))
+            assert list(table.iter_table_lines(caps=caps, **kwargs)) == lines_mem
+    assert [row_data.Name for row_data in table.get_sorted_rows(['Score'])] == ['b', 'c', 'e', 'a', 'd']
+
+    for col_values in [{'Score': None}, {'Day': None}, {'Tags': None}, {'Price': Decimal('10.5')}, {'Tags': (1,)}]:
+        expected = [row_data.Name for row_data in table_mem.where(**col_values).row_list]
+        assert [row_data.Name for row_data in table.where(**col_values).row_list] == expected and expected
+    assert [row_data.Price for row_data in table.row_list] == [row_data.Price for row_data in rows]
+    try:
+        table.create_index(['Tags'])
+    except ValueError as e:
+        print(f'expected error: {e}')
+    else:
+        raise AssertionError('ValueError expected')
+    table.close()
+    print()
+
+
+def test_table_where_select():
+    print('test where, select and hash indexes')
+    table = TableEmployeeExample()
+    table.insert_rows(
+        RowEmployeeExample(
+            Name=f'员工 {idx % 10}', Age=20 + idx % 30, Salary=1000 * (idx % 7), InsertDt=datetime(2024, 1, 1)
+        )
+        for idx in range(1000)
+    )
+    expected = [row_data for row_data in table.row_list if row_data.Name == '员工 3' and row_data.Salary == 2000]
+    view_scan = table.where(Name='员工 3', Salary=2000)
+    table.create_hash_index('Name')
+    view_index = table.where(Name='员工 3', Salary=2000)
+    # the view shares the row objects of the table
+    assert all(a is b for a, b in zip(view_scan.row_list, expected)) and len(view_scan.row_list) == len(expected)
+    assert all(a is b for a, b in zip(view_index.row_list, expected)) and len(view_index.row_list) == len(expected)
+    view_index.print_table(limit=3)
+
+    # the index follows updates and deletes
+    table.update_row(expected[0], Name='员工 X')
+    table.delete_row(expected[1])
+    assert table.where(Name='员工 3', Salary=2000).row_count == len(expected) - 2
+    assert table.where(Name='员工 X').row_list == [expected[0]]
+
+    projection = table.where(lambda row_data: row_data.Age > 45).select(['Salary', 'Name'])
+    lines = list(projection.iter_table_lines(order_by=['Salary'], limit=3, fit_window=True))
+    print('\n'.join(lines))
+    assert lines[0].split(table.CHAR_COL_SEP)[0].strip() == '工资' and lines[0].count(table.CHAR_COL_SEP) == 1
+    csv_sink = io.StringIO()
+    projection.export_table(csv_sink, limit=1)
+    assert csv_sink.getvalue().splitlines()[0] == '工资,名字'
+    print()
+
+
+def test_table_aggregation():
+    print('test group by aggregations and footer')
+    table = TableEmployeeExample()
+    table.insert_rows(
+        RowEmployeeExample(
+            Name=f'员工 {idx}', Age=20 + idx % 30, Salary=1000 * (idx % 4), InsertDt=datetime(2024, 1, 1)
+        )
+        for idx in range(100)
+    )
+    aggregation = table.register_aggregation(['Salary'], {'Age': ['count', 'sum', 'min', 'max', 'mean']})
+    table.set_footer({'Salary': 'sum', 'Age': 'mean'})
+    table.update_row(table.row_list[0], Salary=9000, Age=99)
+    table.delete_row(table.row_list[1])
+    table.delete_where(lambda row_data: row_data.Age == 25)
+
+    # 与全表扫描的结果对比
+    for salary in {row_data.Salary for row_data in table.row_list}:
+        ages = [row_data.Age for row_data in table.row_list if row_data.Salary == salary]
+        assert aggregation.get_result((salary,)) == {
+            'Age_count': len(ages), 'Age_sum': sum(ages), 'Age_min': min(ages), 'Age_max': max(ages),
+            'Age_mean': sum(ages) / len(ages),
+        }
+    assert aggregation.get_row_count((2000,)) == sum(1 for row_data in table.row_list if row_data.Salary == 2000)
+    assert aggregation.get_result((12345,))['Age_count'] == 0
+
+    # min/max 缓存只在最后一个极值被删除时失效
+    state = table_printer._ColumnAggState(keep_total=False, keep_values=True)
+    for value in [5, 3, 3, 8]:
+        state.add(value)
+    assert (state.min, state.max) == (3, 8)
+    state.remove(3)
+    assert (state.min, state.max) == (3, 8)
+    state.remove(3)
+    state.remove(8)
+    assert (state.min, state.max) == (None, None) and (state.get('min'), state.get('max')) == (5, 5)
+    state.add(1)
+    assert (state.get('min'), state.get('max')) == (1, 5)
+    aggregation.to_table(table.row_type).print_table(order_by=['Salary'])
+
+    lines = list(table.iter_table_lines(limit=3))
+    print('\n'.join(lines))
+    footer_cells = [cell.strip() for cell in lines[-1].split(table.CHAR_COL_SEP)]
+    salary_sum = sum(row_data.Salary for row_data in table.row_list)
+    assert footer_cells[0] == 'Total' and str(salary_sum) in footer_cells
+    assert len(lines) == 2 + 3 + 2 and len({get_display_ansi_width(line) for line in lines}) == 1
+    sink = io.StringIO()
+    table.write_table(sink, limit=3)
+    assert sink.getvalue().splitlines() == lines
+    table.set_footer(None)
+    assert len(list(table.iter_table_lines(limit=3))) == 2 + 3
+    print()
+
+
+def test_table_max_width_auto_fit():
+    print('test column max_width and auto-fit to the line width')
+
+    @dataclass
+    class RowLogExample(BaseRow):
+        Level: str = None
+        Host: str = None
+        __Host_config = ColumnConfig(max_width=8, truncate=ColumnTruncation.MIDDLE)
+        Message: str = None
+        __Message_config = ColumnConfig(max_width=30, align=ColumnAlignment.LEFT)
+        Detail: str = None
+        __Detail_config = ColumnConfig(alias='详细信息')
+
+    class TableLogExample(BaseTable):
+        row_type = RowLogExample
+
+    for table_type in (TableLogExample, type('ColumnarLogExample', (ColumnarTable,), {'row_type': RowLogExample})):
+        table = table_type()
+        table.insert_rows([
+            RowLogExample(Level='INFO', Host='web-01', Message='started', Detail='ok'),
+            RowLogExample(Level='ERROR', Host='db-primary-01', Message='x' * 10240, Detail='连接超时' * 50),
+        ])
+        table.insert_row(RowLogExample(Level='WARN', Host='db-02', Message='重试' * 100, Detail='-'))
+        lines = list(table.iter_table_lines())
+        print('\n'.join(lines))
+        # max_width 限制列宽，不受最长值影响
+        assert table.get_col_disp_len_map()['Message'] == 30 and table.get_col_disp_len_map()['Host'] == 8
+        assert 'db-p…-01' in lines[3] and 'x' * 29 + '…' in lines[3]
+
+    # auto-fit: 最宽的列先被截断，放不下的列从右边去掉
+    lines = list(table.iter_table_lines(max_line_width=60))
+    print('\n'.join(lines))
+    assert {get_display_ansi_width(line) for line in lines} == {60}
+    assert lines[0].count(table.CHAR_COL_SEP) == 3
+    lines = list(table.iter_table_lines(max_line_width=30))
+    print('\n'.join(lines))
+    assert all(get_display_ansi_width(line) <= 30 for line in lines) and lines[0].count(table.CHAR_COL_SEP) < 3
+    sink = io.StringIO()
+    table.write_table(sink, max_line_width=30, workers=2)
+    assert sink.getvalue().splitlines() == lines
+    table.AUTO_FIT = True
+    table.print_table()
+    print()
+
+
+def test_table_stats():
+    print('test per phase stats')
+
+    @dataclass
+    class RowStatsExample(BaseRow):
+        Name: str = None
+        Status: str = None
+        __Status_config = ColumnConfig(conditional_format=CondFmtExactMatch(match_target='FAIL'))
+        InsertDt: datetime = None
+        __InsertDt_config = ColumnConfig(format='%Y-%m-%d')
+
+    class TableStatsExample(BaseTable):
+        row_type = RowStatsExample
+
+    table = TableStatsExample()
+    events = []
+    stats = table.enable_stats(callback=lambda phase, sec, counters: events.append(phase))
+    statuses = ['OK', 'FAIL', 'SKIP']
+    table.insert_rows(
+        RowStatsExample(Name=f'名字 {idx % 50}', Status=statuses[idx % 3], InsertDt=datetime(2024, 1, 1))
+        for idx in range(1000)
+    )
+    table.insert_row(RowStatsExample(Name='single', Status='OK', InsertDt=datetime(2024, 1, 2)))
+    color_caps = TerminalCapabilities(color_depth=256)
+    table.write_table(io.StringIO(), order_by=['Name'], caps=color_caps)
+    print(stats)
+    assert {'format', 'measure', 'sort', 'render', 'cond_fmt', 'write'} <= set(stats.phase_sec)
+    assert stats.counters['cells_formatted'] == 1001 * 3 and stats.counters['cells_measured'] == 1000 * 3
+    assert stats.counters['rows_sorted'] == 1001 and stats.counters['lines_rendered'] == 1001 + 2
+    assert stats.counters['width_cache_hits'] + stats.counters['width_cache_misses'] == 1000
+    assert stats.counters['cond_fmt_evaluations'] <= len(statuses)
+    assert all(sec >= 0 for sec in stats.phase_sec.values()) and events.count('sort') == 1
+
+    # 放不下的列被去掉后使用另一个渲染函数，其条件格式同样计入
+    stats.reset()
+    table.write_table(io.StringIO(), max_line_width=20, caps=color_caps)
+    assert 0 < stats.counters['cond_fmt_evaluations'] <= len(statuses)
+    assert all(sec >= 0 for sec in stats.phase_sec.values())
+
+    # 关闭后不再统计
+    assert table.disable_stats() is stats and table.stats is None
+    table.write_table(io.StringIO(), order_by=['Name'])
+    assert events.count('sort') == 1
+    print()
+
+
+def test_table_terminal_capabilities():
+    print('test terminal capabilities detected once per stream')
+
+    @dataclass
+    class RowCapsExample(BaseRow):
+        Site: str = 'NA'
+        Site_href: str = ''
+        Status: str = 'OK'
+        __Status_config: ClassVar[ColumnConfig] = ColumnConfig(
+            conditional_format=CondFmtExactMatch(match_target='FAIL')
+        )
+
+    class TableCapsExample(BaseTable):
+        row_type = RowCapsExample
+
+    class FakeTerminal(io.StringIO):
+        def isatty(self) -> bool:
+            return True
+
+    table = TableCapsExample()
+    table.insert_rows(
+        RowCapsExample(Site=f'site {idx}', Site_href=f'https://example.com/{idx}', Status=('OK', 'FAIL')[idx % 2])
+        for idx in range(10)
+    )
+
+    # 文件 / 管道: 纯文本
+    sink = io.StringIO()
+    caps = get_terminal_capabilities(sink)
+    assert caps.isatty is False and not caps.can_disp_color and not caps.hyperlinks
+    assert get_terminal_capabilities(sink) is caps
+    table.write_table(sink)
+    assert '\033' not in sink.getvalue() and 'site 1' in sink.getvalue()
+    # 纯文本没有超链接，href 作为普通列输出
+    assert 'Site_href' in sink.getvalue() and 'https://example.com/1' in sink.getvalue()
+
+    # 终端: 颜色和超链接
+    terminal = FakeTerminal()
+    terminal_caps = get_terminal_capabilities(terminal)
+    assert terminal_caps.isatty is True and terminal_caps.hyperlinks == table_printer.can_display_href()
+    color_caps = TerminalCapabilities(color_depth=256, hyperlinks=True, isatty=True)
+    table.write_table(terminal, caps=color_caps)
+    print(terminal.getvalue())
+    assert '\033[' in terminal.getvalue()
+    assert '\x1b]8;;https://example.com/1' in terminal.getvalue() and 'Site_href' not in terminal.getvalue()
+    assert [line.count('\x1b]8;;https') for line in table.iter_table_lines(caps=color_caps)] == [0, 0] + [1] * 10
+
+    # 覆写: 终端上也不输出颜色
+    plain = FakeTerminal()
+    table.write_table(plain, caps=color_caps._replace(color_depth=0, hyperlinks=False))
+    assert plain.getvalue() == sink.getvalue()
+
+    # 渲染时不再检测环境
+    probes = (table_printer.can_display_href, table_printer.can_display_ansi_color, table_printer._detect_color_depth)
+
+    def fail_probe():
+        raise AssertionError('environment probed while rendering')
+    table_printer.can_display_href = table_printer.can_display_ansi_color = fail_probe
+    table_printer._detect_color_depth = fail_probe
+    try:
+        table.write_table(FakeTerminal(), caps=color_caps)
+        table.write_table(io.StringIO(), caps=color_caps, workers=2)
+        lines = list(table.iter_table_lines(caps=color_caps))
+        assert len(lines) == 12
+    finally:
+        table_printer.can_display_href, table_printer.can_display_ansi_color, table_printer._detect_color_depth = probes
+    print()
+
+
+def test_table_compact_rows():
+    print('test compact rows stored without __dict__')
+
+    @dataclass(slots=True)
+    class RowCompactExample(BaseRow):
+        Name: str = None
+        Name_href: str = None
+        Status: str = 'OK'
+        __Status_config: ClassVar[ColumnConfig] = ColumnConfig(
+            alias='状态', conditional_format=CondFmtExactMatch(match_target='FAIL')
+        )
+        Value: float = 0.0
+
+    @dataclass
+    class RowRegularExample(BaseRow):
+        Name: str = None
+        Name_href: str = None
+        Status: str = 'OK'
+        __Status_config: ClassVar[ColumnConfig] = ColumnConfig(
+            alias='状态', conditional_format=CondFmtExactMatch(match_target='FAIL')
+        )
+        Value: float = 0.0
+
+    assert RowCompactExample.is_compact() and not RowRegularExample.is_compact()
+    assert not hasattr(RowCompactExample(), '__dict__')
+    assert RowCompactExample.get_config('Status').alias == '状态'
+
+    # 渲染缓存不是 dataclass field
+    for row_type in (RowCompactExample, RowRegularExample):
+        row = row_type(Name='n', Status='FAIL', Value=1.5)
+        row.get_render_cache()
+        assert '_render_cache' not in [col.name for col in fields(row)]
+        assert asdict(row) == {'Name': 'n', 'Name_href': None, 'Status': 'FAIL', 'Value': 1.5}
+        assert astuple(row) == ('n', None, 'FAIL', 1.5)
+
+    sinks = []
+    for row_type in (RowCompactExample, RowRegularExample):
+        table = type(f'Table{row_type.__name__}', (BaseTable,), {'row_type': row_type})()
+        table.insert_rows(
+            row_type(Name=f'n{idx}', Name_href=f'https://example.com/{idx}', Status=('OK', 'FAIL')[idx % 2], Value=idx)
+            for idx in range(6)
+        )
+        table.update_row(table.row_list[0], Status='FAIL', Value=10.5)
+        table.delete_row(table.row_list[1])
+        sink = io.StringIO()
+        table.write_table(sink, order_by=['Value'], caps=TerminalCapabilities(color_depth=256, hyperlinks=True))
+        sinks.append(sink.getvalue())
+    print(sinks[0])
+    assert sinks[0] == sinks[1]
+
+    class SqliteTableCompactExample(SqliteTable):
+        row_type = RowCompactExample
+    try:
+        SqliteTableCompactExample()
+    except TypeError as e:
+        print(e)
+    else:
+        raise AssertionError('TypeError expected')
+    print()
+
+
+def test_table_async():
+    print('test async line iterator and async writer')
+    table = TableExample()
+    table.insert_rows(RowExample(ColInt=idx, ColStr=f'text {idx % 37}', ColStrCn='中文') for idx in range(3000))
+    caps = TerminalCapabilities()
+    expected = io.StringIO()
+    table.write_table(expected, order_by=['ColStr'], caps=caps)
+
+    class FakeStreamWriter:
+        """ asyncio.StreamWriter: write takes bytes, drain is awaited for backpressure """
+
+        def __init__(self):
+            self.data = bytearray()
+            self.drain_cnt = 0
+
+        def write(self, data: bytes) -> None:
+            self.data += data
+
+        async def drain(self) -> None:
+            self.drain_cnt += 1
+
+    async def run():
+        lines = [line async for line in table.aiter_table_lines(order_by=['ColStr'], caps=caps, batch_size=100)]
+        assert lines == list(table.iter_table_lines(order_by=['ColStr'], caps=caps))
+
+        # 写表的同时其他任务也在运行
+        ticks = 0
+        writing = True
+
+        async def ticker():
+            nonlocal ticks
+            while writing:
+                ticks += 1
+                await asyncio.sleep(0)
+        ticker_task = asyncio.create_task(ticker())
+        writer = FakeStreamWriter()
+        await table.awrite_table(writer, order_by=['ColStr'], chunk_size=4096)
+        writing = False
+        await ticker_task
+        print(f'drain: {writer.drain_cnt}, ticks: {ticks}')
+        assert writer.data.decode('utf-8') == expected.getvalue()
+        assert writer.drain_cnt > 1 and ticks >= writer.drain_cnt
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            writer = FakeStreamWriter()
+            await table.awrite_table(writer, order_by=['ColStr'], executor=executor)
+            assert writer.data.decode('utf-8') == expected.getvalue()
+            lines = [line async for line in table.aiter_table_lines(order_by=['ColStr'], caps=caps, executor=executor)]
+            assert lines == list(table.iter_table_lines(order_by=['ColStr'], caps=caps))
+
+        # 普通的同步 sink
+        sink = io.StringIO()
+        await table.awrite_table(sink, order_by=['ColStr'])
+        assert sink.getvalue() == expected.getvalue()
+
+    asyncio.run(run())
+    print()
+
+
+def test_table_concurrent_insert():
+    print('test concurrent insert from many threads with snapshot rendering')
+
+    class ConcurrentEmployeeExample(ConcurrentTable):
+        row_type = RowEmployeeExample
+        INSERT_BUFFER_ROWS = 50
+
+    table = ConcurrentEmployeeExample()
+    sort_index = table.register_sort_index(['Salary'])
+    table.set_footer({'Salary': 'sum'})
+    thread_cnt, row_cnt = 4, 2000
+    caps = TerminalCapabilities()
+    frames = []
+    producing = threading.Event()
+    producing.set()
+
+    def produce(thread_idx: int) -> None:
+        for idx in range(row_cnt):
+            table.insert_row(RowEmployeeExample(Name=f'T{thread_idx}-{idx}', Age=thread_idx, Salary=idx))
+
+    def render() -> None:
+        while producing.is_set():
+            snapshot = table.snapshot()
+            lines = list(snapshot.iter_table_lines(caps=caps))
+            frames.append((snapshot, lines))
+
+    threads = [threading.Thread(target=produce, args=(thread_idx,)) for thread_idx in range(thread_cnt)]
+    renderer = threading.Thread(target=render)
+    renderer.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    producing.clear()
+    renderer.join()
+
+    # 所有缓冲的行都已合并，每个线程的行保持插入顺序
+    table.flush()
+    assert table.row_count == thread_cnt * row_cnt and len(sort_index) == thread_cnt * row_cnt
+    for thread_idx in range(thread_cnt):
+        assert [row.Salary for row in table.row_list if row.Age == thread_idx] == list(range(row_cnt))
+
+    # 每一帧内的行宽一致，页脚与该帧的行一致
+    print(f'frames rendered while inserting: {len(frames)}')
+    for snapshot, lines in frames:
+        assert len({get_display_ansi_width(line) for line in lines}) == 1
+        salary_sum = str(sum(row.Salary for row in snapshot.row_list)) if snapshot.row_list else ''
+        assert lines[-1].split(BaseTable.CHAR_COL_SEP)[2].strip() == salary_sum
+
+    # 快照不受之后插入的行影响
+    snapshot = table.snapshot()
+    expected = list(snapshot.iter_table_lines(caps=caps))
+    table.insert_rows([RowEmployeeExample(Name='new employee with a long name', Age=99, Salary=10 ** 9)])
+    table.insert_row(RowEmployeeExample(Name='buffered', Age=99, Salary=0))
+    assert list(snapshot.iter_table_lines(caps=caps)) == expected
+    assert table.row_count == thread_cnt * row_cnt + 1
+
+    # 与普通表的输出一致
+    plain = TableEmployeeExample()
+    plain.set_footer({'Salary': 'sum'})
+    table.flush()
+    plain.insert_rows(table.row_list)
+    for kwargs in ({}, {'order_by': ['Salary'], 'limit': 20}, {'order_by': ['Salary'], 'tail': 5}):
+        assert list(table.iter_table_lines(caps=caps, **kwargs)) == list(plain.iter_table_lines(caps=caps, **kwargs))
+    sink, expected = io.StringIO(), io.StringIO()
+    table.write_table(sink, order_by=['Age', 'Salary'], caps=caps)
+    plain.write_table(expected, order_by=['Age', 'Salary'], caps=caps)
+    assert sink.getvalue() == expected.getvalue()
+    assert table.where(Age=99).row_count == 2 and table.where(lambda row: row.Salary == 0).row_count == thread_cnt + 1
+
+    table.delete_where(lambda row: row.Age == 99)
+    assert table.row_count == thread_cnt * row_cnt
+
+    # insert_rows / insert_records 先合并本线程缓冲的行
+    ordered = ConcurrentEmployeeExample()
+    ordered.insert_row(RowEmployeeExample(Name='E1', Age=1, Salary=1))
+    ordered.insert_rows([RowEmployeeExample(Name='E2', Age=1, Salary=2)])
+    ordered.insert_row(RowEmployeeExample(Name='E3', Age=1, Salary=3))
+    ordered.insert_records([{'Name': 'E4', 'Age': 1, 'Salary': 4}])
+    ordered.flush()
+    assert [row.Salary for row in ordered.row_list] == [1, 2, 3, 4]
+    table.print_table(limit=3)
+    print()
+
+
+def test_table_diff():
+    print('test diff of two tables joined on key columns')
+    old, new = TableEmployeeExample(), TableEmployeeExample()
+    old.insert_rows(RowEmployeeExample(Name=f'E{idx}', Age=20 + idx % 30, Salary=1000 + idx) for idx in range(1000))
+    new.insert_rows(
+        RowEmployeeExample(Name=f'E{idx}', Age=20 + idx % 30, Salary=1000 + idx + (idx % 100 == 7))
+        for idx in range(10, 1005)
+    )
+    new.update_row(new.where(Name='E500').row_list[0], Age=99)
+    # InsertDt 每行都不同，只比较年龄和工资
+    diff = old.diff(new, key=['Name'], col_names=['Age', 'Salary'])
+    print(diff.get_summary())
+    assert diff.get_summary() == {'added': 5, 'removed': 10, 'changed': 10}
+    assert sorted(row.Name for row in diff.removed) == sorted(f'E{idx}' for idx in range(10))
+    assert [row.Name for row in diff.added] == [f'E{idx}' for idx in range(1000, 1005)]
+    changed = {changed_row.new.Name: changed_row.col_names for changed_row in diff.changed}
+    assert changed['E507'] == ('Salary',) and changed['E500'] == ('Age',)
+    assert diff.get_changed_col_names() == ['Age', 'Salary'] and len(diff) == 25
+    assert not old.diff(old.where(), key=['Name'])
+
+    # NaN 与 NaN 不算变化
+    nan_old, nan_new = TableExample(), TableExample()
+    nan_old.insert_rows([RowExample(ColInt=1, ColStr=float('nan')), RowExample(ColInt=2, ColStr=float('nan'))])
+    nan_new.insert_rows([RowExample(ColInt=1, ColStr=float('nan')), RowExample(ColInt=2, ColStr=0.5)])
+    nan_diff = nan_old.diff(nan_new, key=['ColInt'], col_names=['ColStr'])
+    assert [(changed_row.new.ColInt, changed_row.col_names) for changed_row in nan_diff.changed] == [(2, ('ColStr',))]
+
+    # 差异表的单元格与原表一样按 max_width 截断，变化前后的值都保留
+    @dataclass
+    class RowNoteExample(BaseRow):
+        Id: int = 0
+        Note: str = ''
+        __Note_config: ClassVar[ColumnConfig] = ColumnConfig(max_width=12)
+
+    note_old, note_new = [type('TableNoteExample', (BaseTable,), {'row_type': RowNoteExample})() for _ in range(2)]
+    note_old.insert_rows([RowNoteExample(Id=1, Note='a' * 30), RowNoteExample(Id=2, Note='c' * 30)])
+    note_new.insert_rows([RowNoteExample(Id=1, Note='b' * 30), RowNoteExample(Id=3, Note='d' * 30)])
+    note_lines = list(note_old.diff(note_new, key=['Id']).iter_table_lines(caps=TerminalCapabilities()))
+    print(*note_lines, sep='\n')
+    note_cells = [line.split(BaseTable.CHAR_COL_SEP)[2].strip() for line in note_lines[2:]]
+    assert note_cells == ['aaa… -> bbb…', 'c' * 11 + '…', 'd' * 11 + '…']
+    assert max(map(get_display_ansi_width, note_cells)) == note_new.get_col_disp_len_map()['Note'] == 12
+
+    # 只输出变化的行，无颜色时与文本一致
+    lines = list(diff.iter_table_lines(caps=TerminalCapabilities()))
+    assert len(lines) == 2 + len(diff)
+    assert len({get_display_ansi_width(line) for line in lines}) == 1
+    line_e500 = next(line for line in lines if ' E500 ' in line)
+    assert '~' in line_e500 and '40 -> 99' in line_e500 and '1500 -> ' not in line_e500
+    assert lines[2].split(BaseTable.CHAR_COL_SEP)[1].strip() == 'E0'
+    color_caps = TerminalCapabilities(color_depth=table_printer.COLOR_DEPTH_256)
+    color_lines = list(diff.iter_table_lines(caps=color_caps))
+    assert diff.FMT_CHANGED.apply_format(' 40 -> 99 ') in next(line for line in color_lines if ' E500 ' in line)
+    assert all(diff.FMT_REMOVED.apply_format('  -   ') in line for line in color_lines[2:] if ' - ' in line)
+    sink = io.BytesIO()
+    diff.write_table(sink, caps=TerminalCapabilities())
+    assert sink.getvalue().decode('utf-8') == ''.join(line + BaseTable.CHAR_LN for line in lines)
+    diff.print_table()
+
+    # key 必须存在且唯一，两个表的 row_type 相同
+    old.insert_row(RowEmployeeExample(Name='E1'))
+    for kwargs, error in [
+        ({'key': ['Name']}, ValueError), ({'key': []}, ValueError), ({'key': ['NotACol']}, ValueError),
+        ({'key': ['Name'], 'col_names': ['NotACol']}, ValueError),
+    ]:
+        try:
+            old.diff(new, **kwargs)
+        except error as e:
+            print(f'expected error: {e}')
+        else:
+            raise AssertionError(f'{error} expected for {kwargs}')
+    try:
+        new.diff(TableExample(), key=['Name'])
+    except TypeError:
+        pass
+    else:
+        raise AssertionError('TypeError expected')
+    print()
+
+
 def test_table_printer():
     print('test_table_printer START', '=' * 50)
 
@@ -300,8 +1339,32 @@ def test_table_printer():
     test_table_with_order()
     test_table_with_customized_row_separator()
     test_table_with_conditional_formatting()
+    test_table_with_conditional_formatting_rules()
     test_table_with_href()
     test_override_logger_handler()
+    test_table_write_table()
+    test_table_write_table_workers()
+    test_table_export()
+    test_table_update_row()
+    test_display_width()
+    test_columnar_table()
+    test_table_bulk_insert()
+    test_table_sort_index()
+    test_table_window()
+    test_table_delete_row()
+    test_live_table()
+    test_line_renderer()
+    test_sqlite_table()
+    test_sqlite_table_types()
+    test_table_where_select()
+    test_table_aggregation()
+    test_table_max_width_auto_fit()
+    test_table_stats()
+    test_table_terminal_capabilities()
+    test_table_compact_rows()
+    test_table_async()
+    test_table_concurrent_insert()
+    test_table_diff()
 
 
 if __name__ == '__main__':
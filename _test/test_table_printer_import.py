@@ -0,0 +1,72 @@
+import compileall
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+PROJ_PATH = str(Path(__file__).resolve().parent.parent)
+if PROJ_PATH not in sys.path:
+    sys.path.insert(0, PROJ_PATH)
+
+# import TablePrinter.table_printer 的累计耗时上限 (ms)，较慢的机器可以用环境变量放宽
+IMPORT_TIME_BUDGET_MS = float(os.environ.get('TABLE_PRINTER_IMPORT_BUDGET_MS', 60))
+# 只在使用时才加载的模块
+LAZY_MODULES = [
+    'logging', 'multiprocessing', 'concurrent.futures', 'pickle', 'shutil',
+    'ColorHelper.color_xterm_256', 'TablePrinter.table_printer_consts',
+]
+
+
+def _import_time(module: str) -> dict:
+    """ return {module: cumulative us} of the modules loaded by importing module, from python -X importtime """
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=PROJ_PATH, capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_table_printer_import_time():
+    print('test import TablePrinter.table_printer loads nothing heavy until it is used')
+    # 先编译好 .pyc，计时不包含编译源码的时间
+    compileall.compile_dir(str(Path(PROJ_PATH, 'TablePrinter')), quiet=1)
+    runs = [_import_time('TablePrinter.table_printer') for _ in range(3)]
+    import_ms = min(times['TablePrinter.table_printer'] for times in runs) / 1000
+    print(f'import TablePrinter.table_printer: {import_ms:.1f}ms, budget {IMPORT_TIME_BUDGET_MS:.0f}ms')
+    loaded = [module for module in LAZY_MODULES if module in runs[0]]
+    assert not loaded, f'imported eagerly: {loaded}'
+    assert import_ms < IMPORT_TIME_BUDGET_MS
+
+
+def test_table_printer_lazy_attributes():
+    print('test lazily created module attributes')
+    import logging
+
+    from ColorHelper.color_xterm_256 import ColorXTerm256
+    from TablePrinter import table_printer
+    from TablePrinter.table_printer_consts import BoxDrawingChar
+
+    assert table_printer.ColorXTerm256 is ColorXTerm256
+    assert table_printer.BoxDrawingChar is BoxDrawingChar
+    assert table_printer.logger is logging.getLogger('TablePrinter.table_printer')
+    assert table_printer.COND_FMT_DEFAULT == table_printer.ConditionalFormat()
+    assert table_printer.FontFormat() == table_printer.FontFormat(ColorXTerm256.WHITE, ColorXTerm256.BLACK)
+    assert table_printer.BaseTable.CHAR_COL_SEP == BoxDrawingChar.LIGHT_VERTICAL
+    assert table_printer.BaseTable.CHAR_HEADER_V_SEP == BoxDrawingChar.VERTICAL_SINGLE_AND_HORIZONTAL_DOUBLE
+    try:
+        table_printer.NOT_DEFINED
+    except AttributeError:
+        pass
+    else:
+        raise AssertionError('AttributeError expected')
+
+
+if __name__ == '__main__':
+    test_table_printer_import_time()
+    test_table_printer_lazy_attributes()